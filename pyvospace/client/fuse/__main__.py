@@ -88,9 +88,13 @@ class VOSpaceFS(Operations):
                 link = 1
                 mode = 0o644 | stat.S_IFREG
 
-            a = {'st_atime': float(mtime.value), 'st_ctime': float(ctime.value),
+            # the root of the space has no times
+            ctime = float(ctime.value) if ctime else 0.0
+            mtime = float(mtime.value) if mtime else 0.0
+
+            a = {'st_atime': mtime, 'st_ctime': ctime,
                  'st_gid': self.gid, 'st_mode': mode,
-                 'st_mtime': float(mtime.value), 'st_nlink': link,
+                 'st_mtime': mtime, 'st_nlink': link,
                  'st_size': int(length.value), 'st_uid': self.uid}
             return a
         except FuseOSError:
@@ -188,16 +192,21 @@ class VOSpaceFS(Operations):
             with self.session.post(url, data='PHASE=RUN') as r:
                 r.raise_for_status()
 
+            # the server holds each request until the phase changes, up to WAIT seconds
             poll_until = ('COMPLETED', 'ERROR')
+            phase = None
             while True:
-                with self.session.get(url) as r:
+                with self.session.get(url, params={'WAIT': 60}) as r:
                     r.raise_for_status()
                     result = r.text
                 if result in poll_until:
                     if result == 'ERROR':
                         raise FuseOSError(errno.EACCES)
                     break
-                time.sleep(0.05)
+                if result == phase:
+                    # the phase did not change, the server may not wait
+                    time.sleep(0.05)
+                phase = result
         except FuseOSError:
             raise
         except:
@@ -20,11 +20,14 @@
 #    MA 02111-1307  USA
 
 import os
+import re
 import uuid
 import copy
+import functools
 import lxml.etree as ET
 
 from urllib.parse import urlparse
+from types import MappingProxyType
 from collections import namedtuple, OrderedDict
 
 from .exception import *
@@ -53,7 +56,63 @@ NodeTextLookup = {0: 'vos:Node',
 
 NodeType = Node_Type(0, 1, 2, 3, 4, 5)
 
+_slot_names_cache = {}
 
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+_XML_TEXT_SPECIAL = re.compile('[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f]')
+_XML_ATTR_SPECIAL = re.compile('[&<>"\n\r\t\x00-\x08\x0b\x0c\x0e-\x1f]')
+_XML_TEXT = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+_XML_ATTR = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                           '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'})
+
+
+def _xml_escape(value, table):
+    # escaped as lxml serialises with its default ascii encoding
+    if _XML_INVALID.search(value):
+        # surrogates fail to encode as they do in lxml
+        value.encode('utf-8')
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+    value = value.translate(table)
+    if value.isascii():
+        return value
+    return value.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+
+def _xml_text(value):
+    if value.isascii() and not _XML_TEXT_SPECIAL.search(value):
+        return value
+    return _xml_escape(value, _XML_TEXT)
+
+
+def _xml_attr(value):
+    if value.isascii() and not _XML_ATTR_SPECIAL.search(value):
+        return value
+    return _xml_escape(value, _XML_ATTR)
+
+
+def _xml_element(start, content, tag):
+    """
+    :param start: start tag without its closing bracket.
+    :param content: list of strings inside the element.
+    :param tag: tag of the element.
+    """
+    if not content:
+        return f'{start}/>'
+    return f"{start}>{''.join(content)}</{tag}>"
+
+
+def _slot_names(cls):
+    names = _slot_names_cache.get(cls)
+    if names is None:
+        names = tuple(name for klass in reversed(cls.__mro__)
+                      for name in klass.__dict__.get('__slots__', ())
+                      if name not in ('__dict__', '__weakref__'))
+        _slot_names_cache[cls] = names
+    return names
+
+
+# the same few uris are validated for every property of every node
+@functools.lru_cache(maxsize=1024)
 def validate_property_uri(uri):
     if not uri:
         raise InvalidArgument('uri empty')
@@ -78,6 +137,8 @@ class Parameter(object):
 
     e.g. ivo://ivoa.net/vospace/core#length value: 1024
     """
+    __slots__ = ('_uri', '_name', 'value')
+
     def __init__(self, uri, value):
         self.uri = uri
         self.value = value
@@ -100,7 +161,7 @@ class Parameter(object):
     def uri(self, value):
         parsed = validate_property_uri(value)
         self._name = parsed.fragment
-        self._uri = copy.deepcopy(value)
+        self._uri = value
 
     def tolist(self):
         return [self.uri, self.value]
@@ -121,6 +182,8 @@ class Property(object):
 
     e.g. uri: ivo://ivoa.net/vospace/core#length value: 1024
     """
+    __slots__ = ('_uri', '_name', 'value', 'read_only', '_persist')
+
     def __init__(self, uri, value, read_only=True, persist=True):
         self.uri = uri
         self.value = value
@@ -135,6 +198,16 @@ class Property(object):
                self.value == other.value and \
                self.read_only == other.read_only
 
+    def __copy__(self):
+        # the uri was validated when the property was created
+        prop = object.__new__(type(self))
+        for name in _slot_names(type(self)):
+            setattr(prop, name, getattr(self, name))
+        return prop
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
     @property
     def persist(self):
         return self._persist
@@ -157,7 +230,7 @@ class Property(object):
     def uri(self, value):
         parsed = validate_property_uri(value)
         self._name = parsed.fragment
-        self._uri = copy.deepcopy(value)
+        self._uri = value
 
     def tolist(self):
         return [self.uri, self.value, self.read_only]
@@ -170,6 +243,8 @@ class Property(object):
 
 
 class DeleteProperty(Property):
+    __slots__ = ()
+
     def __init__(self, uri):
         super().__init__(uri, None, False)
 
@@ -249,7 +324,7 @@ class Protocol(object):
     def uri(self, value):
         parsed = validate_property_uri(value)
         self._name = parsed.fragment
-        self._uri = copy.deepcopy(value)
+        self._uri = value
 
     @classmethod
     def create_protocol(cls, uri, security_method_uri=None):
@@ -478,6 +553,8 @@ class View(object):
     e.g. Using ivo://ivoa.net/vospace/core#tar
     on a container node will tell the space the user wants a tar for that nodes tree.
     """
+    __slots__ = ('_uri', '_name')
+
     def __init__(self, uri):
         self.uri = uri
 
@@ -489,7 +566,7 @@ class View(object):
     def uri(self, value):
         parsed = validate_property_uri(value)
         self._name = parsed.fragment
-        self._uri = copy.deepcopy(value)
+        self._uri = value
 
     @property
     def name(self):
@@ -514,21 +591,34 @@ class Node(object):
     :param owner: Server side only property.
     :param group_read: Server side only property.
     :param group_write: Server side only property.
-    :param id: Server side only property.
+    :param id: Server side only property, a uuid is generated the first time it is read if not given.
+
+    Copies of a node are copy-on-write, the copy shares the properties, groups, views and children
+    of the node until either of them is changed. The properties, groups and views are read as
+    read-only views, change them through the setters and the add and remove methods. Children read
+    through ``nodes`` are shared with the copies of a container, change them through the container.
     """
+    __slots__ = ('_path', 'name', 'dirname', '_properties', 'capabilities', '_id', '_owner',
+                 '_group_read', '_group_write', 'path_modified', 'size', 'storage', '_shared')
 
     NS = {'vos': 'http://www.ivoa.net/xml/VOSpace/v2.1',
           'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
           'xs': 'http://www.w3.org/2001/XMLSchema-instance'}
 
+    # namespace declarations of a document root, as written by lxml
+    XMLNS = ''.join(f' xmlns:{prefix}="{uri}"' for prefix, uri in NS.items())
+
     SPACE = 'icrar.org'
 
+    _properties_xpath = ET.XPath('/vos:node/vos:properties/vos:property', namespaces=NS)
+
     def __init__(self, path, properties=None, capabilities=None,
                  owner=None, group_read=None, group_write=None, id=None):
         self._path = Node.uri_to_path(path)
         self.name = os.path.basename(self._path)
         self.dirname = os.path.dirname(self._path)
 
+        self._shared = False
         self._properties = {}
         self.set_properties(properties)
         self.capabilities = capabilities
@@ -537,8 +627,6 @@ class Node(object):
         # Server side properties
         # =======================
         self._id = id
-        if self._id is None:
-            self._id = uuid.uuid4()
         self.owner = owner
         self.group_read = group_read
         self.group_write = group_write
@@ -558,7 +646,36 @@ class Node(object):
     def __eq__(self, other):
         if not isinstance(other, Node):
             return False
-        return self.path == other.path and self.properties == other.properties
+        return self.path == other.path and self._properties == other._properties
+
+    def __copy__(self):
+        if self._id is None:
+            # the copy is the same node, it has to have the same id
+            self._id = uuid.uuid4()
+        node = object.__new__(type(self))
+        for name in _slot_names(type(self)):
+            setattr(node, name, getattr(self, name))
+        if hasattr(self, '__dict__'):
+            node.__dict__.update(self.__dict__)
+        self._shared = node._shared = True
+        return node
+
+    def __deepcopy__(self, memo):
+        # copy-on-write, nothing is copied until the node or the copy is changed
+        return self.__copy__()
+
+    def _own(self):
+        """
+        Copy what the node shares with its copies before it is changed.
+        """
+        if self._shared:
+            self._shared = False
+            self._copy_shared()
+
+    def _copy_shared(self):
+        self._properties = {uri: copy.copy(prop) for uri, prop in self._properties.items()}
+        self._group_read = list(self._group_read)
+        self._group_write = list(self._group_write)
 
     @classmethod
     def walk(cls, node):
@@ -573,6 +690,8 @@ class Node(object):
 
     @property
     def id(self):
+        if self._id is None:
+            self._id = uuid.uuid4()
         return self._id
 
     @id.setter
@@ -589,35 +708,35 @@ class Node(object):
 
     @property
     def group_read(self):
-        return self._group_read
+        return tuple(self._group_read)
 
     @group_read.setter
     def group_read(self, value):
         if value is None:
             self._group_read = []
             return
-        if not isinstance(value, list):
+        if not isinstance(value, (list, tuple)):
             raise InvalidArgument('invalid list')
         for val in value:
             if not isinstance(val, str):
                 raise InvalidArgument('invalid string')
-        self._group_read = copy.deepcopy(value)
+        self._group_read = list(value)
 
     @property
     def group_write(self):
-        return self._group_write
+        return tuple(self._group_write)
 
     @group_write.setter
     def group_write(self, value):
         if value is None:
             self._group_write = []
             return
-        if not isinstance(value, list):
+        if not isinstance(value, (list, tuple)):
             raise InvalidArgument('invalid list')
         for val in value:
             if not isinstance(val, str):
                 raise InvalidArgument('invalid string')
-        self._group_write = copy.deepcopy(value)
+        self._group_write = list(value)
 
     @classmethod
     def uri_to_path(cls, uri):
@@ -646,7 +765,11 @@ class Node(object):
         return 'vos:Node'
 
     def build_node(self, root):
-        for node_property in root.xpath('/vos:node/vos:properties/vos:property', namespaces=Node.NS):
+        self._build_properties(Node._properties_xpath(root))
+
+    def _build_properties(self, property_elements):
+        self._own()
+        for node_property in property_elements:
             prop_uri = node_property.attrib.get('uri', None)
             if prop_uri is None:
                 raise InvalidXML("vos:property URI does not exist.")
@@ -699,7 +822,7 @@ class Node(object):
 
     @property
     def properties(self):
-        return self._properties
+        return MappingProxyType(self._properties)
 
     def remove_properties(self):
         self._properties = {}
@@ -709,31 +832,51 @@ class Node(object):
             return
         if not isinstance(property_list, list):
             raise InvalidArgument('invalid list')
+        self._own()
         for prop in property_list:
             if not isinstance(prop, Property):
                 raise InvalidArgument('invalid Property')
-            self._properties[prop.uri] = copy.deepcopy(prop)
+            self._properties[prop.uri] = copy.copy(prop)
 
     def add_property(self, value):
         if not isinstance(value, Property):
             raise InvalidArgument('invalid Property')
-        self._properties[value.uri] = copy.deepcopy(value)
+        self._own()
+        self._properties[value.uri] = copy.copy(value)
 
     def remove_property(self, uri_key):
+        self._own()
         return self._properties.pop(uri_key)
 
     def to_uri(self):
         return f"vos://{Node.SPACE}!vospace/{self.path}"
 
     def tostring(self):
-        root = self.toxml()
-        return ET.tostring(root).decode("utf-8")
+        content = []
+        self._properties_tostring(content)
+        return _xml_element(self._start_tag(), content, 'vos:node')
+
+    def _start_tag(self):
+        return f'<vos:node{Node.XMLNS} xsi:type="{self.node_type_text()}" uri="{_xml_attr(self.to_uri())}"'
+
+    def _properties_tostring(self, content):
+        if self._properties:
+            content.append('<vos:properties>')
+            for prop in self._properties.values():
+                nil = ' xsi:nil="true"' if isinstance(prop, DeleteProperty) else ''
+                content.append(f'<vos:property uri="{_xml_attr(prop.uri)}" '
+                               f'readOnly="{_xml_attr(str(prop.read_only).lower())}"{nil}>'
+                               f'{_xml_text(str(prop.value))}</vos:property>')
+            content.append('</vos:properties>')
 
     def toxml(self):
         root = ET.Element("{http://www.ivoa.net/xml/VOSpace/v2.1}node", nsmap=Node.NS)
         root.set("{http://www.w3.org/2001/XMLSchema-instance}type", self.node_type_text())
         root.set("uri", self.to_uri())
+        self._properties_toxml(root)
+        return root
 
+    def _properties_toxml(self, root):
         if self._properties:
             properties = ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}properties")
             for prop in self._properties.values():
@@ -743,7 +886,6 @@ class Node(object):
                 property_element.text = str(prop.value)
                 if isinstance(prop, DeleteProperty):
                     property_element.set('{http://www.w3.org/2001/XMLSchema-instance}nil', 'true')
-        return root
 
 
 class LinkNode(Node):
@@ -758,6 +900,8 @@ class LinkNode(Node):
     :param group_write: server side only property.
     :param id: server side only property.
     """
+    __slots__ = ('node_uri_target',)
+
     def __init__(self, path, uri_target, properties=None, capabilities=None,
                  owner=None, group_read=None, group_write=None, id=None):
         super().__init__(path=path, properties=properties, capabilities=capabilities,
@@ -794,9 +938,13 @@ class LinkNode(Node):
         self.node_uri_target = target.text
 
     def tostring(self):
-        root = super().toxml()
-        ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}target").text = self.node_uri_target
-        return ET.tostring(root).decode("utf-8")
+        content = []
+        self._properties_tostring(content)
+        if self.node_uri_target is None:
+            content.append('<vos:target/>')
+        else:
+            content.append(f'<vos:target>{_xml_text(self.node_uri_target)}</vos:target>')
+        return _xml_element(self._start_tag(), content, 'vos:node')
 
 
 class DataNode(Node):
@@ -814,6 +962,11 @@ class DataNode(Node):
     :param group_write: server side only property.
     :param id: server side only property.
     """
+    __slots__ = ('_accepts', '_provides', '_busy')
+
+    _accepts_xpath = ET.XPath('/vos:node/vos:accepts/vos:view', namespaces=Node.NS)
+    _provides_xpath = ET.XPath('/vos:node/vos:provides/vos:view', namespaces=Node.NS)
+
     def __init__(self, path, properties=None, capabilities=None,
                  accepts=None, provides=None, busy=False,
                  owner=None, group_read=None, group_write=None, id=None):
@@ -830,6 +983,11 @@ class DataNode(Node):
             return False
         return super().__eq__(other)
 
+    def _copy_shared(self):
+        super()._copy_shared()
+        self._accepts = list(self._accepts)
+        self._provides = list(self._provides)
+
     @property
     def node_type(self):
         return NodeType.DataNode
@@ -839,13 +997,14 @@ class DataNode(Node):
 
     def build_node(self, root):
         super().build_node(root)
-        for view in root.xpath('/vos:node/vos:accepts/vos:view', namespaces=Node.NS):
+        self._own()
+        for view in DataNode._accepts_xpath(root):
             view_uri = view.attrib.get('uri', None)
             if view_uri is None:
                 raise InvalidXML("Accepts URI does not exist.")
             self._accepts.append(View(view_uri))
 
-        for view in root.xpath('/vos:node/vos:provides/vos:view', namespaces=Node.NS):
+        for view in DataNode._provides_xpath(root):
             view_uri = view.attrib.get('uri', None)
             if view_uri is None:
                 raise InvalidXML("Provides URI does not exist.")
@@ -857,60 +1016,61 @@ class DataNode(Node):
 
     @property
     def accepts(self):
-        return self._accepts
+        return tuple(self._accepts)
 
     @accepts.setter
     def accepts(self, value):
         if value is None:
             self._accepts = []
             return
-        if not isinstance(value, list):
+        if not isinstance(value, (list, tuple)):
             raise InvalidArgument('invalid list')
         for val in value:
             if not isinstance(val, View):
                 raise InvalidArgument('invalid View')
-        self._accepts = copy.deepcopy(value)
+        self._accepts = list(value)
 
     def add_accepts_view(self, value):
         if not isinstance(value, View):
             raise InvalidArgument('invalid View')
+        self._own()
         self._accepts.append(value)
 
     @property
     def provides(self):
-        return self._provides
+        return tuple(self._provides)
 
     @provides.setter
     def provides(self, value):
         if value is None:
             self._provides = []
             return
-        if not isinstance(value, list):
+        if not isinstance(value, (list, tuple)):
             raise InvalidArgument('invalid list')
         for val in value:
             if not isinstance(val, View):
                 raise InvalidArgument('invalid View')
-        self._provides = copy.deepcopy(value)
+        self._provides = list(value)
 
     def add_provides_view(self, value):
         if not isinstance(value, View):
             raise InvalidArgument('invalid View')
+        self._own()
         self._provides.append(value)
 
     def tostring(self):
-        root = super().toxml()
-        root.set("busy", str(self.busy).lower())
-        if self.accepts:
-            accepts_elem = ET.SubElement(root, '{http://www.ivoa.net/xml/VOSpace/v2.1}accepts')
-            for view in self.accepts:
-                view_element = ET.SubElement(accepts_elem, '{http://www.ivoa.net/xml/VOSpace/v2.1}view')
-                view_element.set('uri', view.uri)
-        if self.provides:
-            accepts_elem = ET.SubElement(root, '{http://www.ivoa.net/xml/VOSpace/v2.1}provides')
-            for view in self.provides:
-                view_element = ET.SubElement(accepts_elem, '{http://www.ivoa.net/xml/VOSpace/v2.1}view')
-                view_element.set('uri', view.uri)
-        return ET.tostring(root).decode("utf-8")
+        content = []
+        self._properties_tostring(content)
+        if self._accepts:
+            content.append('<vos:accepts>')
+            content.extend(f'<vos:view uri="{_xml_attr(view.uri)}"/>' for view in self._accepts)
+            content.append('</vos:accepts>')
+        if self._provides:
+            content.append('<vos:provides>')
+            content.extend(f'<vos:view uri="{_xml_attr(view.uri)}"/>' for view in self._provides)
+            content.append('</vos:provides>')
+        start = f'{self._start_tag()} busy="{_xml_attr(str(self.busy).lower())}"'
+        return _xml_element(start, content, 'vos:node')
 
 
 class ContainerNode(DataNode):
@@ -930,6 +1090,11 @@ class ContainerNode(DataNode):
     :param group_write: server side only property.
     :param id: server side only property.
     """
+    __slots__ = ('_nodes',)
+
+    _nodes_xpath = ET.XPath('/vos:node/vos:nodes/vos:node', namespaces=Node.NS)
+    _child_properties_xpath = ET.XPath('vos:properties/vos:property', namespaces=Node.NS)
+
     def __init__(self, path, nodes=None, properties=None, capabilities=None,
                  accepts=None, provides=None, busy=False, owner=None,
                  group_read=None, group_write=None, id=None):
@@ -944,6 +1109,10 @@ class ContainerNode(DataNode):
             return False
         return super().__eq__(other) and self._nodes == other._nodes
 
+    def _copy_shared(self):
+        super()._copy_shared()
+        self._nodes = OrderedDict((name, copy.copy(node)) for name, node in self._nodes.items())
+
     @property
     def nodes(self):
         return list(self._nodes.values())
@@ -957,7 +1126,7 @@ class ContainerNode(DataNode):
 
     def build_node(self, root):
         super().build_node(root)
-        for nodes in root.xpath('/vos:node/vos:nodes/vos:node', namespaces=Node.NS):
+        for nodes in ContainerNode._nodes_xpath(root):
             node_uri = nodes.attrib.get('uri', None)
             node_type = nodes.attrib.get('{http://www.w3.org/2001/XMLSchema-instance}type', None)
             node_busy = root.attrib.get('busy', 'false')
@@ -966,7 +1135,8 @@ class ContainerNode(DataNode):
             else:
                 node_busy = False
             node = Node.create_node(node_uri, node_type, node_busy)
-            self.add_node(node)
+            node._build_properties(ContainerNode._child_properties_xpath(nodes))
+            self.attach_node(node)
 
     def check_path(self, child):
         if not isinstance(child, Node):
@@ -985,6 +1155,7 @@ class ContainerNode(DataNode):
             self.add_node(node)
 
     def _insert_node_into_tree(self, parent_node, path_split, node_to_insert, overwrite):
+        parent_node._own()
         while path_split:
             name = path_split.pop(0)
             node = parent_node._nodes.get(name)
@@ -1024,16 +1195,61 @@ class ContainerNode(DataNode):
         if not overwrite:
             if self._nodes.get(node.name):
                 raise InvalidArgument(f'duplicate node {node.path}')
-        self._nodes[node.name] = copy.deepcopy(node)
+        self._own()
+        self._nodes[node.name] = copy.copy(node)
+
+    def attach_node(self, node):
+        """
+        Add a child node without copying it, the node is then owned by this container.
+        Used to assemble large trees where copying every node is too costly.
+
+        :param node: :func:`Node <pyvospace.core.model.Node>` whose parent is this container.
+        """
+        self.check_path(node)
+        self._own()
+        self._nodes[node.name] = node
+
+    @classmethod
+    def _child_tostring(cls, content, node):
+        start = f'<vos:node uri="{_xml_attr(node.to_uri())}" xsi:type="{node.node_type_text()}"'
+        child = []
+        node._properties_tostring(child)
+        content.append(_xml_element(start, child, 'vos:node'))
 
     def tostring(self):
-        root = super().toxml()
-        nodes_element = ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}nodes")
-        for node in self.nodes:
-            node_element = ET.SubElement(nodes_element, '{http://www.ivoa.net/xml/VOSpace/v2.1}node')
-            node_element.set('uri', node.to_uri())
-            node_element.set("{http://www.w3.org/2001/XMLSchema-instance}type", node.node_type_text())
-        return ET.tostring(root).decode("utf-8")
+        content = []
+        self._properties_tostring(content)
+        nodes = []
+        for node in self._nodes.values():
+            ContainerNode._child_tostring(nodes, node)
+        content.append(_xml_element('<vos:nodes', nodes, 'vos:nodes'))
+        return _xml_element(self._start_tag(), content, 'vos:node')
+
+    def tostring_parts(self):
+        """
+        Serialise the node around its children so the children can be written separately.
+
+        For a node with children, head + :func:`nodes_tostring <pyvospace.core.model.ContainerNode.nodes_tostring>`
+        + tail is the same document as :func:`tostring <pyvospace.core.model.ContainerNode.tostring>`.
+
+        :return: tuple(head, tail)
+        """
+        content = []
+        self._properties_tostring(content)
+        return f"{self._start_tag()}>{''.join(content)}<vos:nodes>", '</vos:nodes></vos:node>'
+
+    @classmethod
+    def nodes_tostring(cls, nodes):
+        """
+        Serialise a list of child nodes as they appear inside vos:nodes.
+
+        :param nodes: list of :func:`Node <pyvospace.core.model.Node>`
+        :return: string
+        """
+        content = []
+        for node in nodes:
+            ContainerNode._child_tostring(content, node)
+        return ''.join(content)
 
 
 class UnstructuredDataNode(DataNode):
@@ -1051,6 +1267,8 @@ class UnstructuredDataNode(DataNode):
     :param group_write: server side only property.
     :param id: server side only property.
     """
+    __slots__ = ()
+
     def __init__(self, path, properties=None, capabilities=None, accepts=None, provides=None, busy=False,
                  owner=None, group_read=None, group_write=None, id=None):
         super().__init__(path=path, properties=properties, capabilities=capabilities,
@@ -1088,6 +1306,8 @@ class StructuredDataNode(DataNode):
     :param group_write: server side only property.
     :param id: server side only property.
     """
+    __slots__ = ()
+
     def __init__(self, path, properties=None, capabilities=None,
                  accepts=None, provides=None, busy=False, owner=None,
                  group_read=None, group_write=None, id=None):
@@ -1115,6 +1335,10 @@ class Transfer(object):
     """
     Base class for a VOSpace Transfer request.
     """
+    _target_xpath = ET.XPath('/vos:transfer/vos:target', namespaces=Node.NS)
+    _direction_xpath = ET.XPath('/vos:transfer/vos:direction', namespaces=Node.NS)
+    _keep_bytes_xpath = ET.XPath('/vos:transfer/vos:keepBytes', namespaces=Node.NS)
+
     def __init__(self, target, direction):
         self.target = target
         self._direction = direction
@@ -1152,8 +1376,50 @@ class Transfer(object):
         return {}
 
     def tostring(self):
-        root = self.toxml()
-        return ET.tostring(root).decode("utf-8")
+        content = []
+        self._content_tostring(content)
+        return f"<vos:transfer{Node.XMLNS}>{''.join(content)}</vos:transfer>"
+
+    @classmethod
+    def _node_tostring(cls, node):
+        if isinstance(node, ContainerNode):
+            return _xml_text(f"{node.path}/")
+        return _xml_text(str(node))
+
+    def _content_tostring(self, content):
+        content.append(f'<vos:target>{Transfer._node_tostring(self.target)}</vos:target>'
+                       f'<vos:direction>{Transfer._node_tostring(self.direction)}</vos:direction>')
+
+    @classmethod
+    def _node_tojson(cls, node):
+        if isinstance(node, ContainerNode):
+            return f"{node.path}/"
+        return str(node)
+
+    def todict(self):
+        """
+        The transfer as a dict of JSON types, read back by :func:`fromdict <pyvospace.core.model.Transfer.fromdict>`.
+
+        :return: dict
+        """
+        return {'target': Transfer._node_tojson(self.target),
+                'direction': Transfer._node_tojson(self.direction)}
+
+    @classmethod
+    def fromdict(cls, value):
+        """
+        Create a transfer from the dict written by :func:`todict <pyvospace.core.model.Transfer.todict>`.
+
+        :param value: dict
+        :return: :func:`Transfer <pyvospace.core.model.Transfer>`
+        """
+        transfer = Transfer.create_transfer(value.get('target'), value.get('direction'),
+                                            value.get('keepBytes', False))
+        transfer.build_dict(value)
+        return transfer
+
+    def build_dict(self, value):
+        pass
 
     @classmethod
     def create_transfer(cls, target, direction, keep_bytes):
@@ -1195,13 +1461,13 @@ class Transfer(object):
 
     @classmethod
     def fromroot(cls, root):
-        target = root.xpath('/vos:transfer/vos:target', namespaces=Node.NS)
+        target = Transfer._target_xpath(root)
         if not target:
             raise InvalidXML('vos:target not found')
-        direction = root.xpath('/vos:transfer/vos:direction', namespaces=Node.NS)
+        direction = Transfer._direction_xpath(root)
         if not direction:
             raise InvalidXML('vos:direction not found')
-        keep_bytes = root.xpath('/vos:transfer/vos:keepBytes', namespaces=Node.NS)
+        keep_bytes = Transfer._keep_bytes_xpath(root)
         if keep_bytes:
             if keep_bytes[0].text == 'false':
                 keep_bytes = False
@@ -1234,15 +1500,17 @@ class NodeTransfer(Transfer):
     def keep_bytes(self):
         return self._keep_bytes
 
-    def tostring(self):
-        root = super().toxml()
+    def _content_tostring(self, content):
+        super()._content_tostring(content)
         keep_bytes_str = 'false'
         if self.keep_bytes:
             keep_bytes_str = 'true'
+        content.append(f'<vos:keepBytes>{keep_bytes_str}</vos:keepBytes>')
 
-        keep_bytes = ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}keepBytes")
-        keep_bytes.text = keep_bytes_str
-        return ET.tostring(root).decode("utf-8")
+    def todict(self):
+        value = super().todict()
+        value['keepBytes'] = bool(self.keep_bytes)
+        return value
 
 
 class Copy(NodeTransfer):
@@ -1287,6 +1555,12 @@ class ProtocolTransfer(Transfer):
     :param view: :func:`View <pyvospace.core.model.View>`
     :param params: list of :func:`Parameter <pyvospace.core.model.Parameter>`
     """
+    _view_xpath = ET.XPath('/vos:transfer/vos:view', namespaces=Node.NS)
+    _protocols_xpath = ET.XPath('/vos:transfer/vos:protocol', namespaces=Node.NS)
+    _security_method_xpath = ET.XPath('vos:securityMethod', namespaces=Node.NS)
+    _endpoint_xpath = ET.XPath('vos:endpoint', namespaces=Node.NS)
+    _params_xpath = ET.XPath('/vos:transfer/vos:param', namespaces=Node.NS)
+
     def __init__(self, target, direction, protocols=None, view=None, params=None):
         super().__init__(target=target, direction=direction)
         self._protocols = []
@@ -1348,39 +1622,57 @@ class ProtocolTransfer(Transfer):
                 params["REQUEST"] = "redirect"
         return params
 
-    def tostring(self):
-        root = super().toxml()
+    def _content_tostring(self, content):
+        super()._content_tostring(content)
         if self.view:
-            view_elem = ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}view")
-            view_elem.set('uri', str(self.view))
+            content.append(f'<vos:view uri="{_xml_attr(str(self.view))}"/>')
         for protocol in self._protocols:
-            protocol_elem = ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}protocol")
-            protocol_elem.set('uri', str(protocol))
+            protocol_content = []
             if protocol.endpoint:
-                endpoint_tag = ET.SubElement(protocol_elem, "{http://www.ivoa.net/xml/VOSpace/v2.1}endpoint")
-                endpoint_tag.text = str(protocol.endpoint)
+                protocol_content.append(f'<vos:endpoint>{_xml_text(str(protocol.endpoint))}</vos:endpoint>')
             if protocol.security_method:
-                security_tag = ET.SubElement(protocol_elem, "{http://www.ivoa.net/xml/VOSpace/v2.1}securityMethod")
-                security_tag.set('uri', str(protocol.security_method))
+                protocol_content.append(f'<vos:securityMethod uri="{_xml_attr(str(protocol.security_method))}"/>')
+            content.append(_xml_element(f'<vos:protocol uri="{_xml_attr(str(protocol))}"',
+                                        protocol_content, 'vos:protocol'))
         for param in self._parameters:
-            param_elem = ET.SubElement(root, "{http://www.ivoa.net/xml/VOSpace/v2.1}param")
-            param_elem.set('uri', str(param))
-            param_elem.text = str(param.value)
-        return ET.tostring(root).decode("utf-8")
+            content.append(f'<vos:param uri="{_xml_attr(str(param))}">{_xml_text(str(param.value))}</vos:param>')
+
+    def todict(self):
+        value = super().todict()
+        if self.view:
+            value['view'] = str(self.view)
+        value['protocols'] = [{'uri': str(protocol),
+                               'endpoint': str(protocol.endpoint) if protocol.endpoint else None,
+                               'securityMethod': str(protocol.security_method) if protocol.security_method else None}
+                              for protocol in self._protocols]
+        # values are strings, as they are read back from the xml document
+        value['params'] = [{'uri': str(param), 'value': str(param.value) or None} for param in self._parameters]
+        return value
+
+    def build_dict(self, value):
+        if value.get('view'):
+            self._view = View(value['view'])
+        for protocol in value.get('protocols', []):
+            protocol_obj = Protocol.create_protocol(protocol['uri'], protocol.get('securityMethod'))
+            if protocol.get('endpoint') is not None:
+                protocol_obj.endpoint = Endpoint(protocol['endpoint'])
+            self._protocols.append(protocol_obj)
+        for param in value.get('params', []):
+            self._parameters.append(Parameter(param['uri'], param.get('value')))
 
     def build_node(self, root):
-        view_elem = root.xpath('/vos:transfer/vos:view', namespaces=Node.NS)
+        view_elem = ProtocolTransfer._view_xpath(root)
         if view_elem:
             view_uri = view_elem[0].attrib.get('uri', None)
             self._view = View(view_uri)
 
-        protocols = root.xpath('/vos:transfer/vos:protocol', namespaces=Node.NS)
+        protocols = ProtocolTransfer._protocols_xpath(root)
         for protocol in protocols:
             protocol_uri = protocol.attrib.get('uri', None)
 
             # Security Methods
             security_obj = None
-            security_elem = protocol.xpath('vos:securityMethod', namespaces=Node.NS)
+            security_elem = ProtocolTransfer._security_method_xpath(protocol)
             if security_elem:
                 security_uri = security_elem[0].attrib.get('uri', None)
                 if security_uri is None:
@@ -1389,7 +1681,7 @@ class ProtocolTransfer(Transfer):
 
             # Endpoint
             endpoint = None
-            endpoint_elem = protocol.xpath('vos:endpoint', namespaces=Node.NS)
+            endpoint_elem = ProtocolTransfer._endpoint_xpath(protocol)
             if endpoint_elem:
                 endpoint = Endpoint(endpoint_elem[0].text)
 
@@ -1405,7 +1697,7 @@ class ProtocolTransfer(Transfer):
                 protocol_obj = Protocol(endpoint, security_obj)
             self._protocols.append(protocol_obj)
 
-        params = root.xpath('/vos:transfer/vos:param', namespaces=Node.NS)
+        params = ProtocolTransfer._params_xpath(root)
         for param in params:
             param_uri = param.attrib.get('uri', None)
             self._parameters.append(Parameter(param_uri, param.text))
@@ -1465,6 +1757,8 @@ UWSPhaseLookup = {0: 'PENDING',
                   8: 'SUSPENDED',
                   9: 'ARCHIVED'}
 
+UWSPhaseText = {text: phase for phase, text in UWSPhaseLookup.items()}
+
 
 class UWSResult(object):
     def __init__(self, id, attrs):
@@ -1604,6 +1898,77 @@ class UWSJob(object):
         return UWSJob(job_id, phase, destruction, job_info, result_set, error)
 
 
+class UWSJobRef(object):
+    """
+    Reference to a job in a UWS job list.
+
+    :param job_id: job id.
+    :param phase: job :func:`Phase <pyvospace.core.model.UWSPhase>`
+    :param owner: owner of the job.
+    :param creation_time: ISO 8601 creation time of the job.
+    """
+    def __init__(self, job_id, phase, owner=None, creation_time=None):
+        self.job_id = str(job_id)
+        self.phase = phase
+        self.owner = owner
+        self.creation_time = creation_time
+
+    def __eq__(self, other):
+        if not isinstance(other, UWSJobRef):
+            return False
+        return self.job_id == other.job_id and self.phase == other.phase and \
+            self.owner == other.owner and self.creation_time == other.creation_time
+
+    def tostring(self):
+        job_id = _xml_attr(self.job_id)
+        content = [f'<uws:phase>{UWSPhaseLookup[self.phase]}</uws:phase>']
+        if self.owner is not None:
+            content.append(f'<uws:ownerId>{_xml_text(self.owner)}</uws:ownerId>')
+        if self.creation_time is not None:
+            content.append(f'<uws:creationTime>{_xml_text(self.creation_time)}</uws:creationTime>')
+        return _xml_element(f'<uws:jobref id="{job_id}" xlink:href="/vospace/transfers/{job_id}"',
+                            content, 'uws:jobref')
+
+
+class UWSJobList(object):
+    """
+    UWS job list, written as a head, the jobref of each job and a tail so long lists can be streamed.
+    """
+    HEAD = '<uws:jobs xmlns:uws="http://www.ivoa.net/xml/UWS/v1.0" ' \
+           'xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1">'
+    TAIL = '</uws:jobs>'
+
+    @classmethod
+    def tostring(cls, jobrefs):
+        return f"{cls.HEAD}{''.join(jobref.tostring() for jobref in jobrefs)}{cls.TAIL}"
+
+    @classmethod
+    def fromstring(cls, xml):
+        """
+        :return: list of :func:`UWSJobRef <pyvospace.core.model.UWSJobRef>`
+        """
+        root = ET.fromstring(xml)
+        if root.tag != '{http://www.ivoa.net/xml/UWS/v1.0}jobs':
+            raise InvalidXML('uws:jobs does not exist')
+        jobrefs = []
+        for jobref in root.xpath('/uws:jobs/uws:jobref', namespaces=UWSJob.NS):
+            job_id = jobref.attrib.get('id', None)
+            if not job_id:
+                raise InvalidXML('id is empty')
+            phase = jobref.xpath('uws:phase', namespaces=UWSJob.NS)
+            if not phase:
+                raise InvalidXML('uws:phase does not exist')
+            phase = phase[0].text
+            if phase not in UWSPhaseLookup.values():
+                raise InvalidXML(f'invalid phase {phase}')
+            owner = jobref.xpath('uws:ownerId', namespaces=UWSJob.NS)
+            creation_time = jobref.xpath('uws:creationTime', namespaces=UWSJob.NS)
+            jobrefs.append(UWSJobRef(job_id, UWSPhaseText[phase],
+                                     owner[0].text if owner else None,
+                                     creation_time[0].text if creation_time else None))
+        return jobrefs
+
+
 class Storage(object):
 
     def __init__(self, storage_id, space_name, host, port, parameters, https, enabled):
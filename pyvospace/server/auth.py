@@ -36,6 +36,10 @@ class SpacePermission(metaclass=ABCMeta):
             getNode: called on a 6.3.1 setNode request.
             context: :func:`Node <pyvospace.core.model.Node>`
 
+            getNodes: called on a bulk getNode request, once for all the nodes found.
+            context: list of :func:`Node <pyvospace.core.model.Node>`
+            return: a bool for all the nodes or a list holding a bool for each node.
+
             setNode: called on a 6.3.2 setNode request.
             context: :func:`Node <pyvospace.core.model.Node>`
 
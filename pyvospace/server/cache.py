@@ -0,0 +1,268 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import time
+import json
+import asyncpg
+
+from collections import OrderedDict, namedtuple
+
+from .statements import statements
+
+
+statements.register('user', "select username, groupread, groupwrite, admin from users "
+                            "where username=$1 and space_name=$2")
+
+# groupread and groupwrite are frozensets so group checks are set operations.
+User = namedtuple('User', 'username groupread groupwrite admin')
+
+
+class NodeCache(object):
+    """
+    Bounded LRU cache of the rows behind a directory listing.
+
+    Entries are keyed by the ltree path of the listed node and invalidated through the
+    node_cache channel, which is notified by statement triggers on nodes and properties.
+    A change to a node drops the listings of the node and of its parent, changes made
+    by this server also drop the listings of every ancestor as they show the tree totals.
+
+    :param space_id: id of the space being cached.
+    :param maxsize: maximum number of listings held.
+    :param router: :class:`ReplicaRouter <pyvospace.server.replica.ReplicaRouter>` told of notified
+                   changes, so listings changed elsewhere are read from the primary while replicas catch up.
+    """
+    def __init__(self, space_id, maxsize, router=None):
+        self.space_id = space_id
+        self.maxsize = maxsize
+        self.router = router
+        self.listener = None
+        self._generation = 0
+        self._entries = OrderedDict()
+        self._paths = {}
+
+    @property
+    def enabled(self):
+        return self.listener is not None
+
+    @property
+    def generation(self):
+        """
+        Incremented on every invalidation. Rows read before an invalidation are not cached.
+        """
+        return self._generation
+
+    async def setup(self, dsn):
+        self.listener = await asyncpg.connect(dsn=dsn)
+        self.listener.add_termination_listener(self._terminated_callback)
+        await self.listener.add_listener('node_cache', self._node_cache_callback)
+
+    async def close(self):
+        listener = self.listener
+        self.listener = None
+        self.clear()
+        if listener:
+            await listener.close()
+
+    def _terminated_callback(self, connection):
+        # Without the listener changes can not be seen so stop caching.
+        self.listener = None
+        self.clear()
+
+    def _node_cache_callback(self, connection, pid, channel, payload):
+        change = json.loads(payload)
+        if int(change['space_id']) != self.space_id:
+            return
+        if change.get('paths') is not None:
+            self.invalidate(change['paths'])
+            if self.router:
+                self.router.written(change['paths'])
+        else:
+            self.invalidate_tree(change['subtree'])
+            if self.router:
+                self.router.written_tree(change['subtree'] or '')
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, *args):
+        if not self.enabled:
+            return None
+        key = (path, *args)
+        rows = self._entries.get(key)
+        if rows is not None:
+            self._entries.move_to_end(key)
+        return rows
+
+    def put(self, generation, rows, path, *args):
+        """
+        :param generation: generation read before the rows were fetched.
+        :param rows: rows of the listing.
+        :param path: ltree path of the listed node.
+        :param args: anything else the listing depends on, e.g. limit and start.
+        """
+        if not self.enabled or generation != self._generation:
+            return
+        key = (path, *args)
+        self._entries[key] = rows
+        self._entries.move_to_end(key)
+        self._paths.setdefault(path, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            old_key, _ = self._entries.popitem(last=False)
+            self._discard_key(old_key)
+
+    def _discard_key(self, key):
+        keys = self._paths.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._paths[key[0]]
+
+    def _discard_path(self, path):
+        for key in self._paths.pop(path, ()):
+            self._entries.pop(key, None)
+
+    def invalidate(self, paths):
+        """
+        Drop the listings of each path and of its parent.
+
+        :param paths: ltree paths of changed nodes.
+        """
+        self._generation += 1
+        for path in paths:
+            self._discard_path(path)
+            self._discard_path(path.rpartition('.')[0])
+
+    def invalidate_ancestors(self, paths):
+        """
+        Drop the listings of each path and of all its ancestors, up to the root listing.
+
+        :param paths: ltree paths of changed nodes.
+        """
+        self._generation += 1
+        for path in paths:
+            labels = path.split('.')
+            for level in range(len(labels) + 1):
+                self._discard_path('.'.join(labels[:level]))
+
+    def invalidate_tree(self, path):
+        """
+        Drop the listings of path and every node below it.
+
+        :param path: ltree path of the subtree, '' for the whole space.
+        """
+        self._generation += 1
+        if not path:
+            self.clear()
+            return
+        prefix = f'{path}.'
+        for node_path in [p for p in self._paths if p == path or p.startswith(prefix)]:
+            self._discard_path(node_path)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._paths.clear()
+
+
+class UserCache(object):
+    """
+    Bounded LRU cache of users and their groups, entries expire after ttl seconds.
+
+    Entries are invalidated through the users_cache channel, which is notified by a trigger
+    on users. Users that do not exist are cached as well. Without a listener every lookup
+    reads the database.
+
+    :param space_name: name of the space the users belong to.
+    :param db_pool: pool users are read from.
+    :param maxsize: maximum number of users held, 0 disables the cache.
+    :param ttl: seconds a user is held.
+    """
+    def __init__(self, space_name, db_pool, maxsize=0, ttl=60):
+        self.space_name = space_name
+        self.db_pool = db_pool
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.listener = None
+        self._generation = 0
+        self._entries = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.listener is not None and self.maxsize > 0
+
+    async def setup(self, dsn):
+        if self.maxsize <= 0:
+            return
+        self.listener = await asyncpg.connect(dsn=dsn)
+        self.listener.add_termination_listener(self._terminated_callback)
+        await self.listener.add_listener('users_cache', self._users_cache_callback)
+
+    async def close(self):
+        listener = self.listener
+        self.listener = None
+        self.clear()
+        if listener:
+            await listener.close()
+
+    def _terminated_callback(self, connection):
+        self.listener = None
+        self.clear()
+
+    def _users_cache_callback(self, connection, pid, channel, payload):
+        change = json.loads(payload)
+        if change['space_name'] == self.space_name:
+            self.invalidate(change['username'])
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, username):
+        """
+        :param username: name of the user.
+        :return: :class:`User` or None if the user does not exist.
+        """
+        if self.enabled:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(username)
+                return entry[1]
+
+        generation = self._generation
+        async with self.db_pool.acquire() as conn:
+            row = await statements.fetchrow(conn, 'user', username, self.space_name)
+        user = None
+        if row:
+            user = User(row['username'], frozenset(row['groupread'] or ()),
+                        frozenset(row['groupwrite'] or ()), row['admin'])
+        if self.enabled and generation == self._generation:
+            self._entries[username] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, username):
+        self._generation += 1
+        self._entries.pop(username, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
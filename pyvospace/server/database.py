@@ -20,20 +20,259 @@
 #    MA 02111-1307  USA
 
 import os
+import re
+import json
 import asyncpg
 import base64
 
+from contextlib import asynccontextmanager
+
 from pyvospace.core.exception import VOSpaceError, InvalidURI, NodeDoesNotExistError, PermissionDenied, \
     ContainerDoesNotExistError, DuplicateNodeError, InvalidArgument
 from pyvospace.core.model import Node, DataNode, UnstructuredDataNode, StructuredDataNode, LinkNode, ContainerNode, \
     NodeType, Property, DeleteProperty, NodeTextLookup, Storage
+from .statements import statements
+
+
+# Read-only properties of a container giving the total size and number of nodes below it.
+TREE_LENGTH_URI = 'ivo://icrar.org/vospace/core#treelength'
+TREE_COUNT_URI = 'ivo://icrar.org/vospace/core#treecount'
+
+# Read-only properties of a node read from its row, recorded when the node is created or its data changes.
+LENGTH_URI = 'ivo://ivoa.net/vospace/core#length'
+BTIME_URI = 'ivo://ivoa.net/vospace/core#btime'
+CTIME_URI = 'ivo://ivoa.net/vospace/core#ctime'
+MTIME_URI = 'ivo://ivoa.net/vospace/core#mtime'
+
+# ltree path of a node, labels are the base16 encoded names.
+LTREE_PATH = re.compile(r'^[0-9A-F]+(\.[0-9A-F]+)*$')
+
+
+def properties_column(alias, where=''):
+    # Properties of each listed node aggregated into its row.
+    return f"""(select json_agg(json_build_object('uri', properties.uri, 'value', properties.value, 
+                                                  'read_only', properties.read_only)) 
+               from properties where properties.node_path={alias}.path 
+               and properties.space_id={alias}.space_id {where}) as properties"""
+
+
+def listing_statement(name, paged, child_properties):
+    return f"{name}{'_paged' if paged else ''}{'_properties' if child_properties else ''}"
+
+
+for _paged in (False, True):
+    for _child_properties in (False, True):
+        # The node, a page of its children, their storage and properties are read in one
+        # statement. Children are found through the parent path expression index
+        # (nodes_parent_idx) and paged by a keyset on path, so only a page of rows
+        # is read regardless of the size or depth of the container.
+        statements.register(listing_statement('directory', _paged, _child_properties), f"""
+            with node_cte as 
+            ((select * from nodes where path=$1 and space_id=$2) 
+            union all 
+            (select * from nodes where subpath(path, 0, nlevel(path)-1)=$1 and space_id=$2 
+            {'and path >= $4' if _paged else ''} order by path asc limit $3)) 
+            select node_cte.*, storage.name as space_name, 
+            storage.host, storage.port, storage.parameters, storage.https, storage.enabled, 
+            {properties_column('node_cte', '' if _child_properties else 'and node_cte.path=$1')} 
+            from node_cte left join storage on node_cte.storage_id=storage.id 
+            order by node_cte.path asc""")
+
+        statements.register(listing_statement('root_directory', _paged, _child_properties), f"""
+            with node_cte as 
+            (select * from nodes where subpath(path, 0, nlevel(path)-1)='' and space_id=$1 
+            {'and path >= $3' if _paged else ''} order by path asc limit $2) 
+            select node_cte.*, storage.name as space_name, 
+            storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
+            {', ' + properties_column('node_cte') if _child_properties else ''} 
+            from node_cte left join storage on node_cte.storage_id=storage.id 
+            order by node_cte.path asc""")
+
+
+for _child_properties in (False, True):
+    statements.register(listing_statement('children_cursor', False, _child_properties), f"""
+        select nodes.*, storage.name as space_name, 
+        storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
+        {', ' + properties_column('nodes') if _child_properties else ''} 
+        from nodes left join storage on nodes.storage_id=storage.id 
+        where subpath(nodes.path, 0, nlevel(nodes.path)-1)=$1 and nodes.space_id=$2 
+        and ($3::ltree is null or nodes.path >= $3) 
+        order by nodes.path asc""")
+
+# Many nodes with their storage and properties, without children, read in one statement.
+statements.register('nodes_any', f"""
+    select nodes.*, storage.name as space_name, 
+    storage.host, storage.port, storage.parameters, storage.https, storage.enabled, 
+    {properties_column('nodes')} 
+    from nodes left join storage on nodes.storage_id=storage.id 
+    where nodes.path = any($1::ltree[]) and nodes.space_id=$2""")
+
+
+def search_statement(uri, value, mtime):
+    return f"search{'_uri' if uri else ''}{'_value' if value else ''}{'_mtime' if mtime else ''}"
+
+
+for _uri, _value in ((False, False), (True, False), (True, True)):
+    for _mtime in (False, True):
+        # Nodes below $2 after the keyset $3 in path order. A property filter is read from
+        # properties_search_idx, the subtree from the path gist indexes and an mtime
+        # range from nodes_mtime_idx. The value is indexed by its first 256 characters.
+        # The variants are prepared on a connection when they are first run.
+        _args = iter(range(4, 9))
+        _filters = []
+        if _uri:
+            _filters.append(f"matched.uri=${next(_args)}")
+        if _value:
+            _value_arg = next(_args)
+            _filters.append(f"left(matched.value, 256)=left(${_value_arg}, 256) and matched.value=${_value_arg}")
+        if _mtime:
+            _filters.append(f"nodes.mtime >= ${next(_args)} and nodes.mtime < ${next(_args)}")
+        _path = 'matched.node_path' if _uri else 'nodes.path'
+        statements.register(search_statement(_uri, _value, _mtime), f"""
+            select nodes.*, storage.name as space_name, 
+            storage.host, storage.port, storage.parameters, storage.https, storage.enabled, 
+            {properties_column('nodes')} 
+            from {'properties as matched inner join nodes on nodes.path=matched.node_path and ' 
+                  'nodes.space_id=matched.space_id' if _uri else 'nodes'} 
+            left join storage on nodes.storage_id=storage.id 
+            where {'matched' if _uri else 'nodes'}.space_id=$1 and {_path} <@ $2 and {_path} != $2 
+            and {_path} > $3 {''.join(f' and {f}' for f in _filters)} 
+            order by {_path} asc limit ${next(_args)}""", prepare=False)
+
+for _name in (False, True):
+    # Nodes matching an lquery after the keyset $3 in path order, the lquery is matched through
+    # path_gist_idx and a name regular expression through nodes_name_trgm_idx.
+    # The variants are prepared on a connection when they are first run.
+    statements.register(f"glob{'_name' if _name else ''}", f"""
+        select nodes.*, storage.name as space_name, 
+        storage.host, storage.port, storage.parameters, storage.https, storage.enabled, 
+        {properties_column('nodes')} 
+        from nodes left join storage on nodes.storage_id=storage.id 
+        where nodes.space_id=$1 and nodes.path ~ $2::text::lquery and nodes.path > $3 
+        {'and nodes.name ~ $5' if _name else ''} 
+        order by nodes.path asc limit $4""", prepare=False)
+
+# share lock both node and parent, important so we
+# dont have a dead lock with move/copy/create
+statements.register('node_and_parent', """
+    with node_cte as 
+    (select * from nodes where path=$1 or path=$2 and space_id=$3 order by path asc for update)
+    select node_cte.*, storage.name as space_name, 
+    storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
+    from node_cte left join storage on node_cte.storage_id=storage.id 
+    order by node_cte.path asc""")
+
+statements.register('node', """
+    select nodes.*, storage.name as space_name, 
+    storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
+    from nodes left join storage on nodes.storage_id=storage.id 
+    where nodes.path=$1 and nodes.space_id=$2""")
+
+statements.register('node_for_update', """
+    with node_cte as
+    (select * from nodes where path=$1 and type=$2 and space_id=$3 for update of nodes)
+    select node_cte.*, storage.name as space_name,
+    storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
+    from node_cte left join storage on node_cte.storage_id=storage.id""")
+
+statements.register('node_for_delete', """
+    with node_cte as
+    (select * from nodes where path=$1 and space_id=$2 for update of nodes)
+    select node_cte.*, storage.name as space_name,
+    storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
+    from node_cte left join storage on node_cte.storage_id=storage.id""")
+
+statements.register('node_properties', "select * from properties where node_path=$1 and space_id=$2")
+
+statements.register('insert_node', "insert into nodes (type, name, path, owner, "
+                                   "groupread, groupwrite, space_id, link) "
+                                   "values ($1, $2, $3, $4, $5, $6, $7, $8)")
+
+statements.register('update_node', "update nodes set groupread=$1, groupwrite=$2, size=$3, storage_id=$4, "
+                                   "ctime=now() where path=$5 and space_id=$6")
+
+statements.register('update_node_data', "update nodes set groupread=$1, groupwrite=$2, size=$3, storage_id=$4, "
+                                        "ctime=now(), mtime=now() where path=$5 and space_id=$6")
+
+statements.register('delete_node', "delete from nodes where path=$1 and space_id=$2")
+
+# Deletes the next batch of a subtree in path order and returns the last path deleted.
+statements.register('delete_tree_batch', """
+    with batch as 
+    (select path from nodes where path <@ $1 and path > $2 and space_id=$3 order by path asc limit $4), 
+    deleted as 
+    (delete from nodes using batch where nodes.path=batch.path and nodes.space_id=$3 returning nodes.path) 
+    select (select path from deleted order by path desc limit 1) as last, 
+    (select count(*) from deleted) as count""")
+
+statements.register('insert_property', "insert into properties (uri, value, read_only, node_path, space_id) "
+                                       "values ($1, $2, $3, $4, $5)")
+
+# if a property already exists then update it
+statements.register('upsert_property', "insert into properties (uri, value, read_only, node_path, space_id) "
+                                       "values ($1, $2, $3, $4, $5) on conflict (uri, node_path, space_id) "
+                                       "do update set value=$2 where properties.value!=$2")
+
+statements.register('delete_node_properties', "delete from properties where node_path=$1 and space_id=$2")
+
+statements.register('delete_node_property_uris', "delete from properties where uri=any($1::text[]) "
+                                                 "and node_path=$2 and space_id=$3")
+
+statements.register('contains_properties', "select distinct(uri), value, read_only from properties "
+                                           "where space_id=$1")
+
+
+# Staging tables for create_tree. They live for the session and are emptied at commit,
+# path is text as COPY is binary and ltree has no binary format.
+CREATE_TREE_COPY_TABLES = """
+create temp table if not exists nodes_copy (
+    ord bigserial, type smallint, name text, path text, owner text, groupread text[],
+    groupwrite text[], id uuid, size bigint, storage_id bigint, link text) on commit delete rows;
+create temp table if not exists properties_copy (
+    ord bigserial, uri text, value text, read_only boolean, node_path text) on commit delete rows;
+truncate nodes_copy, properties_copy;
+"""
+
+NODES_COPY_COLUMNS = ('type', 'name', 'path', 'owner', 'groupread', 'groupwrite',
+                      'id', 'size', 'storage_id', 'link')
+
+PROPERTIES_COPY_COLUMNS = ('uri', 'value', 'read_only', 'node_path')
+
+# distinct on keeps the last row given for a path, as a row can only be upserted once per statement.
+MERGE_NODES_COPY = "insert into nodes (type, name, path, owner, groupread, groupwrite, " \
+                   "id, size, storage_id, space_id, link) " \
+                   "select distinct on (path) type, name, path::ltree, owner, groupread, groupwrite, " \
+                   "id, size, storage_id, $1, link from nodes_copy order by path, ord desc " \
+                   "on conflict (path, space_id) do update set size=excluded.size, storage_id=excluded.storage_id, " \
+                   "ctime=now(), mtime=now()"
+
+MERGE_PROPERTIES_COPY = "insert into properties (uri, value, read_only, node_path, space_id) " \
+                        "select distinct on (uri, node_path) uri, value, read_only, node_path::ltree, $1 " \
+                        "from properties_copy order by uri, node_path, ord desc " \
+                        "on conflict (uri, node_path, space_id) " \
+                        "do update set value=excluded.value where properties.value!=excluded.value"
+
+
+class NodeCursor(object):
+    """
+    Server side cursor over the child nodes of a container.
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    async def fetch(self, n):
+        return [NodeDatabase._create_listed_node(result) for result in await self.cursor.fetch(n)]
 
 
 class NodeDatabase(object):
-    def __init__(self, space_id, db_pool, permission):
+    def __init__(self, space_id, db_pool, permission, cache=None, router=None):
         self.space_id = space_id
         self.permission = permission
         self.db_pool = db_pool
+        self.cache = cache
+        self.router = router
+        # invalidations to repeat once the transaction of a connection commits
+        self._written = {}
 
     @classmethod
     def ltree_to_path(cls, ltree_path):
@@ -53,6 +292,79 @@ class NodeDatabase(object):
         else:
             return '.'.join(path_array_result)
 
+    @classmethod
+    def glob_to_regex(cls, pattern):
+        """
+        Translate a glob pattern of a node name to an anchored POSIX regular expression.
+        """
+        regex = ['^']
+        i = 0
+        while i < len(pattern):
+            c = pattern[i]
+            i += 1
+            if c == '*':
+                regex.append('.*')
+            elif c == '?':
+                regex.append('.')
+            elif c == '[' and ']' in pattern[i + 1:]:
+                end = pattern.index(']', i + 1)
+                chars = pattern[i:end].replace('\\', '\\\\')
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                regex.append(f'[{chars}]')
+                i = end + 1
+            elif c in '.^$|()[]{}+\\':
+                regex.append('\\' + c)
+            else:
+                regex.append(c)
+        regex.append('$')
+        return ''.join(regex)
+
+    @classmethod
+    def glob_to_lquery(cls, path_tree, pattern):
+        """
+        Translate a glob pattern, relative to a container, to an lquery over node paths.
+
+        '**' matches any number of levels, at least one when it ends the pattern, '*' one level
+        and 'name*' the names starting with name.
+        Other wildcards are only allowed in the last segment, the segment then matches one level
+        and the names are matched by the returned regular expression.
+
+        :param path_tree: ltree path of the container, '' for the root of the space.
+        :param pattern: glob pattern e.g. '**/*.fits'.
+        :return: tuple(lquery, name regular expression or None)
+        """
+        segments = [segment for segment in pattern.split('/') if segment]
+        if not segments:
+            raise InvalidArgument('pattern is empty.')
+        labels = [path_tree] if path_tree else []
+        name_regex = None
+        for i, segment in enumerate(segments):
+            if segment in ('.', '..'):
+                raise InvalidArgument(f'pattern invalid: {pattern}')
+            wildcards = [c for c in segment if c in '*?[']
+            if segment == '**':
+                if labels and labels[-1] == '*':
+                    continue
+                labels.append('*')
+            elif segment == '*':
+                labels.append('*{1}')
+            elif not wildcards:
+                labels.append(NodeDatabase.path_to_ltree(segment))
+            elif wildcards == ['*'] and segment.endswith('*'):
+                # labels are the encoded names so a name prefix is a label prefix
+                labels.append(f'{NodeDatabase.path_to_ltree(segment[:-1])}*')
+            elif i == len(segments) - 1:
+                labels.append('*{1}')
+                name_regex = NodeDatabase.glob_to_regex(segment)
+            else:
+                raise InvalidArgument(f'pattern invalid: {pattern}, only the last segment '
+                                      f'can hold wildcards other than ** and a trailing *.')
+        if segments[-1] == '**':
+            # '*' also matches no level, a final '**' only matches below what precedes it
+            labels[-1] = '*{1,}'
+        return '.'.join(labels), name_regex
+
     @classmethod
     def resultset_to_node_tree(cls, results, prop_results=None):
         prop_dict = {}
@@ -61,15 +373,25 @@ class NodeDatabase(object):
                 prop_dict.setdefault(result['node_path'], []).append(
                     Property(result['uri'], result['value'], result['read_only']))
 
-        root = NodeDatabase._create_node(results.pop(0))
-        if results:
+        root = NodeDatabase._create_node(results[0])
+        if len(results) > 1:
             if not isinstance(root, ContainerNode):
                 raise InvalidURI(f'{root} is not a container')
-        for result in results:
+
+        # Every node is indexed by its ltree path and linked to its parent in one pass,
+        # so the tree is built in O(n) whatever the order of the rows.
+        tree = {results[0]['path']: root}
+        nodes = []
+        for result in results[1:]:
             node = NodeDatabase._create_node(result)
-            props = prop_dict.get(result['path'], [])
-            node.set_properties(props)
-            root.insert_node_into_tree(node)
+            node.set_properties(prop_dict.get(result['path'], []))
+            tree[result['path']] = node
+            nodes.append((result['path'], node))
+        for path, node in nodes:
+            parent = tree.get(path.rpartition('.')[0])
+            if not isinstance(parent, ContainerNode):
+                raise InvalidArgument(f'no path to {node.path}')
+            parent.attach_node(node)
         return root
 
     @classmethod
@@ -86,6 +408,33 @@ class NodeDatabase(object):
         node.set_properties(NodeDatabase._resultset_to_properties(root_properties_row))
         return node
 
+    @classmethod
+    def _create_listed_node(cls, node_row):
+        node = NodeDatabase._create_node(node_row)
+        properties = node_row.get('properties')
+        if properties:
+            node.set_properties(NodeDatabase._resultset_to_properties(json.loads(properties)))
+        return node
+
+    @classmethod
+    def _add_tree_properties(cls, node, node_row):
+        # tree_size and tree_count are kept up to date by triggers on nodes.
+        if node.node_type == NodeType.ContainerNode:
+            node.add_property(Property(TREE_LENGTH_URI, node_row['tree_size'], persist=False))
+            node.add_property(Property(TREE_COUNT_URI, node_row['tree_count'], persist=False))
+
+    @classmethod
+    def _add_stat_properties(cls, node, node_row):
+        if node_row is None:
+            # the root of the space has no row so it has no times
+            node.add_property(Property(LENGTH_URI, 0, persist=False))
+            return
+        # Times are given in seconds since the epoch.
+        node.add_property(Property(LENGTH_URI, node_row['size'], persist=False))
+        node.add_property(Property(BTIME_URI, node_row['btime'].timestamp(), persist=False))
+        node.add_property(Property(CTIME_URI, node_row['ctime'].timestamp(), persist=False))
+        node.add_property(Property(MTIME_URI, node_row['mtime'].timestamp(), persist=False))
+
     @classmethod
     def _resultset_to_properties(cls, results):
         properties = []
@@ -131,16 +480,7 @@ class NodeDatabase(object):
         path_tree = '.'.join(path_list)
 
         try:
-            # share lock both node and parent, important so we
-            # dont have a dead lock with move/copy/create
-            query = """with node_cte as 
-                       (select * from nodes where path=$1 or path=$2 and space_id=$3 order by path asc for update)
-                       select node_cte.*, storage.name as space_name, 
-                       storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
-                       from node_cte left join storage on node_cte.storage_id=storage.id 
-                       order by node_cte.path asc"""
-
-            result = await conn.fetch(query, path_tree, path_parent_tree, self.space_id)
+            result = await statements.fetch(conn, 'node_and_parent', path_tree, path_parent_tree, self.space_id)
 
         except asyncpg.exceptions.PostgresSyntaxError:
             raise InvalidURI(f"{path} contains invalid characters.")
@@ -162,46 +502,271 @@ class NodeDatabase(object):
             return result[0], result[1]
         return None, None
 
-    async def directory(self, path, conn, identity=None):
-        path = os.path.normpath(path)
-        if not any(path in s for s in ['/', '//']):
-            path_tree = NodeDatabase.path_to_ltree(path)
-
-            query = """with node_cte as 
-                       (select * from nodes where path <@ $1 and nlevel(path)-nlevel($1)<=1 and space_id=$2 
-                       order by path asc) 
-                       select node_cte.*, storage.name as space_name, 
-                       storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
-                       from node_cte left join storage on node_cte.storage_id=storage.id 
-                       order by node_cte.path asc"""
-
-            results = await conn.fetch(query, path_tree, self.space_id)
-            if len(results) == 0:
-                raise NodeDoesNotExistError(f"{path} not found.")
-
-            properties = await conn.fetch("select * from properties "
-                                          "where node_path=$1 and space_id=$2",
-                                          results[0]['path'], self.space_id)
+    @asynccontextmanager
+    async def transaction(self, conn, **kwargs):
+        """
+        Transaction on conn whose writes are invalidated again once it commits.
 
-            node = self._resultset_to_node(results, properties)
+        Written paths are invalidated straight away, a request reading before the commit can
+        still cache the rows it replaces, so they are invalidated again after the commit.
+        """
+        written = self._written[conn] = []
+        try:
+            async with conn.transaction(**kwargs):
+                yield
+        finally:
+            del self._written[conn]
+        for invalidate, arg in written:
+            invalidate(arg)
+
+    def invalidate(self, paths, conn=None):
+        # Listings of every ancestor show the tree length and count, so they change as well.
+        if self.cache:
+            self.cache.invalidate_ancestors(paths)
+        if self.router:
+            self.router.written(paths)
+        if conn in self._written:
+            self._written[conn].append((self.invalidate, paths))
+
+    def invalidate_tree(self, path, conn=None):
+        if self.cache:
+            self.cache.invalidate_tree(path)
+        if self.router:
+            self.router.written_tree(path)
+        if conn in self._written:
+            self._written[conn].append((self.invalidate_tree, path))
+
+    def read_pool(self, path=None):
+        """
+        Pool to read from, a replica unless this server wrote to path within the replica lag.
+
+        :param path: path of the node read, None if the read does not depend on one node.
+        """
+        if self.router is None:
+            return self.db_pool
+        path_tree = self._directory_paths(path, None)[1] if path is not None else None
+        return self.router.node_pool(path_tree)
 
+    @classmethod
+    def _directory_paths(cls, path, start_path):
+        # leading slashes are collapsed as in Node.uri_to_path, normpath keeps a leading '//'
+        path = os.path.normpath(f"/{path.lstrip('/')}")
+        start_tree = None
+        if start_path is not None:
+            start_path = os.path.normpath(f"/{start_path.lstrip('/')}")
+            if os.path.dirname(start_path) != path:
+                raise InvalidURI(f"{start_path} is not a child of {path}")
+            start_tree = NodeDatabase.path_to_ltree(start_path)
+
+        if path != '/':
+            return path, NodeDatabase.path_to_ltree(path), start_tree
+        return path, '', start_tree
+
+    async def _directory_rows(self, path, path_tree, conn, limit, start_tree, child_properties):
+        if path_tree:
+            name = listing_statement('directory', start_tree is not None, child_properties)
+            args = [path_tree, self.space_id, limit] + ([start_tree] if start_tree else [])
+            results = await statements.fetch(conn, name, *args)
+
+            if len(results) == 0 or results[0]['path'] != path_tree:
+                raise NodeDoesNotExistError(f"{path} not found.")
+        else:
+            name = listing_statement('root_directory', start_tree is not None, child_properties)
+            args = [self.space_id, limit] + ([start_tree] if start_tree else [])
+            results = await statements.fetch(conn, name, *args)
+        return results
+
+    async def _directory_node(self, path_tree, results, identity):
+        if path_tree:
+            node = NodeDatabase._create_listed_node(results[0])
+            NodeDatabase._add_tree_properties(node, results[0])
+            NodeDatabase._add_stat_properties(node, results[0])
+            child_nodes = [NodeDatabase._create_listed_node(result) for result in results[1:]]
+            if child_nodes:
+                if node.node_type != NodeType.ContainerNode:
+                    raise InvalidArgument('Attempting to add child node to non-container.')
+                node.nodes = child_nodes
         else:
-            query = """with node_cte as 
-                       (select * from nodes where nlevel(path)=1 and space_id=$1 order by path asc) 
-                       select node_cte.*, storage.name as space_name, 
-                       storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
-                       from node_cte left join storage on node_cte.storage_id=storage.id 
-                       order by node_cte.path asc"""
-
-            results = await conn.fetch(query, self.space_id)
             node = ContainerNode('/', group_read=[identity])
             for result in results:
-                node.insert_node_into_tree(NodeDatabase._create_node(result))
+                node.insert_node_into_tree(NodeDatabase._create_listed_node(result))
+            NodeDatabase._add_stat_properties(node, None)
 
         if not await self.permission.permits(identity, 'getNode', context=node):
             raise PermissionDenied('getNode denied.')
         return node
 
+    async def directory(self, path, conn, identity=None, limit=None, start_path=None, child_properties=False):
+        path, path_tree, start_tree = self._directory_paths(path, start_path)
+        results = await self._directory_rows(path, path_tree, conn, limit, start_tree, child_properties)
+        return await self._directory_node(path_tree, results, identity)
+
+    async def get_node(self, path, identity=None, limit=None, start_path=None, child_properties=False):
+        """
+        Read through the node cache, a connection is only acquired on a miss.
+        The listing is a single statement so it is read without an explicit transaction.
+        """
+        path, path_tree, start_tree = self._directory_paths(path, start_path)
+        key = (limit, start_tree, child_properties)
+        results = self.cache.get(path_tree, *key) if self.cache else None
+        if results is None:
+            generation = self.cache.generation if self.cache else None
+            async with self.read_pool(path).acquire() as conn:
+                results = await self._directory_rows(path, path_tree, conn, limit, start_tree, child_properties)
+            if self.cache:
+                self.cache.put(generation, results, path_tree, *key)
+        return await self._directory_node(path_tree, results, identity)
+
+    async def get_nodes(self, paths, identity=None):
+        """
+        Read many nodes, without their children, with one statement and one permission check.
+
+        :param paths: node paths or uris.
+        :param identity: identity of the user.
+        :return: list holding a node or the VOSpaceError raised for each path, in the order of paths.
+        """
+        path_trees = []
+        for path in paths:
+            try:
+                path = Node.uri_to_path(path)
+                path_trees.append(NodeDatabase.path_to_ltree(path) if path != '/' else '')
+            except VOSpaceError as e:
+                path_trees.append(e)
+
+        trees = list({path_tree for path_tree in path_trees if isinstance(path_tree, str) and path_tree})
+        rows = {}
+        if trees:
+            pool = self.db_pool if self.router is None else self.router.nodes_pool(trees)
+            async with pool.acquire() as conn:
+                for row in await statements.fetch(conn, 'nodes_any', trees, self.space_id):
+                    rows[row['path']] = row
+
+        results = []
+        for path, path_tree in zip(paths, path_trees):
+            if isinstance(path_tree, VOSpaceError):
+                results.append(path_tree)
+            elif not path_tree:
+                node = ContainerNode('/', group_read=[identity])
+                NodeDatabase._add_stat_properties(node, None)
+                results.append(node)
+            elif path_tree in rows:
+                node = NodeDatabase._create_listed_node(rows[path_tree])
+                NodeDatabase._add_tree_properties(node, rows[path_tree])
+                NodeDatabase._add_stat_properties(node, rows[path_tree])
+                results.append(node)
+            else:
+                results.append(NodeDoesNotExistError(f"{path} not found."))
+
+        nodes = [node for node in results if isinstance(node, Node)]
+        if nodes:
+            permitted = await self.permission.permits(identity, 'getNodes', context=nodes)
+            if isinstance(permitted, bool):
+                permitted = [permitted] * len(nodes)
+            denied = {id(node) for node, allowed in zip(nodes, permitted) if not allowed}
+            results = [PermissionDenied('getNode denied.') if id(node) in denied else node for node in results]
+        return results
+
+    async def directory_cursor(self, path, conn, identity=None, start_path=None, child_properties=False):
+        # Must be called within a transaction as the children are read through a server side cursor.
+        path, path_tree, start_tree = self._directory_paths(path, start_path)
+        if path_tree:
+            result = await statements.fetchrow(conn, 'node', path_tree, self.space_id)
+            if not result:
+                raise NodeDoesNotExistError(f"{path} not found.")
+
+            properties = await statements.fetch(conn, 'node_properties', path_tree, self.space_id)
+
+            node = self._resultset_to_node([result], properties)
+            NodeDatabase._add_tree_properties(node, result)
+            NodeDatabase._add_stat_properties(node, result)
+        else:
+            node = ContainerNode('/', group_read=[identity])
+            NodeDatabase._add_stat_properties(node, None)
+
+        if not await self.permission.permits(identity, 'getNode', context=node):
+            raise PermissionDenied('getNode denied.')
+
+        if not isinstance(node, ContainerNode):
+            return node, None
+
+        cursor = await statements.cursor(conn, listing_statement('children_cursor', False, child_properties),
+                                         path_tree, self.space_id, start_tree)
+        return node, NodeCursor(cursor)
+
+    async def _search_container(self, path, conn, identity):
+        path, path_tree, _ = self._directory_paths(path, None)
+        if path_tree:
+            result = await statements.fetchrow(conn, 'node', path_tree, self.space_id)
+            if not result:
+                raise NodeDoesNotExistError(f"{path} not found.")
+            node = NodeDatabase._create_node(result)
+        else:
+            node = ContainerNode('/', group_read=[identity])
+
+        if not isinstance(node, ContainerNode):
+            raise InvalidArgument(f'{path} is not a container.')
+        # a search is a listing of the container so it is permitted as one
+        if not await self.permission.permits(identity, 'getNode', context=node):
+            raise PermissionDenied('getNode denied.')
+        return path_tree
+
+    async def search_cursor(self, path, conn, identity=None, uri=None, value=None, mtime_range=None,
+                            after=None, limit=1000):
+        """
+        Search the nodes below a container in path order, through a server side cursor.
+        Must be called within a transaction.
+
+        :param path: path of the container searched.
+        :param conn: connection to read from.
+        :param identity: identity of the user.
+        :param uri: only nodes holding a property with this uri.
+        :param value: only nodes whose property uri holds this value.
+        :param mtime_range: tuple(from, to) of datetimes, only nodes whose data changed within [from, to).
+        :param after: ltree path of the last node of the previous page.
+        :param limit: maximum number of nodes.
+        :return: :class:`NodeCursor`
+        """
+        if value is not None and uri is None:
+            raise InvalidArgument('value requires uri.')
+        if after is not None and not LTREE_PATH.match(after):
+            raise InvalidArgument(f'cursor invalid: {after}')
+        path_tree = await self._search_container(path, conn, identity)
+
+        args = [self.space_id, path_tree, after or '']
+        if uri is not None:
+            args.append(uri)
+        if value is not None:
+            args.append(value)
+        if mtime_range is not None:
+            args.extend(mtime_range)
+        cursor = await statements.cursor(conn, search_statement(uri is not None, value is not None,
+                                                                mtime_range is not None), *args, limit)
+        return NodeCursor(cursor)
+
+    async def glob_cursor(self, path, conn, pattern, identity=None, after=None, limit=1000):
+        """
+        Find the nodes below a container matching a glob pattern in path order, through a
+        server side cursor. Must be called within a transaction.
+
+        :param path: path of the container searched.
+        :param conn: connection to read from.
+        :param pattern: glob pattern relative to the container, see :func:`glob_to_lquery`.
+        :param identity: identity of the user.
+        :param after: ltree path of the last node of the previous page.
+        :param limit: maximum number of nodes.
+        :return: :class:`NodeCursor`
+        """
+        if after is not None and not LTREE_PATH.match(after):
+            raise InvalidArgument(f'cursor invalid: {after}')
+        path_tree = await self._search_container(path, conn, identity)
+        lquery, name_regex = NodeDatabase.glob_to_lquery(path_tree, pattern)
+        if name_regex is None:
+            cursor = await statements.cursor(conn, 'glob', self.space_id, lquery, after or '', limit)
+        else:
+            cursor = await statements.cursor(conn, 'glob_name', self.space_id, lquery, after or '', limit,
+                                             name_regex)
+        return NodeCursor(cursor)
+
     async def create(self, node, conn, identity):
         try:
             # We can not have a target unless its a link node
@@ -235,19 +800,17 @@ class NodeDatabase(object):
             if not await self.permission.permits(identity, 'createNode', context=(parent_node, node)):
                 raise PermissionDenied('createNode denied.')
 
-            await conn.fetchrow("insert into nodes (type, name, path, owner, "
-                                "groupread, groupwrite, space_id, link) "
-                                "values ($1, $2, $3, $4, $5, $6, $7, $8)",
-                                node.node_type, node_name, path_tree, identity,
-                                node.group_read, node.group_write, self.space_id, target)
+            await statements.execute(conn, 'insert_node',
+                                     node.node_type, node_name, path_tree, identity,
+                                     node.group_read, node.group_write, self.space_id, target)
             node_properties = []
             for prop in node.properties.values():
                 if prop.persist:
                     node_properties.append(prop.tolist()+[path_tree, self.space_id])
 
             if node_properties:
-                await conn.executemany("insert into properties (uri, value, read_only, node_path, space_id) "
-                                       "values ($1, $2, $3, $4, $5)", node_properties)
+                await statements.executemany(conn, 'insert_property', node_properties)
+            self.invalidate([path_tree], conn)
             return parent_row, child_row
         except asyncpg.exceptions.UniqueViolationError as f:
             raise DuplicateNodeError(f"{node.path} already exists.")
@@ -262,43 +825,38 @@ class NodeDatabase(object):
         nodes.sort()
 
         node_insert = []
+        node_paths = []
         for node in nodes:
             if not isinstance(node, Node):
                 raise InvalidArgument(f'{node} is not a Node.')
             path = NodeDatabase.path_to_ltree(node.path)
-            node_row = [node.node_type, node.name, path, node.owner,
+            node_paths.append(path)
+            node_row = (node.node_type, node.name, path, node.owner,
                         node.group_read, node.group_write, node.id,
                         node.size, node.storage.storage_id if node.storage else None,
-                        self.space_id, node.target if isinstance(node, LinkNode) else None]
+                        node.target if isinstance(node, LinkNode) else None)
             node_insert.append(node_row)
-        if node_insert:
-            await conn.executemany("insert into nodes (type, name, path, owner, groupread, groupwrite, "
-                                   "id, size, storage_id, space_id, link) "
-                                   "values ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11) "
-                                   "on conflict (path, space_id) do update set size=$8, storage_id=$9",
-                                   node_insert)
 
         node_properties = []
-        for node in nodes:
+        for node, path in zip(nodes, node_paths):
             for prop in node.properties.values():
-                prop_list = prop.tolist() + [NodeDatabase.path_to_ltree(node.path), self.space_id]
-                node_properties.append(prop_list)
+                node_properties.append((*prop.tolist(), path))
 
+        # Must be called within a transaction. Rows are streamed into session temp tables
+        # with COPY and merged into nodes and properties with one statement each.
+        await conn.execute(CREATE_TREE_COPY_TABLES)
+        await conn.copy_records_to_table('nodes_copy', records=node_insert, columns=NODES_COPY_COLUMNS)
+        await conn.execute(MERGE_NODES_COPY, self.space_id)
         if node_properties:
-            await conn.executemany("insert into properties (uri, value, read_only, node_path, space_id) "
-                                   "values ($1, $2, $3, $4, $5) on conflict (uri, node_path, space_id) "
-                                   "do update set value=$2 where properties.value!=$2",
-                                   node_properties)
+            await conn.copy_records_to_table('properties_copy', records=node_properties,
+                                             columns=PROPERTIES_COPY_COLUMNS)
+            await conn.execute(MERGE_PROPERTIES_COPY, self.space_id)
+        self.invalidate(node_paths, conn)
 
-    async def update(self, node, conn, identity, check_identity=True):
+    async def update(self, node, conn, identity, check_identity=True, data_modified=False):
         node_path_tree = NodeDatabase.path_to_ltree(node.path)
 
-        query = """with node_cte as
-                   (select * from nodes where path=$1 and type=$2 and space_id=$3 for update of nodes)
-                   select node_cte.*, storage.name as space_name,
-                   storage.host, storage.port, storage.parameters, storage.https, storage.enabled 
-                   from node_cte left join storage on node_cte.storage_id=storage.id"""
-        results = await conn.fetchrow(query, node_path_tree, node.node_type, self.space_id)
+        results = await statements.fetchrow(conn, 'node_for_update', node_path_tree, node.node_type, self.space_id)
         if not results:
             raise NodeDoesNotExistError(f"{node.path} not found.")
 
@@ -322,56 +880,64 @@ class NodeDatabase(object):
                 else:
                     pass_through_properties.append(prop)
 
-        await conn.execute("update nodes set groupread=$1, groupwrite=$2, size=$3, storage_id=$4 "
-                           "where path=$5 and space_id=$6",
-                           node.group_read, node.group_write,
-                           node.size, node.storage.storage_id if node.storage else None,
-                           node_path_tree, self.space_id)
+        # mtime records a change to the data of the node, ctime any change to the node.
+        await statements.execute(conn, 'update_node_data' if data_modified else 'update_node',
+                                 node.group_read, node.group_write,
+                                 node.size, node.storage.storage_id if node.storage else None,
+                                 node_path_tree, self.space_id)
 
         if node_props_insert:
-            # if a property already exists then update it
-            await conn.executemany("insert into properties (uri, value, read_only, node_path, space_id) "
-                                   "values ($1, $2, $3, $4, $5) on conflict (uri, node_path, space_id) "
-                                   "do update set value=$2 where properties.value!=$2",
-                                   node_props_insert)
+            await statements.executemany(conn, 'upsert_property', node_props_insert)
 
         if node_props_delete:
-            await conn.execute("delete from properties where uri=any($1::text[]) "
-                               "and node_path=$2 and space_id=$3",
-                               node_props_delete, node_path_tree, self.space_id)
+            await statements.execute(conn, 'delete_node_property_uris',
+                                     node_props_delete, node_path_tree, self.space_id)
 
-        node_properties = await conn.fetch("select * from properties "
-                                           "where node_path=$1 and space_id=$2",
-                                           node_path_tree, self.space_id)
+        node_properties = await statements.fetch(conn, 'node_properties', node_path_tree, self.space_id)
         node.set_properties(NodeDatabase._resultset_to_properties(node_properties) + pass_through_properties)
+        self.invalidate([node_path_tree], conn)
         return node
 
-    async def delete(self, path, conn, identity):
+    async def delete(self, path, conn, identity, batch_size=10000):
+        """
+        Delete a node and everything below it.
+
+        Permission is checked on the locked root before anything is deleted. The descendants
+        are then deleted in path order, at most batch_size rows per statement, so no rows are
+        returned and memory stays flat however large the tree is.
+
+        :return: the deleted root node, without its children.
+        """
         path_tree = NodeDatabase.path_to_ltree(path)
-        results = await conn.fetch("with delete_cte as "
-                                   "(delete from nodes where path <@ $1 and space_id=$2 returning *) "
-                                   "select delete_cte.*, nlevel(delete_cte.path), "
-                                   "storage.name as space_name, storage.host, "
-                                   "storage.port, storage.parameters, storage.https, storage.enabled from delete_cte "
-                                   "left join storage on delete_cte.storage_id=storage.id "
-                                   "order by nlevel(delete_cte.path) asc",
-                                   path_tree, self.space_id)
-        if not results:
+        result = await statements.fetchrow(conn, 'node_for_delete', path_tree, self.space_id)
+        if not result:
             raise NodeDoesNotExistError(f"{path} not found.")
 
-        node = NodeDatabase.resultset_to_node_tree(results)
-
+        node = NodeDatabase._create_node(result)
         if not await self.permission.permits(identity, 'deleteNode', context=node):
             raise PermissionDenied('deleteNode denied.')
+
+        await statements.execute(conn, 'delete_node', path_tree, self.space_id)
+        # Deleted until a batch comes up short rather than counted down from tree_count,
+        # so a stale count can not leave descendants behind.
+        last = path_tree
+        while True:
+            batch = await statements.fetchrow(conn, 'delete_tree_batch', path_tree, last,
+                                              self.space_id, batch_size)
+            if batch['count'] < batch_size:
+                break
+            last = batch['last']
+
+        self.invalidate([path_tree], conn)
+        self.invalidate_tree(path_tree, conn)
         return node
 
     async def delete_properties(self, path, conn):
         path_tree = NodeDatabase.path_to_ltree(path)
-        await conn.execute("delete from properties where node_path=$1 and space_id=$2",
-                           path_tree, self.space_id)
+        await statements.execute(conn, 'delete_node_properties', path_tree, self.space_id)
+        self.invalidate([path_tree], conn)
 
     async def get_contains_properties(self):
-        async with self.db_pool.acquire() as conn:
+        async with self.read_pool().acquire() as conn:
             async with conn.transaction():
-                return await conn.fetch("select distinct(uri), value, read_only from properties where space_id=$1",
-                                        self.space_id)
\ No newline at end of file
+                return await statements.fetch(conn, 'contains_properties', self.space_id)
\ No newline at end of file
@@ -0,0 +1,21 @@
+--
+-- Direct-child index for directory listings.
+--
+-- Indexes the parent path of each node so a container listing is a range
+-- scan over its children only, instead of a GiST scan over the whole subtree.
+--
+-- The index is built concurrently so nodes stays writable, which can not
+-- be done within a transaction.
+--
+-- psql -d vospace -f 001_nodes_parent_idx.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+--
+-- Name: nodes_parent_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY nodes_parent_idx ON public.nodes USING btree (space_id, public.subpath(path, 0, (public.nlevel(path) - 1)), path);
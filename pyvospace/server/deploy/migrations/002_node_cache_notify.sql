@@ -0,0 +1,124 @@
+--
+-- Node cache invalidation.
+--
+-- Statement triggers on nodes and properties notify the node_cache channel with the
+-- paths changed by each statement, so space servers can drop cached listings.
+--
+-- psql -d vospace -f 002_node_cache_notify.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+BEGIN;
+
+--
+-- Name: node_cache_notify(text, bigint, public.ltree[]); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.node_cache_notify(tbl text, space bigint, paths public.ltree[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+payload text;
+BEGIN
+payload := json_build_object('table', tbl, 'space_id', space, 'paths', paths)::text;
+-- NOTIFY payloads are limited to 8000 bytes, large changes invalidate the common subtree instead.
+IF octet_length(payload) > 7900 THEN
+payload := json_build_object('table', tbl, 'space_id', space, 'subtree', public.lca(paths))::text;
+END IF;
+PERFORM pg_notify('node_cache', payload);
+END;
+$$;
+
+ALTER FUNCTION public.node_cache_notify(tbl text, space bigint, paths public.ltree[]) OWNER TO vos_user;
+
+--
+-- Name: nodes_cache_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.nodes_cache_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP = 'INSERT' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct path))
+FROM new_rows GROUP BY space_id;
+ELSIF TG_OP = 'UPDATE' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct path))
+FROM (SELECT space_id, path FROM old_rows UNION ALL SELECT space_id, path FROM new_rows) AS changed
+GROUP BY space_id;
+ELSE
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct path))
+FROM old_rows GROUP BY space_id;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.nodes_cache_notify_trigger() OWNER TO vos_user;
+
+--
+-- Name: properties_cache_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.properties_cache_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP = 'INSERT' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct node_path))
+FROM new_rows GROUP BY space_id;
+ELSIF TG_OP = 'UPDATE' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct node_path))
+FROM (SELECT space_id, node_path FROM old_rows UNION ALL SELECT space_id, node_path FROM new_rows) AS changed
+GROUP BY space_id;
+ELSE
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct node_path))
+FROM old_rows GROUP BY space_id;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.properties_cache_notify_trigger() OWNER TO vos_user;
+
+
+--
+-- Name: nodes nodes_cache_insert_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_cache_insert_trigger AFTER INSERT ON public.nodes REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_cache_notify_trigger();
+
+--
+-- Name: nodes nodes_cache_update_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_cache_update_trigger AFTER UPDATE ON public.nodes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_cache_notify_trigger();
+
+--
+-- Name: nodes nodes_cache_delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_cache_delete_trigger AFTER DELETE ON public.nodes REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_cache_notify_trigger();
+
+--
+-- Name: properties properties_cache_insert_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER properties_cache_insert_trigger AFTER INSERT ON public.properties REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.properties_cache_notify_trigger();
+
+--
+-- Name: properties properties_cache_update_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER properties_cache_update_trigger AFTER UPDATE ON public.properties REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.properties_cache_notify_trigger();
+
+--
+-- Name: properties properties_cache_delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER properties_cache_delete_trigger AFTER DELETE ON public.properties REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.properties_cache_notify_trigger();
+
+COMMIT;
@@ -0,0 +1,115 @@
+--
+-- Container sizes and node counts.
+--
+-- tree_size and tree_count hold the total size and number of the nodes below each node.
+-- Statement triggers on nodes add the size and count of inserted, updated and deleted
+-- rows to their ancestors, so the totals are kept without walking the tree.
+--
+-- psql -d vospace -f 003_node_tree_size.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+BEGIN;
+
+ALTER TABLE public.nodes ADD COLUMN tree_size bigint DEFAULT 0 NOT NULL;
+ALTER TABLE public.nodes ADD COLUMN tree_count bigint DEFAULT 0 NOT NULL;
+
+-- ALTER TABLE holds nodes locked until commit, so no change is missed before the triggers exist.
+UPDATE public.nodes SET tree_size = totals.size, tree_count = totals.count
+FROM (SELECT space_id, public.subpath(path, 0, level) AS ancestor, sum(size) AS size, count(*) AS count
+      FROM public.nodes, generate_series(1, public.nlevel(path) - 1) AS level
+      GROUP BY 1, 2) AS totals
+WHERE nodes.path = totals.ancestor AND nodes.space_id = totals.space_id;
+
+--
+-- Name: nodes_tree_size_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.nodes_tree_size_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+-- The ancestor update below fires this trigger again, it changes no path or size.
+IF pg_trigger_depth() > 1 THEN
+RETURN NULL;
+END IF;
+IF TG_OP = 'INSERT' THEN
+WITH delta AS (
+    SELECT space_id, public.subpath(path, 0, level) AS ancestor, sum(size) AS size, count(*) AS count
+    FROM new_rows, generate_series(1, public.nlevel(path) - 1) AS level
+    GROUP BY 1, 2),
+locked AS (
+    SELECT delta.* FROM public.nodes JOIN delta ON nodes.path = delta.ancestor AND nodes.space_id = delta.space_id
+    ORDER BY nodes.path FOR UPDATE OF nodes)
+UPDATE public.nodes SET tree_size = nodes.tree_size + locked.size, tree_count = nodes.tree_count + locked.count
+FROM locked WHERE nodes.path = locked.ancestor AND nodes.space_id = locked.space_id;
+ELSIF TG_OP = 'UPDATE' THEN
+IF NOT EXISTS (SELECT 1 FROM old_rows JOIN new_rows ON old_rows.id = new_rows.id
+               WHERE old_rows.path <> new_rows.path OR old_rows.size <> new_rows.size) THEN
+RETURN NULL;
+END IF;
+-- Old rows are taken off their old ancestors and new rows added to their new ancestors.
+-- An old ancestor that moved in the same statement is matched by its new path, so the
+-- aggregate it carries with it is not counted twice.
+WITH moved AS (
+    SELECT old_rows.space_id, old_rows.path AS old_path, new_rows.path AS new_path
+    FROM old_rows JOIN new_rows ON old_rows.id = new_rows.id
+    WHERE old_rows.path <> new_rows.path),
+changes AS (
+    SELECT space_id, public.subpath(path, 0, level) AS ancestor, size, 1 AS count
+    FROM new_rows, generate_series(1, public.nlevel(path) - 1) AS level
+    UNION ALL
+    SELECT old_rows.space_id, coalesce(moved.new_path, public.subpath(old_rows.path, 0, level)), -old_rows.size, -1
+    FROM old_rows CROSS JOIN generate_series(1, public.nlevel(old_rows.path) - 1) AS level
+    LEFT JOIN moved ON moved.space_id = old_rows.space_id AND moved.old_path = public.subpath(old_rows.path, 0, level)),
+delta AS (
+    SELECT space_id, ancestor, sum(size) AS size, sum(count) AS count FROM changes
+    GROUP BY 1, 2 HAVING sum(size) <> 0 OR sum(count) <> 0),
+locked AS (
+    SELECT delta.* FROM public.nodes JOIN delta ON nodes.path = delta.ancestor AND nodes.space_id = delta.space_id
+    ORDER BY nodes.path FOR UPDATE OF nodes)
+UPDATE public.nodes SET tree_size = nodes.tree_size + locked.size, tree_count = nodes.tree_count + locked.count
+FROM locked WHERE nodes.path = locked.ancestor AND nodes.space_id = locked.space_id;
+ELSE
+WITH delta AS (
+    SELECT space_id, public.subpath(path, 0, level) AS ancestor, sum(size) AS size, count(*) AS count
+    FROM old_rows, generate_series(1, public.nlevel(path) - 1) AS level
+    GROUP BY 1, 2),
+locked AS (
+    SELECT delta.* FROM public.nodes JOIN delta ON nodes.path = delta.ancestor AND nodes.space_id = delta.space_id
+    ORDER BY nodes.path FOR UPDATE OF nodes)
+UPDATE public.nodes SET tree_size = nodes.tree_size - locked.size, tree_count = nodes.tree_count - locked.count
+FROM locked WHERE nodes.path = locked.ancestor AND nodes.space_id = locked.space_id;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.nodes_tree_size_trigger() OWNER TO vos_user;
+
+--
+-- Name: nodes nodes_tree_size_insert_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_tree_size_insert_trigger AFTER INSERT ON public.nodes REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_tree_size_trigger();
+
+
+--
+-- Name: nodes nodes_tree_size_update_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_tree_size_update_trigger AFTER UPDATE ON public.nodes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_tree_size_trigger();
+
+
+--
+-- Name: nodes nodes_tree_size_delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_tree_size_delete_trigger AFTER DELETE ON public.nodes REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_tree_size_trigger();
+
+
+COMMIT;
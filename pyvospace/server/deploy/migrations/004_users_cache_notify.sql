@@ -0,0 +1,42 @@
+--
+-- User cache invalidation.
+--
+-- A row trigger on users notifies the users_cache channel with the space and name of
+-- each changed user, so servers can drop cached users and groups.
+--
+-- psql -d vospace -f 004_users_cache_notify.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+BEGIN;
+
+--
+-- Name: users_cache_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.users_cache_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP IN ('UPDATE', 'DELETE') THEN
+PERFORM pg_notify('users_cache', json_build_object('space_name', OLD.space_name, 'username', OLD.username)::text);
+END IF;
+IF TG_OP IN ('INSERT', 'UPDATE') THEN
+PERFORM pg_notify('users_cache', json_build_object('space_name', NEW.space_name, 'username', NEW.username)::text);
+END IF;
+RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.users_cache_notify_trigger() OWNER TO vos_user;
+
+--
+-- Name: users users_cache_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER users_cache_trigger AFTER INSERT OR DELETE OR UPDATE ON public.users FOR EACH ROW EXECUTE PROCEDURE public.users_cache_notify_trigger();
+
+COMMIT;
@@ -0,0 +1,21 @@
+--
+-- Node times.
+--
+-- btime, ctime and mtime record when a node was created, last changed and last had its
+-- data changed, so getNode reads them with the node instead of from the storage disk.
+--
+-- psql -d vospace -f 005_node_times.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+BEGIN;
+
+-- Existing nodes take the time of the migration.
+ALTER TABLE public.nodes ADD COLUMN btime timestamp with time zone DEFAULT now() NOT NULL;
+ALTER TABLE public.nodes ADD COLUMN ctime timestamp with time zone DEFAULT now() NOT NULL;
+ALTER TABLE public.nodes ADD COLUMN mtime timestamp with time zone DEFAULT now() NOT NULL;
+
+COMMIT;
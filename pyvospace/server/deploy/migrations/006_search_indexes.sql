@@ -0,0 +1,36 @@
+--
+-- Search indexes.
+--
+-- properties_search_idx finds the nodes holding a property and value, the value is indexed
+-- by its first 256 characters so long values stay within the btree row size limit.
+-- properties_path_gist_idx limits a search to a subtree and nodes_mtime_idx to an mtime range.
+--
+-- The indexes are built concurrently so nodes and properties stay writable, which can not
+-- be done within a transaction.
+--
+-- psql -d vospace -f 006_search_indexes.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+--
+-- Name: properties_search_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY properties_search_idx ON public.properties USING btree (space_id, uri, "left"(value, 256), node_path);
+
+
+--
+-- Name: properties_path_gist_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY properties_path_gist_idx ON public.properties USING gist (node_path);
+
+
+--
+-- Name: nodes_mtime_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY nodes_mtime_idx ON public.nodes USING btree (space_id, mtime);
@@ -0,0 +1,23 @@
+--
+-- Glob search.
+--
+-- Glob patterns are matched by an lquery over path_gist_idx. Name patterns that an lquery
+-- can not express, e.g. '*.fits', are matched by a regular expression on the name through
+-- a trigram index. Creating the pg_trgm extension needs a user allowed to create extensions.
+--
+-- The index is built concurrently so nodes stay writable, which can not be done within a transaction.
+--
+-- psql -d vospace -f 007_glob_search.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+--
+-- Name: nodes_name_trgm_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY nodes_name_trgm_idx ON public.nodes USING gin (name public.gin_trgm_ops);
@@ -0,0 +1,92 @@
+--
+-- UWS job transfers as JSON.
+--
+-- job_info_json and transfer_json hold the job_info and transfer documents as jsonb, so
+-- jobs are read without parsing XML. Existing jobs are converted from their XML.
+--
+-- The uws_jobs notifications only carry the id, space and phase of the job, the whole
+-- row with both forms of the documents could exceed the 8000 byte NOTIFY payload limit.
+--
+-- psql -d vospace -f 008_uws_jobs_json.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+BEGIN;
+
+ALTER TABLE public.uws_jobs ADD COLUMN job_info_json jsonb;
+ALTER TABLE public.uws_jobs ADD COLUMN transfer_json jsonb;
+
+-- The same dict as Transfer.todict.
+CREATE FUNCTION pg_temp.transfer_json(doc xml) RETURNS jsonb
+    LANGUAGE sql STRICT
+    AS $$
+SELECT jsonb_strip_nulls(jsonb_build_object(
+    'target', t.target,
+    'direction', t.direction,
+    'keepBytes', CASE t.keep_bytes WHEN 'true' THEN true WHEN 'false' THEN false END,
+    'view', t.view_uri,
+    'protocols', (SELECT coalesce(jsonb_agg(jsonb_build_object('uri', p.uri,
+                                                               'endpoint', p.endpoint,
+                                                               'securityMethod', p.security_method)
+                                            ORDER BY p.ord), '[]'::jsonb)
+                  FROM XMLTABLE(XMLNAMESPACES('http://www.ivoa.net/xml/VOSpace/v2.1' AS vos),
+                                '/vos:transfer/vos:protocol' PASSING doc
+                                COLUMNS ord FOR ORDINALITY,
+                                        uri text PATH '@uri',
+                                        endpoint text PATH 'vos:endpoint',
+                                        security_method text PATH 'vos:securityMethod/@uri') p),
+    'params', (SELECT coalesce(jsonb_agg(jsonb_build_object('uri', p.uri, 'value', nullif(p.value, ''))
+                                         ORDER BY p.ord), '[]'::jsonb)
+               FROM XMLTABLE(XMLNAMESPACES('http://www.ivoa.net/xml/VOSpace/v2.1' AS vos),
+                             '/vos:transfer/vos:param' PASSING doc
+                             COLUMNS ord FOR ORDINALITY,
+                                     uri text PATH '@uri',
+                                     value text PATH '.') p)))
+FROM XMLTABLE(XMLNAMESPACES('http://www.ivoa.net/xml/VOSpace/v2.1' AS vos),
+              '/vos:transfer' PASSING doc
+              COLUMNS target text PATH 'vos:target',
+                      direction text PATH 'vos:direction',
+                      keep_bytes text PATH 'vos:keepBytes',
+                      view_uri text PATH 'vos:view/@uri') t
+$$;
+
+UPDATE public.uws_jobs SET job_info_json = pg_temp.transfer_json(job_info),
+                           transfer_json = pg_temp.transfer_json(transfer);
+
+--
+-- Name: delete_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE OR REPLACE FUNCTION public.delete_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+PERFORM pg_notify(TG_TABLE_NAME, json_build_object('action', TG_OP, 'table', TG_TABLE_NAME,
+                                                   'row', json_build_object('id', OLD.id, 'space_id', OLD.space_id,
+                                                                            'phase', OLD.phase))::text);
+RETURN OLD;
+END;
+$$;
+
+--
+-- Name: insert_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE OR REPLACE FUNCTION public.insert_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.phase <> OLD.phase) THEN
+PERFORM pg_notify(TG_TABLE_NAME, json_build_object('action', TG_OP, 'table', TG_TABLE_NAME,
+                                                   'row', json_build_object('id', NEW.id, 'space_id', NEW.space_id,
+                                                                            'phase', NEW.phase))::text);
+RETURN NEW;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+COMMIT;
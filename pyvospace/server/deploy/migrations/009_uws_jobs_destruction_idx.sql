@@ -0,0 +1,22 @@
+--
+-- Expired job index.
+--
+-- uws_jobs_destruction_idx finds the jobs of a space past their destruction time,
+-- which the job reaper of the space server deletes in batches.
+--
+-- The index is built concurrently so uws_jobs stays writable, which can not
+-- be done within a transaction.
+--
+-- psql -d vospace -f 009_uws_jobs_destruction_idx.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+--
+-- Name: uws_jobs_destruction_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY uws_jobs_destruction_idx ON public.uws_jobs USING btree (space_id, destruction);
+
@@ -0,0 +1,35 @@
+--
+-- UWS job creation time and job list index.
+--
+-- creation holds the utc time a job was created, the creationTime of the UWS job list.
+-- Jobs are always created to be destroyed 3000 seconds later, so the creation time of
+-- existing jobs is taken from their destruction time.
+--
+-- uws_jobs_owner_creation_idx lists the jobs of an owner newest first and pages them
+-- on (creation, id). It is built concurrently so uws_jobs stays writable, which can
+-- not be done within a transaction.
+--
+-- psql -d vospace -f 010_uws_jobs_creation.sql
+--
+
+\connect vospace
+
+SET search_path = public;
+
+BEGIN;
+
+ALTER TABLE public.uws_jobs ADD COLUMN creation timestamp without time zone;
+
+UPDATE public.uws_jobs SET creation = destruction - interval '3000 seconds';
+
+ALTER TABLE public.uws_jobs ALTER COLUMN creation SET DEFAULT timezone('utc'::text, now());
+ALTER TABLE public.uws_jobs ALTER COLUMN creation SET NOT NULL;
+
+COMMIT;
+
+--
+-- Name: uws_jobs_owner_creation_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX CONCURRENTLY uws_jobs_owner_creation_idx ON public.uws_jobs USING btree (space_id, owner, creation, id);
+
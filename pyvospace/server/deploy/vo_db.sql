@@ -70,6 +70,20 @@ CREATE EXTENSION IF NOT EXISTS "uuid-ossp" WITH SCHEMA public;
 COMMENT ON EXTENSION "uuid-ossp" IS 'generate universally unique identifiers (UUIDs)';
 
 
+--
+-- Name: pg_trgm; Type: EXTENSION; Schema: -; Owner: 
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA public;
+
+
+--
+-- Name: EXTENSION pg_trgm; Type: COMMENT; Schema: -; Owner: 
+--
+
+COMMENT ON EXTENSION pg_trgm IS 'text similarity measurement and index searching based on trigrams';
+
+
 --
 -- TOC entry 298 (class 1255 OID 16572)
 -- Name: delete_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
@@ -82,8 +96,10 @@ CREATE FUNCTION public.delete_notify_trigger() RETURNS trigger
 DECLARE
 
 BEGIN
-PERFORM
-pg_notify(TG_TABLE_NAME, '{"action":"' || TG_OP || '","table":"' || TG_TABLE_NAME || '","row":' || row_to_json(OLD) || '}');
+-- only the id, space and phase, NOTIFY payloads are limited to 8000 bytes
+PERFORM pg_notify(TG_TABLE_NAME, json_build_object('action', TG_OP, 'table', TG_TABLE_NAME,
+                                                   'row', json_build_object('id', OLD.id, 'space_id', OLD.space_id,
+                                                                            'phase', OLD.phase))::text);
 RETURN OLD;
 END;
 $$;
@@ -102,8 +118,10 @@ CREATE FUNCTION public.insert_notify_trigger() RETURNS trigger
 
 BEGIN
 IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.phase <> OLD.phase) THEN
-PERFORM
-pg_notify(TG_TABLE_NAME, '{"action":"' || TG_OP || '","table":"' || TG_TABLE_NAME || '","row":' || row_to_json(NEW) || '}');
+-- only the id, space and phase, NOTIFY payloads are limited to 8000 bytes
+PERFORM pg_notify(TG_TABLE_NAME, json_build_object('action', TG_OP, 'table', TG_TABLE_NAME,
+                                                   'row', json_build_object('id', NEW.id, 'space_id', NEW.space_id,
+                                                                            'phase', NEW.phase))::text);
 RETURN NEW;
 END IF;
 RETURN NULL;
@@ -114,6 +132,168 @@ $$;
 
 ALTER FUNCTION public.insert_notify_trigger() OWNER TO vos_user;
 
+--
+-- Name: node_cache_notify(text, bigint, public.ltree[]); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.node_cache_notify(tbl text, space bigint, paths public.ltree[]) RETURNS void
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+payload text;
+BEGIN
+payload := json_build_object('table', tbl, 'space_id', space, 'paths', paths)::text;
+-- NOTIFY payloads are limited to 8000 bytes, large changes invalidate the common subtree instead.
+IF octet_length(payload) > 7900 THEN
+payload := json_build_object('table', tbl, 'space_id', space, 'subtree', public.lca(paths))::text;
+END IF;
+PERFORM pg_notify('node_cache', payload);
+END;
+$$;
+
+
+ALTER FUNCTION public.node_cache_notify(tbl text, space bigint, paths public.ltree[]) OWNER TO vos_user;
+
+--
+-- Name: nodes_cache_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.nodes_cache_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP = 'INSERT' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct path))
+FROM new_rows GROUP BY space_id;
+ELSIF TG_OP = 'UPDATE' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct path))
+FROM (SELECT space_id, path FROM old_rows UNION ALL SELECT space_id, path FROM new_rows) AS changed
+GROUP BY space_id;
+ELSE
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct path))
+FROM old_rows GROUP BY space_id;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.nodes_cache_notify_trigger() OWNER TO vos_user;
+
+--
+-- Name: properties_cache_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.properties_cache_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP = 'INSERT' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct node_path))
+FROM new_rows GROUP BY space_id;
+ELSIF TG_OP = 'UPDATE' THEN
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct node_path))
+FROM (SELECT space_id, node_path FROM old_rows UNION ALL SELECT space_id, node_path FROM new_rows) AS changed
+GROUP BY space_id;
+ELSE
+PERFORM public.node_cache_notify(TG_TABLE_NAME, space_id, array_agg(distinct node_path))
+FROM old_rows GROUP BY space_id;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.properties_cache_notify_trigger() OWNER TO vos_user;
+
+--
+-- Name: nodes_tree_size_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.nodes_tree_size_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+-- The ancestor update below fires this trigger again, it changes no path or size.
+IF pg_trigger_depth() > 1 THEN
+RETURN NULL;
+END IF;
+IF TG_OP = 'INSERT' THEN
+WITH delta AS (
+    SELECT space_id, public.subpath(path, 0, level) AS ancestor, sum(size) AS size, count(*) AS count
+    FROM new_rows, generate_series(1, public.nlevel(path) - 1) AS level
+    GROUP BY 1, 2),
+locked AS (
+    SELECT delta.* FROM public.nodes JOIN delta ON nodes.path = delta.ancestor AND nodes.space_id = delta.space_id
+    ORDER BY nodes.path FOR UPDATE OF nodes)
+UPDATE public.nodes SET tree_size = nodes.tree_size + locked.size, tree_count = nodes.tree_count + locked.count
+FROM locked WHERE nodes.path = locked.ancestor AND nodes.space_id = locked.space_id;
+ELSIF TG_OP = 'UPDATE' THEN
+IF NOT EXISTS (SELECT 1 FROM old_rows JOIN new_rows ON old_rows.id = new_rows.id
+               WHERE old_rows.path <> new_rows.path OR old_rows.size <> new_rows.size) THEN
+RETURN NULL;
+END IF;
+-- Old rows are taken off their old ancestors and new rows added to their new ancestors.
+-- An old ancestor that moved in the same statement is matched by its new path, so the
+-- aggregate it carries with it is not counted twice.
+WITH moved AS (
+    SELECT old_rows.space_id, old_rows.path AS old_path, new_rows.path AS new_path
+    FROM old_rows JOIN new_rows ON old_rows.id = new_rows.id
+    WHERE old_rows.path <> new_rows.path),
+changes AS (
+    SELECT space_id, public.subpath(path, 0, level) AS ancestor, size, 1 AS count
+    FROM new_rows, generate_series(1, public.nlevel(path) - 1) AS level
+    UNION ALL
+    SELECT old_rows.space_id, coalesce(moved.new_path, public.subpath(old_rows.path, 0, level)), -old_rows.size, -1
+    FROM old_rows CROSS JOIN generate_series(1, public.nlevel(old_rows.path) - 1) AS level
+    LEFT JOIN moved ON moved.space_id = old_rows.space_id AND moved.old_path = public.subpath(old_rows.path, 0, level)),
+delta AS (
+    SELECT space_id, ancestor, sum(size) AS size, sum(count) AS count FROM changes
+    GROUP BY 1, 2 HAVING sum(size) <> 0 OR sum(count) <> 0),
+locked AS (
+    SELECT delta.* FROM public.nodes JOIN delta ON nodes.path = delta.ancestor AND nodes.space_id = delta.space_id
+    ORDER BY nodes.path FOR UPDATE OF nodes)
+UPDATE public.nodes SET tree_size = nodes.tree_size + locked.size, tree_count = nodes.tree_count + locked.count
+FROM locked WHERE nodes.path = locked.ancestor AND nodes.space_id = locked.space_id;
+ELSE
+WITH delta AS (
+    SELECT space_id, public.subpath(path, 0, level) AS ancestor, sum(size) AS size, count(*) AS count
+    FROM old_rows, generate_series(1, public.nlevel(path) - 1) AS level
+    GROUP BY 1, 2),
+locked AS (
+    SELECT delta.* FROM public.nodes JOIN delta ON nodes.path = delta.ancestor AND nodes.space_id = delta.space_id
+    ORDER BY nodes.path FOR UPDATE OF nodes)
+UPDATE public.nodes SET tree_size = nodes.tree_size - locked.size, tree_count = nodes.tree_count - locked.count
+FROM locked WHERE nodes.path = locked.ancestor AND nodes.space_id = locked.space_id;
+END IF;
+RETURN NULL;
+END;
+$$;
+
+
+ALTER FUNCTION public.nodes_tree_size_trigger() OWNER TO vos_user;
+
+--
+-- Name: users_cache_notify_trigger(); Type: FUNCTION; Schema: public; Owner: vos_user
+--
+
+CREATE FUNCTION public.users_cache_notify_trigger() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+IF TG_OP IN ('UPDATE', 'DELETE') THEN
+PERFORM pg_notify('users_cache', json_build_object('space_name', OLD.space_name, 'username', OLD.username)::text);
+END IF;
+IF TG_OP IN ('INSERT', 'UPDATE') THEN
+PERFORM pg_notify('users_cache', json_build_object('space_name', NEW.space_name, 'username', NEW.username)::text);
+END IF;
+RETURN NULL;
+END;
+$$;
+
+ALTER FUNCTION public.users_cache_notify_trigger() OWNER TO vos_user;
+
+
 --
 -- TOC entry 300 (class 1255 OID 16574)
 -- Name: update_modified_column(); Type: FUNCTION; Schema: public; Owner: vos_user
@@ -172,7 +352,12 @@ CREATE TABLE public.nodes (
     id uuid DEFAULT public.uuid_generate_v4() NOT NULL,
     path_modified bigint DEFAULT 0 NOT NULL,
     storage_id bigint,
-    size bigint DEFAULT 0 NOT NULL
+    size bigint DEFAULT 0 NOT NULL,
+    tree_size bigint DEFAULT 0 NOT NULL,
+    tree_count bigint DEFAULT 0 NOT NULL,
+    btime timestamp with time zone DEFAULT now() NOT NULL,
+    ctime timestamp with time zone DEFAULT now() NOT NULL,
+    mtime timestamp with time zone DEFAULT now() NOT NULL
 );
 
 
@@ -310,7 +495,10 @@ CREATE TABLE public.uws_jobs (
     modified timestamp without time zone DEFAULT now() NOT NULL,
     id uuid DEFAULT public.uuid_generate_v4() NOT NULL,
     node_path_modified bigint,
-    node_path public.ltree
+    node_path public.ltree,
+    job_info_json jsonb,
+    transfer_json jsonb,
+    creation timestamp without time zone DEFAULT timezone('utc'::text, now()) NOT NULL
 );
 
 
@@ -471,6 +659,27 @@ CREATE INDEX path_gist_idx ON public.nodes USING gist (path);
 CREATE INDEX path_idx ON public.nodes USING btree (path);
 
 
+--
+-- Name: nodes_parent_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX nodes_parent_idx ON public.nodes USING btree (space_id, public.subpath(path, 0, (public.nlevel(path) - 1)), path);
+
+
+--
+-- Name: nodes_mtime_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX nodes_mtime_idx ON public.nodes USING btree (space_id, mtime);
+
+
+--
+-- Name: nodes_name_trgm_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX nodes_name_trgm_idx ON public.nodes USING gin (name public.gin_trgm_ops);
+
+
 --
 -- TOC entry 2950 (class 1259 OID 16659)
 -- Name: phase_idx; Type: INDEX; Schema: public; Owner: vos_user
@@ -479,6 +688,20 @@ CREATE INDEX path_idx ON public.nodes USING btree (path);
 CREATE INDEX phase_idx ON public.uws_jobs USING btree (phase);
 
 
+--
+-- Name: uws_jobs_destruction_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX uws_jobs_destruction_idx ON public.uws_jobs USING btree (space_id, destruction);
+
+
+--
+-- Name: uws_jobs_owner_creation_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX uws_jobs_owner_creation_idx ON public.uws_jobs USING btree (space_id, owner, creation, id);
+
+
 --
 -- TOC entry 2931 (class 1259 OID 16660)
 -- Name: properties_idx; Type: INDEX; Schema: public; Owner: vos_user
@@ -487,6 +710,20 @@ CREATE INDEX phase_idx ON public.uws_jobs USING btree (phase);
 CREATE INDEX properties_idx ON public.properties USING btree (node_path);
 
 
+--
+-- Name: properties_search_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX properties_search_idx ON public.properties USING btree (space_id, uri, "left"(value, 256), node_path);
+
+
+--
+-- Name: properties_path_gist_idx; Type: INDEX; Schema: public; Owner: vos_user
+--
+
+CREATE INDEX properties_path_gist_idx ON public.properties USING gist (node_path);
+
+
 --
 -- TOC entry 2957 (class 2620 OID 16661)
 -- Name: uws_jobs delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
@@ -519,6 +756,76 @@ CREATE TRIGGER path_change_trigger BEFORE UPDATE ON public.nodes FOR EACH ROW EX
 CREATE TRIGGER update_trigger AFTER UPDATE ON public.uws_jobs FOR EACH ROW EXECUTE PROCEDURE public.update_modified_column();
 
 
+--
+-- Name: nodes nodes_cache_insert_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_cache_insert_trigger AFTER INSERT ON public.nodes REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_cache_notify_trigger();
+
+
+--
+-- Name: nodes nodes_cache_update_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_cache_update_trigger AFTER UPDATE ON public.nodes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_cache_notify_trigger();
+
+
+--
+-- Name: nodes nodes_cache_delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_cache_delete_trigger AFTER DELETE ON public.nodes REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_cache_notify_trigger();
+
+
+--
+-- Name: nodes nodes_tree_size_insert_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_tree_size_insert_trigger AFTER INSERT ON public.nodes REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_tree_size_trigger();
+
+
+--
+-- Name: nodes nodes_tree_size_update_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_tree_size_update_trigger AFTER UPDATE ON public.nodes REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_tree_size_trigger();
+
+
+--
+-- Name: nodes nodes_tree_size_delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER nodes_tree_size_delete_trigger AFTER DELETE ON public.nodes REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.nodes_tree_size_trigger();
+
+
+--
+-- Name: properties properties_cache_insert_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER properties_cache_insert_trigger AFTER INSERT ON public.properties REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.properties_cache_notify_trigger();
+
+
+--
+-- Name: properties properties_cache_update_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER properties_cache_update_trigger AFTER UPDATE ON public.properties REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.properties_cache_notify_trigger();
+
+
+--
+-- Name: properties properties_cache_delete_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER properties_cache_delete_trigger AFTER DELETE ON public.properties REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE PROCEDURE public.properties_cache_notify_trigger();
+
+
+--
+-- Name: users users_cache_trigger; Type: TRIGGER; Schema: public; Owner: vos_user
+--
+
+CREATE TRIGGER users_cache_trigger AFTER INSERT OR DELETE OR UPDATE ON public.users FOR EACH ROW EXECUTE PROCEDURE public.users_cache_notify_trigger();
+
+
 --
 -- TOC entry 2953 (class 2606 OID 16665)
 -- Name: properties properties_fk; Type: FK CONSTRAINT; Schema: public; Owner: vos_user
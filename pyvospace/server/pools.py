@@ -0,0 +1,156 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+import time
+import bisect
+import asyncio
+
+from .statements import create_pool
+
+
+class PoolAcquireContext(object):
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._conn = None
+
+    def __await__(self):
+        return self._pool._acquire(self._timeout).__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._pool._acquire(self._timeout)
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+class MeteredPool(object):
+    """
+    asyncpg pool recording how long connections are waited for and how many are in use.
+
+    Each workload gets its own pool so a saturated pool is visible in the metrics
+    and only delays its own workload.
+
+    Connections are checked out of the asyncpg pool once and handed out again after
+    they are reset, as asyncpg invalidates the statements prepared on a connection
+    released to its pool. Broken connections are released to the asyncpg pool,
+    which closes and replaces them.
+
+    :param name: name of the workload.
+    :param pool: asyncpg pool.
+    """
+    # upper bounds in milliseconds of the acquire wait histogram buckets
+    buckets = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.in_use = 0
+        self.max_in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_ms = 0.0
+        self._histogram = [0] * (len(self.buckets) + 1)
+        self._slots = asyncio.Semaphore(pool.get_max_size())
+        self._idle = []
+
+    def __getattr__(self, attr):
+        return getattr(self.pool, attr)
+
+    def acquire(self, *, timeout=None):
+        return PoolAcquireContext(self, timeout)
+
+    async def _acquire(self, timeout):
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+        try:
+            conn = self._idle.pop() if self._idle else await self.pool.acquire(timeout=timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.acquired += 1
+        self.wait_ms += wait_ms
+        self._histogram[bisect.bisect_left(self.buckets, wait_ms)] += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        return conn
+
+    async def release(self, conn, *, timeout=None):
+        self.in_use -= 1
+        try:
+            if not conn.is_closed():
+                try:
+                    await conn.reset(timeout=timeout)
+                except (Exception, asyncio.CancelledError):
+                    await self.pool.release(conn, timeout=timeout)
+                    raise
+                self._idle.append(conn)
+                return
+            await self.pool.release(conn, timeout=timeout)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self.pool.release(conn)
+        await self.pool.close()
+
+    def metrics(self):
+        """
+        :return: dict of the pool size, in use, waiting and max in use gauges,
+                 the acquire count, timeouts, total wait and the wait histogram.
+        """
+        histogram = {f'le_{bound}ms': count for bound, count in zip(self.buckets, self._histogram)}
+        histogram['inf'] = self._histogram[-1]
+        return {'size': self.pool.get_size(),
+                'max_size': self.pool.get_max_size(),
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'waiting': self.waiting,
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'wait_ms': self.wait_ms,
+                'wait_histogram': histogram}
+
+
+async def create_metered_pool(name, dsn, size):
+    """
+    Create a fixed size :class:`MeteredPool`, its connections prepare the registered statements
+    when they are created and keep them prepared while the pool is open.
+
+    :param name: name of the workload.
+    :param dsn: connection string to the database.
+    :param size: number of connections.
+    """
+    return MeteredPool(name, await create_pool(dsn, min_size=size, max_size=size))
@@ -0,0 +1,139 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+import time
+import itertools
+
+
+class ReplicaRouter(object):
+    """
+    Routes read-only queries to read replicas of the primary database.
+
+    Writes made by this server are remembered for max_lag seconds, reads of the same
+    node or job within that window go to the primary so a client always reads its own
+    writes. Replicas are assumed to replay the primary within max_lag seconds.
+
+    :param primary: pool of the primary database.
+    :param replicas: pools of the read replicas.
+    :param max_lag: seconds a write is read from the primary.
+    """
+    def __init__(self, primary, replicas, max_lag=5.0):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self._next_replica = itertools.cycle(replicas)
+        self._paths = {}
+        self._trees = {}
+        self._jobs = {}
+        self._pruned = time.monotonic()
+
+    async def close(self):
+        for replica in self.replicas:
+            await replica.close()
+
+    def _expiry(self):
+        now = time.monotonic()
+        if now - self._pruned > self.max_lag:
+            # drop expired writes so the maps only hold the last max_lag seconds
+            for writes in (self._paths, self._trees, self._jobs):
+                for key in [key for key, expiry in writes.items() if expiry < now]:
+                    del writes[key]
+            self._pruned = now
+        return now + self.max_lag
+
+    @classmethod
+    def _recent(cls, writes, key, now):
+        expiry = writes.get(key)
+        if expiry is None:
+            return False
+        if expiry < now:
+            del writes[key]
+            return False
+        return True
+
+    def written(self, paths):
+        """
+        :param paths: ltree paths of nodes written, their ancestors are read from the primary as well.
+        """
+        expiry = self._expiry()
+        for path in paths:
+            labels = path.split('.')
+            for level in range(len(labels) + 1):
+                self._paths['.'.join(labels[:level])] = expiry
+
+    def written_tree(self, path):
+        """
+        :param path: ltree path of a subtree written, '' for the whole space.
+        """
+        self._trees[path] = self._expiry()
+
+    def written_job(self, job_id):
+        self._jobs[str(job_id)] = self._expiry()
+
+    def _path_written(self, path):
+        now = time.monotonic()
+        if self._recent(self._paths, path, now):
+            return True
+        if not self._trees:
+            return False
+        labels = path.split('.') if path else []
+        return any(self._recent(self._trees, '.'.join(labels[:level]), now)
+                   for level in range(len(labels) + 1))
+
+    def node_pool(self, path=None):
+        """
+        Pool to read a node from.
+
+        :param path: ltree path of the node, None if the read does not depend on one node.
+        """
+        if not self.replicas or (path is not None and self._path_written(path)):
+            return self.primary
+        return next(self._next_replica)
+
+    def nodes_pool(self, paths):
+        """
+        Pool to read many nodes from, the primary if any of them was written within the lag.
+
+        :param paths: ltree paths of the nodes.
+        """
+        if not self.replicas or any(self._path_written(path) for path in paths):
+            return self.primary
+        return next(self._next_replica)
+
+    def job_pool(self, job_id):
+        """
+        Pool to read a UWS job from.
+        """
+        if not self.replicas or self._recent(self._jobs, str(job_id), time.monotonic()):
+            return self.primary
+        return next(self._next_replica)
+
+    def jobs_pool(self):
+        """
+        Pool to list UWS jobs from, the primary if this server wrote any job within the lag.
+        """
+        if not self.replicas:
+            return self.primary
+        now = time.monotonic()
+        if any(expiry >= now for expiry in self._jobs.values()):
+            return self.primary
+        return next(self._next_replica)
@@ -21,7 +21,6 @@
 
 import json
 import asyncio
-import asyncpg
 import configparser
 
 from aiohttp import web
@@ -33,11 +32,15 @@ from typing import List
 from pyvospace.core.exception import VOSpaceError, InvalidJobStateError, InvalidArgument
 from pyvospace.core.model import Properties, Protocols, Protocol, Views, View, Node, UWSJob
 
-from .view import get_node_request, delete_node_request, create_node_request, \
+from .view import get_node_request, stream_node_request, delete_node_request, create_node_request, \
     set_node_properties_request, create_transfer_request, sync_transfer_request, \
-    get_job_request, get_transfer_details_request, get_job_phase_request, modify_job_request, get_properties_request
-from .uws import UWSJobPool
+    get_job_request, get_transfer_details_request, get_job_phase_request, modify_job_request, get_properties_request, \
+    get_metrics_request, get_nodes_request, search_request, glob_request, jobs_request
+from .uws import UWSJobPool, UWSJobReaper, UWSJobWatcher
 from .database import NodeDatabase
+from .cache import NodeCache, UserCache
+from .replica import ReplicaRouter
+from .pools import create_metered_pool
 from .auth import SpacePermission
 
 
@@ -195,10 +198,15 @@ class SpaceServer(web.Application, SpacePermission):
         self.router.add_get('/vospace/properties', self._get_properties)
         self.router.add_get('/vospace/protocols', self._get_protocols)
         self.router.add_get('/vospace/views', self._get_views)
+        self.router.add_get('/vospace/metrics', self._get_metrics)
+        self.router.add_post('/vospace/getnodes', self._get_nodes)
+        self.router.add_get('/vospace/search', self._search)
+        self.router.add_get('/vospace/glob', self._glob)
         self.router.add_get('/vospace/nodes/{name:.*}', self._get_node)
         self.router.add_put('/vospace/nodes/{name:.*}', self._create_node)
         self.router.add_post('/vospace/nodes/{name:.*}', self._set_node_properties)
         self.router.add_delete('/vospace/nodes/{name:.*}', self._delete_node)
+        self.router.add_get('/vospace/transfers', self._get_jobs)
         self.router.add_post('/vospace/transfers', self._create_transfer)
         self.router.add_post('/vospace/synctrans', self._sync_transfer)
         self.router.add_get('/vospace/transfers/{job_id}', self._get_job)
@@ -222,7 +230,24 @@ class SpaceServer(web.Application, SpacePermission):
         self['space_name'] = self.config['Space']['name']
         self['uri'] = self.config['Space']['uri']
         self['parameters'] = json.loads(self.config['Space']['parameters'])
-        db_pool = await asyncpg.create_pool(dsn=self.config['Space']['dsn'])
+        self['stream_listings'] = self.config.getboolean('Space', 'stream_listings', fallback=False)
+        self['bulk_nodes_limit'] = self.config.getint('Space', 'bulk_nodes_limit', fallback=10000)
+        self['search_limit'] = self.config.getint('Space', 'search_limit', fallback=1000)
+        self['job_list_limit'] = self.config.getint('Space', 'job_list_limit', fallback=1000)
+        self['job_wait_limit'] = self.config.getint('Space', 'job_wait_limit', fallback=60)
+        job_reaper_interval = self.config.getfloat('Space', 'job_reaper_interval', fallback=60)
+        job_reaper_batch_size = self.config.getint('Space', 'job_reaper_batch_size', fallback=1000)
+        node_cache_size = self.config.getint('Space', 'node_cache_size', fallback=0)
+        user_cache_size = self.config.getint('Space', 'user_cache_size', fallback=1000)
+        user_cache_ttl = self.config.getfloat('Space', 'user_cache_ttl', fallback=60)
+        replica_dsn = json.loads(self.config.get('Space', 'replica_dsn', fallback='[]'))
+        replica_max_lag = self.config.getfloat('Space', 'replica_max_lag', fallback=5.0)
+        interactive_pool_size = self.config.getint('Space', 'interactive_pool_size', fallback=10)
+        bulk_pool_size = self.config.getint('Space', 'bulk_pool_size', fallback=4)
+        # Requests and long running move/copy jobs draw from separate pools so a
+        # bulk job can not starve interactive requests of connections.
+        db_pool = await create_metered_pool('interactive', self.config['Space']['dsn'], interactive_pool_size)
+        bulk_pool = await create_metered_pool('bulk', self.config['Space']['dsn'], bulk_pool_size)
         space_id = await register_space(db_pool,
                                         self['space_name'],
                                         self['space_host'],
@@ -230,17 +255,65 @@ class SpaceServer(web.Application, SpacePermission):
                                         json.dumps(self['parameters']))
 
         self['db_pool'] = db_pool
+        self['bulk_pool'] = bulk_pool
+        self['pools'] = [db_pool, bulk_pool]
         self['space_id'] = space_id
-        self['executor'] = UWSJobPool(space_id, db_pool, self)
-        self['db'] = NodeDatabase(space_id, db_pool, self)
+
+        router = None
+        if replica_dsn:
+            replicas = [await create_metered_pool(f'replica{i}', dsn, interactive_pool_size)
+                        for i, dsn in enumerate(replica_dsn)]
+            self['pools'].extend(replicas)
+            router = ReplicaRouter(db_pool, replicas, replica_max_lag)
+        self['router'] = router
+
+        job_watcher = None
+        if self['job_wait_limit'] > 0:
+            job_watcher = UWSJobWatcher(space_id, router)
+            await job_watcher.setup(self.config['Space']['dsn'])
+        self['job_watcher'] = job_watcher
+        self['executor'] = UWSJobPool(space_id, db_pool, self, router, job_watcher)
+
+        job_reaper = None
+        if job_reaper_interval > 0:
+            # batched deletes are bulk work, kept off the connections serving requests
+            job_reaper = UWSJobReaper(space_id, bulk_pool, job_reaper_interval, job_reaper_batch_size)
+            job_reaper.start()
+        self['job_reaper'] = job_reaper
+
+        node_cache = None
+        if node_cache_size > 0:
+            node_cache = NodeCache(space_id, node_cache_size, router)
+            await node_cache.setup(self.config['Space']['dsn'])
+        self['node_cache'] = node_cache
+        self['db'] = NodeDatabase(space_id, db_pool, self, node_cache, router)
+
+        user_cache = UserCache(self['space_name'], db_pool, user_cache_size, user_cache_ttl)
+        await user_cache.setup(self.config['Space']['dsn'])
+        self['user_cache'] = user_cache
 
     async def shutdown(self):
         """
         Shutdown VOSpace metadata services.
         """
-        pool = self.get('db_pool')
-        if pool:
-            await pool.close()
+        job_reaper = self.get('job_reaper')
+        if job_reaper:
+            await job_reaper.close()
+        job_watcher = self.get('job_watcher')
+        if job_watcher is not None:
+            await job_watcher.close()
+        node_cache = self.get('node_cache')
+        if node_cache:
+            await node_cache.close()
+        user_cache = self.get('user_cache')
+        if user_cache:
+            await user_cache.close()
+        router = self.get('router')
+        if router:
+            await router.close()
+        for pool in (self.get('bulk_pool'), self.get('db_pool')):
+            if pool:
+                await pool.close()
 
     async def permits(self, identity, permission, context):
         autz_policy = self.get(AUTZ_KEY)
@@ -278,6 +351,16 @@ class SpaceServer(web.Application, SpacePermission):
         except Exception as g:
             return web.Response(status=500, text=str(g))
 
+    async def _get_metrics(self, request):
+        try:
+            metrics = await get_metrics_request(request)
+            return web.json_response(metrics)
+
+        except VOSpaceError as e:
+            return web.Response(status=e.code, text=e.error)
+        except Exception as g:
+            return web.Response(status=500, text=str(g))
+
     async def _set_node_properties(self, request):
         try:
             with suppress(asyncio.CancelledError):
@@ -290,12 +373,57 @@ class SpaceServer(web.Application, SpacePermission):
             return web.Response(status=500, text=str(g))
 
     async def _get_node(self, request):
+        response = None
         try:
+            # Unbounded listings are streamed when enabled, paged listings are small enough to buffer.
+            if self['stream_listings'] and not request.query.get('limit'):
+                response = web.StreamResponse(status=200)
+                return await stream_node_request(request, response)
             node = await get_node_request(request)
             return web.Response(status=200, content_type='text/xml', text=node.tostring())
         except VOSpaceError as e:
+            if response is not None and response.prepared:
+                raise
             return web.Response(status=e.code, text=e.error)
         except Exception as g:
+            if response is not None and response.prepared:
+                raise
+            return web.Response(status=500, text=str(g))
+
+    async def _get_nodes(self, request):
+        try:
+            nodes = await get_nodes_request(request)
+            return web.json_response(nodes)
+
+        except VOSpaceError as e:
+            return web.Response(status=e.code, text=e.error)
+        except Exception as g:
+            return web.Response(status=500, text=str(g))
+
+    async def _search(self, request):
+        response = web.StreamResponse(status=200)
+        try:
+            return await search_request(request, response)
+        except VOSpaceError as e:
+            if response.prepared:
+                raise
+            return web.Response(status=e.code, text=e.error)
+        except Exception as g:
+            if response.prepared:
+                raise
+            return web.Response(status=500, text=str(g))
+
+    async def _glob(self, request):
+        response = web.StreamResponse(status=200)
+        try:
+            return await glob_request(request, response)
+        except VOSpaceError as e:
+            if response.prepared:
+                raise
+            return web.Response(status=e.code, text=e.error)
+        except Exception as g:
+            if response.prepared:
+                raise
             return web.Response(status=500, text=str(g))
 
     async def _create_node(self, request):
@@ -341,6 +469,19 @@ class SpaceServer(web.Application, SpacePermission):
         except Exception as e:
             return web.Response(status=500)
 
+    async def _get_jobs(self, request):
+        response = web.StreamResponse(status=200)
+        try:
+            return await jobs_request(request, response)
+        except VOSpaceError as e:
+            if response.prepared:
+                raise
+            return web.Response(status=e.code, text=e.error)
+        except Exception as g:
+            if response.prepared:
+                raise
+            return web.Response(status=500, text=str(g))
+
     async def _get_job(self, request):
         try:
             job = await get_job_request(request)
@@ -91,7 +91,8 @@ class NGASSpaceServer(SpaceServer, AbstractSpace):
         self.authentication = DBUserAuthentication(self['space_name'], self['db_pool'])
         setup_security(self,
                        SessionIdentityPolicy(),
-                       DBUserNodeAuthorizationPolicy(self['space_name'], self['db_pool'], self.root_dir))
+                       DBUserNodeAuthorizationPolicy(self['space_name'], self['db_pool'], self.root_dir,
+                                                     self['user_cache']))
 
         self.router.add_route('POST', '/login', self.authentication.login, name='login')
         self.router.add_route('POST', '/logout', self.authentication.logout, name='logout')
@@ -103,7 +103,7 @@ class NGASStorageServer(HTTPSpaceStorageServer):
         # Does this need to be different?
         setup_security(self,
                        SessionIdentityPolicy(),
-                       DBUserNodeAuthorizationPolicy(self.name, self.db_pool, self.root_dir))
+                       DBUserNodeAuthorizationPolicy(self.name, self.db_pool, self.root_dir, self.user_cache))
 
 
     @classmethod
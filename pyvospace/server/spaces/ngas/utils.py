@@ -21,6 +21,8 @@
 
 import os
 import io
+import time
+import json
 import asyncio
 import aiohttp
 import aiofiles
@@ -173,6 +175,33 @@ async def lstat(path):
     return await loop.run_in_executor(None, os.lstat, path)
 
 
+class StatvfsCache(object):
+    """
+    statvfs of a filesystem as a JSON string, read at most once every ttl seconds.
+
+    :param ttl: seconds a result is held.
+    """
+    KEYS = ('f_bavail', 'f_bfree', 'f_blocks', 'f_bsize', 'f_favail',
+            'f_ffree', 'f_files', 'f_flag', 'f_frsize', 'f_namemax')
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._entries = {}
+
+    async def get(self, path):
+        """
+        :param path: path on the filesystem, normally the root of the space.
+        :return: JSON string of the statvfs fields.
+        """
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        struct_statvfs = await statvfs(path)
+        statfs = json.dumps(dict((key, getattr(struct_statvfs, key)) for key in self.KEYS))
+        self._entries[path] = (time.monotonic() + self.ttl, statfs)
+        return statfs
+
+
 def sync_touch(path):
     Path(path).touch()
 
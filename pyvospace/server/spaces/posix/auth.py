@@ -19,16 +19,14 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 
-import os
-import json
-
 from aiohttp import helpers, web
 from aiohttp_security.abc import AbstractAuthorizationPolicy
 from aiohttp_security import remember, forget
 from passlib.hash import pbkdf2_sha256
 
 from pyvospace.core.model import PushToSpace, Property
-from .utils import statvfs, lstat
+from pyvospace.server.cache import UserCache
+from .utils import StatvfsCache
 
 
 PROTECTED_URI = [#'ivo://ivoa.net/vospace/core#title',
@@ -54,39 +52,37 @@ PROTECTED_URI = [#'ivo://ivoa.net/vospace/core#title',
                  'ivo://ivoa.net/vospace/core#length',
                  'ivo://ivoa.net/vospace/core#mtime',
                  'ivo://ivoa.net/vospace/core#ctime',
-                 'ivo://ivoa.net/vospace/core#btime']
+                 'ivo://ivoa.net/vospace/core#btime',
+                 'ivo://icrar.org/vospace/core#treelength',
+                 'ivo://icrar.org/vospace/core#treecount']
 
 
 class DBUserNodeAuthorizationPolicy(AbstractAuthorizationPolicy):
 
-    def __init__(self, space_name, db_pool, root_dir):
+    def __init__(self, space_name, db_pool, root_dir, users=None, statfs_ttl=5):
         super().__init__()
         self.space_name = space_name
         self.db_pool = db_pool
         self.root_dir = root_dir
+        self.users = users if users is not None else UserCache(space_name, db_pool)
+        self.statfs = StatvfsCache(statfs_ttl)
 
-    def _any_value_in_lists(self, a, b):
-        return any(i in a for i in b)
+    def _any_in_groups(self, values, groups):
+        return not groups.isdisjoint(values)
 
     def _any_property_in_protected(self, a):
         return any(i.uri in PROTECTED_URI for i in a)
 
     async def authorized_userid(self, identity):
-        async with self.db_pool.acquire() as conn:
-            results = await conn.fetchrow("select * from users "
-                                          "where username=$1 and space_name=$2",
-                                          identity, self.space_name)
-        if not results:
+        user = await self.users.get(identity)
+        if not user:
             return None
-        return results['username']
+        return user.username
 
     async def permits(self, identity, permission, context=None):
-        async with self.db_pool.acquire() as conn:
-            user = await conn.fetchrow("select * from users "
-                                       "where username=$1 and space_name=$2",
-                                       identity, self.space_name)
-            if not user:
-                raise web.HTTPForbidden(f"{identity} not found.")
+        user = await self.users.get(identity)
+        if not user:
+            raise web.HTTPForbidden(f"{identity} not found.")
 
         if permission == 'createNode':
             parent = context[0]
@@ -96,13 +92,13 @@ class DBUserNodeAuthorizationPolicy(AbstractAuthorizationPolicy):
             if modify_properties is True:
                 return False
             # allow root node creation
-            if parent.path == '/' and user['admin']:
+            if parent.path == '/' and user.admin:
                 return True
             else:
                 # check if the parent container is owned by the user
                 if parent.owner == identity:
                     return True
-                return self._any_value_in_lists(parent.group_write, user['groupwrite'])
+                return self._any_in_groups(parent.group_write, user.groupwrite)
 
         elif permission == 'setNode':
             node = context
@@ -112,41 +108,31 @@ class DBUserNodeAuthorizationPolicy(AbstractAuthorizationPolicy):
                 return False
             if node.owner == identity:
                 return True
-            return self._any_value_in_lists(node.group_write, user['groupwrite'])
+            return self._any_in_groups(node.group_write, user.groupwrite)
 
         elif permission == 'getNode':
+            # length and times are read from the node row, only the filesystem
+            # statistics come from the disk and they are cached.
             node = context
-            real_path = os.path.normpath(f"{self.root_dir}/{node.path}")
-
-            struct_lstat = await lstat(real_path)
-            struct_statvfs = await statvfs(real_path)
-            struct_statvfs_dict = dict((key, getattr(struct_statvfs, key)) for key in ('f_bavail', 'f_bfree',
-                                                                                       'f_blocks', 'f_bsize',
-                                                                                       'f_favail', 'f_ffree',
-                                                                                       'f_files', 'f_flag',
-                                                                                       'f_frsize', 'f_namemax'))
-
-            prop_length = Property('ivo://ivoa.net/vospace/core#length', struct_lstat.st_size)
-            prop_btime = Property('ivo://ivoa.net/vospace/core#btime', struct_lstat.st_mtime)
-            prop_ctime = Property('ivo://ivoa.net/vospace/core#ctime', struct_lstat.st_ctime)
-            prop_mtime = Property('ivo://ivoa.net/vospace/core#mtime', struct_lstat.st_mtime)
-            prop_statfs = Property('ivo://icrar.org/vospace/core#statfs', json.dumps(struct_statvfs_dict))
-            node.add_property(prop_length)
-            node.add_property(prop_btime)
-            node.add_property(prop_ctime)
-            node.add_property(prop_mtime)
-            node.add_property(prop_statfs)
+            statfs = await self.statfs.get(self.root_dir)
+            node.add_property(Property('ivo://icrar.org/vospace/core#statfs', statfs))
+            return True
+
+        elif permission == 'getNodes':
+            statfs = await self.statfs.get(self.root_dir)
+            for node in context:
+                node.add_property(Property('ivo://icrar.org/vospace/core#statfs', statfs))
             return True
 
         elif permission in ('moveNode', 'copyNode'):
             src = context[0]
             dest = context[1]
-            if dest.path == '/' and user['admin']:
+            if dest.path == '/' and user.admin:
                 return True
             if src.owner == identity and dest.owner == identity:
                 return True
-            if self._any_value_in_lists(src.group_write, user['groupwrite']) and \
-                    self._any_value_in_lists(dest.group_write, user['groupwrite']):
+            if self._any_in_groups(src.group_write, user.groupwrite) and \
+                    self._any_in_groups(dest.group_write, user.groupwrite):
                 return True
             return False
 
@@ -157,17 +143,17 @@ class DBUserNodeAuthorizationPolicy(AbstractAuthorizationPolicy):
             node = context
             if node.owner == identity:
                 return True
-            return self._any_value_in_lists(node.group_write, user['groupwrite'])
+            return self._any_in_groups(node.group_write, user.groupwrite)
 
         elif permission == 'dataTransfer':
             job = context
             if job.transfer.target.owner == identity:
                 return True
             if isinstance(job.transfer, PushToSpace):
-                return self._any_value_in_lists(job.transfer.target.group_write, user['groupwrite'])
+                return self._any_in_groups(job.transfer.target.group_write, user.groupwrite)
             else:
-                return self._any_value_in_lists(job.transfer.target.group_read, user['groupread']) or \
-                       self._any_value_in_lists(job.transfer.target.group_write, user['groupwrite'])
+                return self._any_in_groups(job.transfer.target.group_read, user.groupread) or \
+                       self._any_in_groups(job.transfer.target.group_write, user.groupwrite)
 
         elif permission in ('runJob', 'abortJob'):
             job = context
@@ -79,7 +79,7 @@ class PosixStorageServer(HTTPSpaceStorageServer):
 
         setup_security(self,
                        SessionIdentityPolicy(),
-                       DBUserNodeAuthorizationPolicy(self.name, self.db_pool, self.root_dir))
+                       DBUserNodeAuthorizationPolicy(self.name, self.db_pool, self.root_dir, self.user_cache))
 
     @classmethod
     async def create(cls, cfg_file, *args, **kwargs):
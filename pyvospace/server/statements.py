@@ -0,0 +1,195 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import time
+import asyncpg
+
+from collections import OrderedDict
+
+from pyvospace.core.exception import InvalidArgument
+
+
+class PreparedConnection(asyncpg.Connection):
+    """
+    Connection holding the statements of a :class:`StatementRegistry` prepared by name.
+
+    asyncpg invalidates the prepared statements of a connection released to its pool,
+    :class:`~pyvospace.server.pools.MeteredPool` keeps its connections checked out so
+    the statements stay prepared for the life of the connection.
+    """
+    __slots__ = ('prepared_statements',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = {}
+
+
+class Statement(object):
+    def __init__(self, name, sql, prepare=True):
+        self.name = name
+        self.sql = sql
+        self.prepare = prepare
+        self.calls = 0
+        self.elapsed = 0.0
+
+    def todict(self):
+        return {'calls': self.calls,
+                'total_ms': self.elapsed * 1000,
+                'mean_ms': self.elapsed * 1000 / self.calls if self.calls else 0.0}
+
+
+class StatementCursor(object):
+    """
+    Server side cursor of a registered statement, time spent fetching is recorded against the statement.
+    """
+    def __init__(self, statement, cursor):
+        self.statement = statement
+        self.cursor = cursor
+
+    async def fetch(self, n):
+        start = time.perf_counter()
+        try:
+            return await self.cursor.fetch(n)
+        finally:
+            self.statement.elapsed += time.perf_counter() - start
+
+
+class StatementRegistry(object):
+    """
+    Named SQL statements, prepared once per connection, reused by name and timed per statement.
+
+    Pools are created with :func:`create_pool` so new connections prepare the registered statements
+    in the pool init hook. Statements registered with ``prepare=False``, e.g. the rarely used variants
+    of a query, are prepared on a connection the first time they are run on it. Connections that do not
+    hold prepared statements, e.g. a listener connection, run the SQL through the asyncpg statement cache.
+    """
+    def __init__(self):
+        self._statements = OrderedDict()
+
+    def register(self, name, sql, prepare=True):
+        """
+        Register a statement.
+
+        :param name: name the statement is run by.
+        :param sql: SQL of the statement.
+        :param prepare: prepare the statement when a pooled connection is created,
+                        otherwise when it is first run on the connection.
+        """
+        statement = self._statements.get(name)
+        if statement:
+            if statement.sql != sql:
+                raise InvalidArgument(f'statement {name} already registered.')
+            return statement
+        statement = Statement(name, sql, prepare)
+        self._statements[name] = statement
+        return statement
+
+    def __contains__(self, name):
+        return name in self._statements
+
+    def __getitem__(self, name):
+        return self._statements[name]
+
+    async def init(self, conn):
+        """
+        Pool init hook, prepares the registered statements on a new connection.
+        """
+        if not isinstance(conn, PreparedConnection):
+            return
+        for statement in self._statements.values():
+            if statement.prepare:
+                conn.prepared_statements[statement.name] = await conn.prepare(statement.sql)
+
+    @classmethod
+    async def _prepared(cls, conn, statement, reprepare=False):
+        prepared_statements = getattr(conn, 'prepared_statements', None)
+        if prepared_statements is None:
+            return None
+        stmt = prepared_statements.get(statement.name)
+        if stmt is None or reprepare:
+            stmt = prepared_statements[statement.name] = await conn.prepare(statement.sql)
+        return stmt
+
+    async def _run(self, conn, name, method, *args):
+        statement = self._statements[name]
+        start = time.perf_counter()
+        try:
+            stmt = await self._prepared(conn, statement)
+            if stmt is None:
+                return await getattr(conn, method)(statement.sql, *args)
+            try:
+                return await getattr(stmt, method)(*args)
+            except asyncpg.exceptions.InvalidCachedStatementError:
+                if conn.is_in_transaction():
+                    raise
+                # the schema changed under the statement, prepare it again
+                stmt = await self._prepared(conn, statement, reprepare=True)
+                return await getattr(stmt, method)(*args)
+        finally:
+            statement.calls += 1
+            statement.elapsed += time.perf_counter() - start
+
+    async def fetch(self, conn, name, *args):
+        return await self._run(conn, name, 'fetch', *args)
+
+    async def fetchrow(self, conn, name, *args):
+        return await self._run(conn, name, 'fetchrow', *args)
+
+    async def fetchval(self, conn, name, *args):
+        return await self._run(conn, name, 'fetchval', *args)
+
+    async def execute(self, conn, name, *args):
+        # PreparedStatement has no execute, fetch returns no rows for statements without a result
+        await self._run(conn, name, 'fetch', *args)
+
+    async def executemany(self, conn, name, args):
+        return await self._run(conn, name, 'executemany', args)
+
+    async def cursor(self, conn, name, *args):
+        """
+        Open a server side cursor, the time to open it and to fetch from it is recorded.
+
+        :return: :class:`StatementCursor`
+        """
+        return StatementCursor(self._statements[name], await self._run(conn, name, 'cursor', *args))
+
+    def stats(self):
+        """
+        Per statement call counts and timings.
+
+        :return: dict of name to {'calls', 'total_ms', 'mean_ms'}
+        """
+        return {name: statement.todict() for name, statement in self._statements.items()}
+
+
+statements = StatementRegistry()
+
+
+async def create_pool(dsn, **kwargs):
+    """
+    Create an asyncpg pool whose connections prepare the registered statements when they are created.
+
+    :param dsn: connection string to the database.
+    :param kwargs: passed to asyncpg.create_pool.
+    :return: asyncpg pool.
+    """
+    return await asyncpg.create_pool(dsn=dsn, connection_class=PreparedConnection,
+                                     init=statements.init, **kwargs)
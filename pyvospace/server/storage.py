@@ -21,7 +21,6 @@
 
 import json
 import asyncio
-import asyncpg
 import aiohttp
 import configparser
 
@@ -36,6 +35,9 @@ from pyvospace.core.exception import VOSpaceError, PermissionDenied, NodeBusyErr
     InvalidJobStateError, NodeDoesNotExistError
 from .auth import SpacePermission
 from .uws import StorageUWSJobPool, StorageUWSJob
+from .statements import statements
+from .pools import create_metered_pool
+from .cache import UserCache
 
 
 class HTTPSpaceStorageServer(web.Application, SpacePermission):
@@ -59,6 +61,8 @@ class HTTPSpaceStorageServer(web.Application, SpacePermission):
         self.parameters = json.loads(self.config.get('Storage', 'parameters'))
         self.space_id = None
         self.db_pool = None
+        self.transaction_pool = None
+        self.user_cache = None
         self.executor = None
         self.heartbeat = None
         self.storage = None
@@ -68,7 +72,12 @@ class HTTPSpaceStorageServer(web.Application, SpacePermission):
         Setup HTTP based storage backend.
         """
         dsn = self.config.get('Space', 'dsn')
-        self.db_pool = await asyncpg.create_pool(dsn=dsn)
+        pool_size = self.config.getint('Storage', 'pool_size', fallback=10)
+        transaction_pool_size = self.config.getint('Storage', 'transaction_pool_size', fallback=10)
+        self.db_pool = await create_metered_pool('storage', dsn, pool_size)
+        # Uploads and downloads hold a transaction for the whole transfer,
+        # they get their own pool so job reads and updates are not starved.
+        self.transaction_pool = await create_metered_pool('storage_transaction', dsn, transaction_pool_size)
         async with self.db_pool.acquire() as conn:
             async with conn.transaction():
                 space_result = await conn.fetchrow("select * from space where name=$1 for update",
@@ -85,8 +94,13 @@ class HTTPSpaceStorageServer(web.Application, SpacePermission):
                 self.storage = Storage(result['id'], result['name'], result['host'], result['port'],
                                        result['parameters'], result['https'], result['enabled'])
 
+        self.user_cache = UserCache(self.name, self.db_pool,
+                                    self.config.getint('Storage', 'user_cache_size', fallback=1000),
+                                    self.config.getfloat('Storage', 'user_cache_ttl', fallback=60))
+        await self.user_cache.setup(dsn)
+
         self.executor = StorageUWSJobPool(self.space_id, self.storage, self.db_pool,
-                                          self.config.get('Space', 'dsn'), self)
+                                          self.config.get('Space', 'dsn'), self, self.transaction_pool)
         await self.executor.setup()
         self['AIOJOBS_SCHEDULER'] = await create_scheduler()
         self.set_router()
@@ -112,9 +126,19 @@ class HTTPSpaceStorageServer(web.Application, SpacePermission):
         raise NotImplementedError()
 
     def set_router(self):
+        self.router.add_get('/vospace/metrics', self.metrics_request)
         self.router.add_put('/vospace/{direction}/{job_id}', self.upload_request)
         self.router.add_get('/vospace/{direction}/{job_id}', self.download_request)
 
+    async def metrics_request(self, request):
+        identity = await authorized_userid(request)
+        if identity is None:
+            e = PermissionDenied('Credentials not found.')
+            return web.Response(status=e.code, text=e.error)
+        return web.json_response({'statements': statements.stats(),
+                                  'pools': {pool.name: pool.metrics()
+                                            for pool in (self.db_pool, self.transaction_pool)}})
+
     async def upload_request(self, request):
         job_id = request.match_info.get('job_id', None)
         job = await spawn(request, self.execute_storage_job(request, job_id, self.upload))
@@ -137,6 +161,8 @@ class HTTPSpaceStorageServer(web.Application, SpacePermission):
         """
         await self['AIOJOBS_SCHEDULER'].close()
         await self.executor.close()
+        await self.user_cache.close()
+        await self.transaction_pool.close()
         await self.db_pool.close()
 
     async def execute_storage_job(self, request, job_id, func):
@@ -30,6 +30,44 @@ from pyvospace.core.model import UWSPhase, UWSResult, NodeTransfer, ProtocolTran
     NodeType, DataNode, ContainerNode
 from pyvospace.server import fuzz
 from .database import NodeDatabase
+from .statements import statements
+
+
+# lock the target tree, the direction and its parent
+statements.register('lock_move', "select *, path = subltree($2, 0, nlevel(path)) as common "
+                                 "from nodes where path <@ $1 or path <@ $3 and space_id=$4 "
+                                 "order by path asc for update")
+
+statements.register('lock_move_root', "select *, path = subltree($2, 0, nlevel(path)) as common "
+                                      "from nodes where path <@ $1 or path <@ $2 and space_id=$3 "
+                                      "order by path asc for update")
+
+statements.register('copy_tree', "insert into nodes(name, type, owner, groupread, groupwrite, "
+                                 "space_id, link, size, mtime, path) "
+                                 "(select name, type, owner, groupread, groupwrite, "
+                                 "space_id, link, size, mtime, $2||subpath(path, nlevel($1)-1) as concat "
+                                 "from nodes where path <@ $1 and space_id=$3)")
+
+# Runs after copy_tree, the properties of the subtree are copied on the server.
+statements.register('copy_tree_properties', "insert into properties (uri, value, read_only, space_id, node_path) "
+                                            "(select properties.uri, properties.value, "
+                                            "properties.read_only, properties.space_id, "
+                                            "$2||subpath(properties.node_path, nlevel($1)-1) as concat "
+                                            "from nodes inner join properties on "
+                                            "nodes.path = properties.node_path and "
+                                            "nodes.space_id = properties.space_id "
+                                            "where nodes.path <@ $1 and nodes.space_id=$3)")
+
+# Behave the same way as a linux mv command.
+# mv /test/test1 /test/test2 - rename test1 to test2
+# mv /test/test1 /test/dir/test1 - move file to /test/dir/
+# mv /test/test1 /test/dir/test2 - move file to /test/dir/ and rename to test2
+statements.register('move_tree', "update nodes set name = ("
+                                 "case when nlevel(subpath(path, nlevel($1)-1))=1 then $4 else name end), "
+                                 "path = $2||regexp_replace(subpath(path, nlevel($1)-1)::text, "
+                                 "subpath(subpath(path, nlevel($1)-1), 0, 1)::text||'*', "
+                                 "subpath($3, -1, 1)::text)::ltree "
+                                 "where path <@ $1 and space_id=$5")
 
 
 async def perform_transfer_job(job, app, identity, sync, redirect=False):
@@ -49,7 +87,7 @@ async def _perform_transfer_job(job, app, identity, sync, redirect):
         if isinstance(job.job_info, ProtocolTransfer):
 
             async with db_pool.acquire() as conn:
-                async with conn.transaction():
+                async with app['db'].transaction(conn):
                     _, child_row = await app['db']._get_node_and_parent(job.job_info.target.path, conn)
                     if isinstance(job.job_info, PushToSpace):
                         # If there is no Node at the target URI, then the service SHALL
@@ -157,18 +195,16 @@ async def _move_nodes(app, target, direction, perform_copy, identity):
         else:
             direction_path_parent_tree = ''
 
-        async with app['db_pool'].acquire() as conn:
-            async with conn.transaction():
+        async with app['bulk_pool'].acquire() as conn:
+            async with app['db'].transaction(conn):
                 target_record = None
                 direct_record = None
                 direct_parent_record = None
 
                 if direction_path_parent_tree:
-                    results = await conn.fetch("select *, path = subltree($2, 0, nlevel(path)) as common "
-                                               "from nodes where path <@ $1 or path <@ $3 and space_id=$4 "
-                                               "order by path asc for update",
-                                               target_path_tree, direction_path_tree,
-                                               direction_path_parent_tree, space_id)
+                    results = await statements.fetch(conn, 'lock_move',
+                                                     target_path_tree, direction_path_tree,
+                                                     direction_path_parent_tree, space_id)
                     for result in results:
                         if result['path'] == target_path_tree:
                             target_record = result
@@ -179,10 +215,8 @@ async def _move_nodes(app, target, direction, perform_copy, identity):
                         if target_record and direct_record:
                             break
                 else:
-                    results = await conn.fetch("select *, path = subltree($2, 0, nlevel(path)) as common "
-                                               "from nodes where path <@ $1 or path <@ $2 and space_id=$3 "
-                                               "order by path asc for update",
-                                               target_path_tree, direction_path_tree, space_id)
+                    results = await statements.fetch(conn, 'lock_move_root',
+                                                     target_path_tree, direction_path_tree, space_id)
                     for result in results:
                         if result['path'] == target_path_tree:
                             target_record = result
@@ -222,49 +256,26 @@ async def _move_nodes(app, target, direction, perform_copy, identity):
                     if not await app.permits(identity, 'copyNode', context=(src, dest_parent)):
                         raise PermissionDenied('copyNode denied.')
 
-                    prop_results = await conn.fetch("select properties.uri, properties.value, "
-                                                    "properties.read_only, properties.space_id, "
-                                                    "$2||subpath(node_path, nlevel($1)-1) as concat "
-                                                    "from nodes inner join properties on "                    
-                                                    "nodes.path = properties.node_path and "
-                                                    "nodes.space_id = properties.space_id "
-                                                    "where nodes.path <@ $1 and nodes.space_id=$3",
-                                                    target_path_tree, direction_path_parent_tree, space_id)
-
-                    await conn.execute("insert into nodes(name, type, owner, groupread, groupwrite, "
-                                       "space_id, link, path) "
-                                       "(select name, type, owner, groupread, groupwrite, "
-                                       "space_id, link, $2||subpath(path, nlevel($1)-1) as concat "
-                                       "from nodes where path <@ $1 and space_id=$3)",
-                                       target_path_tree, direction_path_parent_tree, space_id)
-
-                    user_props_insert = []
-                    for prop in prop_results:
-                        user_props_insert.append(tuple(prop))
-
-                    await conn.executemany("insert into properties (uri, value, read_only, space_id, node_path) "
-                                           "values ($1, $2, $3, $4, $5)",
-                                           user_props_insert)
+                    await statements.execute(conn, 'copy_tree',
+                                             target_path_tree, direction_path_parent_tree, space_id)
+
+                    await statements.execute(conn, 'copy_tree_properties',
+                                             target_path_tree, direction_path_parent_tree, space_id)
 
                     await app['abstract_space'].copy_storage_node(src, dest)
                 else:
                     if not await app.permits(identity, 'moveNode', context=(src, dest_parent)):
                         raise PermissionDenied('moveNode denied.')
 
-                    # Behave the same way as a linux mv command.
-                    # mv /test/test1 /test/test2 - rename test1 to test2
-                    # mv /test/test1 /test/dir/test1 - move file to /test/dir/
-                    # mv /test/test1 /test/dir/test2 - move file to /test/dir/ and rename to test2
-                    await conn.execute("update nodes set name = ("
-                                       "case when nlevel(subpath(path, nlevel($1)-1))=1 then $4 else name end), "
-                                       "path = $2||regexp_replace(subpath(path, nlevel($1)-1)::text, "
-                                       "subpath(subpath(path, nlevel($1)-1), 0, 1)::text||'*', "
-                                       "subpath($3, -1, 1)::text)::ltree "
-                                       "where path <@ $1 and space_id=$5",
-                                       target_path_tree, direction_path_parent_tree,
-                                       direction_path_tree, direction.name, space_id)
+                    await statements.execute(conn, 'move_tree',
+                                             target_path_tree, direction_path_parent_tree,
+                                             direction_path_tree, direction.name, space_id)
 
                     await app['abstract_space'].move_storage_node(src, dest)
+                    app['db'].invalidate([target_path_tree], conn)
+                    app['db'].invalidate_tree(target_path_tree, conn)
+
+                app['db'].invalidate([direction_path_tree], conn)
 
     except asyncpg.exceptions.UniqueViolationError as f:
         raise VOSpaceError(409, f"Duplicate Node. {f.detail}")
@@ -24,52 +24,355 @@ import asyncio
 import functools
 import asyncpg
 import json
+import uuid
 
-from contextlib import suppress
+from contextlib import suppress, contextmanager, nullcontext
 
-from pyvospace.core.model import UWSPhase, UWSJob, UWSResult, Transfer, \
+from pyvospace.core.model import UWSPhase, UWSJob, UWSJobRef, UWSResult, Transfer, \
     ProtocolTransfer, Copy, Move, Node, ContainerNode
 from pyvospace.core.exception import VOSpaceError, JobDoesNotExistError, InvalidJobError, \
-    InvalidJobStateError, PermissionDenied, NodeDoesNotExistError, ClosingError, NodeBusyError
+    InvalidJobStateError, PermissionDenied, NodeDoesNotExistError, ClosingError, NodeBusyError, InvalidArgument
 from .database import NodeDatabase
+from .statements import statements
 from pyvospace.server import busy_fuzz
 
 
+statements.register('uws_job_phase', "select phase, owner from uws_jobs where id=$1 and space_id=$2")
+
+statements.register('uws_job', "select * from uws_jobs where id=$1 and space_id=$2")
+
+statements.register('uws_job_for_update', "select * from uws_jobs where id=$1 and space_id=$2 for update")
+
+statements.register('insert_uws_job', "insert into uws_jobs "
+                                      "(phase, destruction, job_info, owner, space_id, job_info_json) "
+                                      "values ($1, $2, $3, $4, $5, $6) returning *")
+
+statements.register('update_uws_job', "with cte as "
+                                      "(select id, space_id, phase from uws_jobs "
+                                      "where id=$7 and space_id=$8 for update) "
+                                      "update uws_jobs set phase=$1, results=$2, "
+                                      "transfer=$3, node_path=$4, node_path_modified=$5, transfer_json=$9 "
+                                      "from cte where cte.phase<=$6 and "
+                                      "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
+                                      "returning cte.id")
+
+# move a job from one phase to another
+statements.register('transition_uws_job', "with cte as (select id, space_id, phase from uws_jobs "
+                                          "where id=$1 and space_id=$4 for update)"
+                                          "update uws_jobs set phase=$2 "
+                                          "from cte where cte.phase=$3 and "
+                                          "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
+                                          "returning cte.id")
+
+statements.register('set_uws_job_error', "with cte as (select id, space_id, phase from uws_jobs "
+                                         "where id=$1 and space_id=$5 for update)"
+                                         "update uws_jobs set phase=$3, error=$2 "
+                                         "from cte where cte.phase!=$4 and "
+                                         "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
+                                         "returning cte.id")
+
+statements.register('set_uws_job_aborted', "with cte as (select id, space_id, phase from uws_jobs "
+                                           "where id=$1 and space_id=$4 for update)"
+                                           "update uws_jobs set phase=$2 "
+                                           "from cte where cte.phase=any($3::integer[]) and "
+                                           "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
+                                           "returning cte.id")
+
+# jobs of an owner newest first, keyset paged on (creation, id)
+statements.register('uws_jobs_list', "select id, phase, owner, creation from uws_jobs "
+                                     "where space_id=$1 and owner=$2 and phase=any($3::integer[]) "
+                                     "and creation > $4 and (creation, id) < ($5, $6) "
+                                     "order by creation desc, id desc limit $7")
+
+statements.register('uws_job_creation', "select creation from uws_jobs where id=$1 and space_id=$2 and owner=$3")
+
+# destruction is written in utc without a time zone, only run by the reaper
+# so it is prepared on the connection it first runs on
+statements.register('reap_uws_jobs', "with expired as "
+                                     "(select id from uws_jobs where space_id=$1 "
+                                     "and destruction < (now() at time zone 'utc') "
+                                     "and phase=any($2::integer[]) limit $3 for update skip locked), "
+                                     "deleted as (delete from uws_jobs using expired "
+                                     "where uws_jobs.id=expired.id returning 1) "
+                                     "select count(*) from deleted", prepare=False)
+
+for _lock in ('update', 'share', 'update nowait'):
+    statements.register(f"lock_tree_{_lock.replace(' ', '_')}", f"""
+        with node_cte as 
+        (select * from nodes where path <@ $1 and space_id=$2 
+        order by nlevel(path) asc for {_lock} of nodes)
+        select node_cte.*, nlevel(node_cte.path), 
+        storage.name as space_name, 
+        storage.host, storage.port, storage.parameters, 
+        storage.https, storage.enabled from node_cte 
+        left join storage on node_cte.storage_id=storage.id 
+        order by nlevel(node_cte.path) asc""")
+
+statements.register('tree_properties', "select * from properties "
+                                       "where node_path=any($1::ltree[]) and space_id=$2")
+
+
+def resultset_to_transfer(result, column):
+    """
+    Read a transfer from its JSON column, or parse its XML column for jobs written before the JSON was stored.
+
+    :param result: uws_jobs row.
+    :param column: 'job_info' or 'transfer'.
+    :return: :func:`Transfer <pyvospace.core.model.Transfer>` or None
+    """
+    value = result[f'{column}_json']
+    if value is not None:
+        return Transfer.fromdict(json.loads(value))
+    if result[column] is None:
+        return None
+    return Transfer.fromstring(result[column])
+
+
+def resultset_to_jobref(result):
+    """
+    :param result: uws_jobs row holding id, phase, owner and creation.
+    :return: :func:`UWSJobRef <pyvospace.core.model.UWSJobRef>`
+    """
+    return UWSJobRef(result['id'], result['phase'], result['owner'], f"{result['creation'].isoformat()}Z")
+
+
+class JobWatch(object):
+    """
+    Phase change of one job, set by :class:`UWSJobWatcher`.
+    """
+    __slots__ = ('phase', 'event')
+
+    def __init__(self):
+        self.phase = None
+        self.event = asyncio.Event()
+
+    def notify(self, phase):
+        self.phase = phase
+        self.event.set()
+
+
+class UWSJobWatcher(object):
+    """
+    Wakes requests waiting on a job phase change, through the uws_jobs channel notified by
+    triggers on uws_jobs.
+
+    One listener connection serves every waiting request, so a request costs no query while
+    it waits. Without a listener requests do not wait.
+
+    :param space_id: id of the space.
+    :param router: :class:`ReplicaRouter <pyvospace.server.replica.ReplicaRouter>` told of watched
+                   jobs that changed, so they are read from the primary while replicas catch up.
+    """
+    # phases a job leaves without a request from its owner
+    active_phases = (UWSPhase.Pending, UWSPhase.Queued, UWSPhase.Executing)
+
+    def __init__(self, space_id, router=None):
+        self.space_id = space_id
+        self.router = router
+        self.listener = None
+        self._watches = {}
+
+    @property
+    def enabled(self):
+        return self.listener is not None
+
+    async def setup(self, dsn):
+        self.listener = await asyncpg.connect(dsn=dsn)
+        self.listener.add_termination_listener(self._terminated_callback)
+        await self.listener.add_listener('uws_jobs', self._jobs_callback)
+
+    async def close(self):
+        listener = self.listener
+        self.listener = None
+        self._notify_all()
+        if listener:
+            await listener.close()
+
+    def _terminated_callback(self, connection):
+        # Without the listener changes can not be seen, wake every request to read the job again.
+        self.listener = None
+        self._notify_all()
+
+    def _notify_all(self):
+        for watches in self._watches.values():
+            for watch in watches:
+                watch.notify(None)
+
+    def _jobs_callback(self, connection, pid, channel, payload):
+        job = json.loads(payload)
+        if int(job['row']['space_id']) != self.space_id:
+            return
+        job_id = str(job['row']['id'])
+        watches = self._watches.get(job_id)
+        if not watches:
+            return
+        if self.router:
+            self.router.written_job(job_id)
+        # a deleted job is read again to report it does not exist
+        phase = job['row']['phase'] if job['action'] != 'DELETE' else None
+        for watch in watches:
+            watch.notify(phase)
+
+    def __len__(self):
+        return sum(len(watches) for watches in self._watches.values())
+
+    def metrics(self):
+        return {'listening': self.enabled,
+                'waiting': len(self)}
+
+    @contextmanager
+    def watch(self, job_id):
+        """
+        Watch a job for phase changes. Start watching before the phase is read so no change is missed.
+
+        :param job_id: id of the job.
+        :return: :class:`JobWatch` or None if changes can not be seen.
+        """
+        if not self.enabled:
+            yield None
+            return
+        job_id = str(job_id)
+        watch = JobWatch()
+        self._watches.setdefault(job_id, set()).add(watch)
+        try:
+            yield watch
+        finally:
+            watches = self._watches.get(job_id)
+            if watches is not None:
+                watches.discard(watch)
+                if not watches:
+                    del self._watches[job_id]
+
+    @classmethod
+    async def wait(cls, watch, phase, timeout):
+        """
+        Wait for a job to leave a phase.
+
+        :param watch: :class:`JobWatch` of the job.
+        :param phase: phase the job was read in.
+        :param timeout: seconds to wait.
+        :return: phase the job changed to, phase if it did not change within timeout
+                 or None if it must be read again.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return phase
+            try:
+                await asyncio.wait_for(watch.event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return phase
+            watch.event.clear()
+            # a notification can carry the phase that was read
+            if watch.phase != phase:
+                return watch.phase
+
+
 class UWSJobPool(object):
-    def __init__(self, space_id, db_pool, permission):
+    # bound of the keyset before the first page, greater than any (creation, id)
+    _first_page = (datetime.datetime.max, uuid.UUID(int=(1 << 128) - 1))
+
+    def __init__(self, space_id, db_pool, permission, router=None, watcher=None):
         self.db_pool = db_pool
         self.space_id = space_id
         self.executor = UWSJobExecutor(space_id)
         self.permission = permission
+        self.router = router
+        self.watcher = watcher
+
+    def _read_pool(self, job_id):
+        # a job changed by this server is read from the primary until replicas catch up
+        if self.router is None:
+            return self.db_pool
+        return self.router.job_pool(job_id)
+
+    def _written(self, job_id):
+        if self.router is not None:
+            self.router.written_job(job_id)
 
     async def close(self):
         await self.executor.close()
 
-    async def get_uws_job_phase(self, job_id):
-        async with self.db_pool.acquire() as conn:
+    def jobs_read_pool(self):
+        if self.router is None:
+            return self.db_pool
+        return self.router.jobs_pool()
+
+    async def jobs_cursor(self, conn, owner, phases, after=None, cursor=None, limit=1000):
+        """
+        List the jobs of an owner newest first, through a server side cursor.
+        Must be called within a transaction.
+
+        :param conn: connection to read from.
+        :param owner: owner of the jobs.
+        :param phases: list of :func:`Phase <pyvospace.core.model.UWSPhase>` listed.
+        :param after: utc datetime, only jobs created after it.
+        :param cursor: id of the last job of the previous page.
+        :param limit: maximum number of jobs.
+        :return: asyncpg cursor of uws_jobs rows, see :func:`resultset_to_jobref`.
+        """
+        before = self._first_page
+        if cursor is not None:
+            try:
+                cursor_id = uuid.UUID(cursor)
+            except ValueError:
+                raise InvalidArgument(f'cursor invalid: {cursor}')
+            creation = await statements.fetchval(conn, 'uws_job_creation', cursor_id, self.space_id, owner)
+            if creation is None:
+                raise InvalidArgument(f'cursor invalid: {cursor}')
+            before = (creation, cursor_id)
+        return await statements.cursor(conn, 'uws_jobs_list', self.space_id, owner, phases,
+                                       after or datetime.datetime.min, *before, limit)
+
+    async def get_uws_job_phase(self, job_id, primary=False):
+        pool = self.db_pool if primary else self._read_pool(job_id)
+        async with pool.acquire() as conn:
             async with conn.transaction():
-                result = await conn.fetchrow("select phase, owner from uws_jobs "
-                                             "where id=$1 and space_id=$2",
-                                             job_id, self.space_id)
+                result = await statements.fetchrow(conn, 'uws_job_phase', job_id, self.space_id)
                 if not result:
                     raise JobDoesNotExistError("Job does not exist")
                 return result
 
+    async def wait_uws_job_phase(self, job_id, identity, wait=0, phase=None):
+        """
+        Phase of a job, waiting up to wait seconds for it to change while the job is
+        PENDING, QUEUED or EXECUTING. Only the owner of the job can read it.
+
+        :param job_id: id of the job.
+        :param identity: identity of the user.
+        :param wait: seconds to wait.
+        :param phase: only wait while the job is in this phase.
+        :return: :func:`Phase <pyvospace.core.model.UWSPhase>`
+        """
+        watching = self.watcher.watch(job_id) if self.watcher is not None and wait > 0 else nullcontext()
+        with watching as watch:
+            # a replica could still hold a phase the job has already left and the request would
+            # wait for a change that was notified before the watch started
+            result = await self.get_uws_job_phase(job_id, primary=watch is not None)
+            if identity != result['owner']:
+                raise PermissionDenied(f'{identity} is not the owner of the job.')
+            current = result['phase']
+            if watch is None or current not in UWSJobWatcher.active_phases or \
+                    (phase is not None and phase != current):
+                return current
+            changed = await UWSJobWatcher.wait(watch, current, wait)
+        if changed is None:
+            return (await self.get_uws_job_phase(job_id, primary=True))['phase']
+        return changed
+
     async def get_uws_job(self, job_id):
-        async with self.db_pool.acquire() as conn:
+        async with self._read_pool(job_id).acquire() as conn:
             async with conn.transaction(isolation='read_committed'):
                 return await self._get_uws_job_conn(conn, job_id)
 
     async def _get_uws_job_conn(self, conn, job_id, for_update=False):
         try:
             if for_update:
-                result = await conn.fetchrow("select * from uws_jobs "
-                                             "where id=$1 and space_id=$2 for update",
-                                             job_id, self.space_id)
+                result = await statements.fetchrow(conn, 'uws_job_for_update', job_id, self.space_id)
             else:
-                result = await conn.fetchrow("select * from uws_jobs "
-                                             "where id=$1 and space_id=$2",
-                                             job_id, self.space_id)
+                result = await statements.fetchrow(conn, 'uws_job', job_id, self.space_id)
             if not result:
                 raise VOSpaceError(404, f"Invalid Request. UWS job {job_id} does not exist.")
 
@@ -81,22 +384,16 @@ class UWSJobPool(object):
         transfer_string = job.transfer.tostring()
         results_string = job.results_tostring()
         target_tree = NodeDatabase.path_to_ltree(job.job_info.target.path)
-        result = await conn.fetchrow("with cte as "
-                                     "(select id, space_id, phase from uws_jobs "
-                                     "where id=$7 and space_id=$8 for update) "
-                                     "update uws_jobs set phase=$1, results=$2, "
-                                     "transfer=$3, node_path=$4, node_path_modified=$5 "
-                                     "from cte where cte.phase<=$6 and "
-                                     "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
-                                     "returning cte.id",
-                                     job.phase, results_string, transfer_string,
-                                     target_tree, job.node_path_modified, UWSPhase.Executing,
-                                     job.job_id, self.space_id)
+        result = await statements.fetchrow(conn, 'update_uws_job',
+                                           job.phase, results_string, transfer_string,
+                                           target_tree, job.node_path_modified, UWSPhase.Executing,
+                                           job.job_id, self.space_id, json.dumps(job.transfer.todict()))
+        self._written(job.job_id)
         if not result:
             raise InvalidJobStateError('Job not found or (ABORTED, ERROR)')
 
     def _resultset_to_job(self, result):
-        job_info = Transfer.fromstring(result['job_info'])
+        job_info = resultset_to_transfer(result, 'job_info')
         results = None
         if result['results']:
             results = UWSResult.fromstring(result['results'])
@@ -106,7 +403,7 @@ class UWSJobPool(object):
         return job
 
     async def get(self, job_id):
-        async with self.db_pool.acquire() as conn:
+        async with self._read_pool(job_id).acquire() as conn:
             result = await self._get_uws_job_conn(conn=conn, job_id=job_id)
         return self._resultset_to_job(result)
 
@@ -115,9 +412,10 @@ class UWSJobPool(object):
         destruction = datetime.datetime.utcnow() + datetime.timedelta(seconds=3000)
         async with self.db_pool.acquire() as conn:
             async with conn.transaction():
-                result = await conn.fetchrow("insert into uws_jobs (phase, destruction, job_info, owner, space_id) "
-                                             "values ($1, $2, $3, $4, $5) returning *",
-                                             phase, destruction, job_info_string, identity, self.space_id)
+                result = await statements.fetchrow(conn, 'insert_uws_job',
+                                                   phase, destruction, job_info_string, identity, self.space_id,
+                                                   json.dumps(job_info.todict()))
+        self._written(result['id'])
         return self._resultset_to_job(result)
 
     async def execute(self, job_id, identity, func, *args):
@@ -133,6 +431,7 @@ class UWSJobPool(object):
                     raise PermissionDenied('runJob denied.')
 
                 fut = self.executor.execute(job, func, *args)
+        self._written(job_id)
         return await fut
 
     async def abort(self, job_id, identity):
@@ -153,6 +452,7 @@ class UWSJobPool(object):
 
                 with suppress(asyncio.CancelledError):
                     await asyncio.shield(self.set_aborted(job_id, conn))
+        self._written(job_id)
 
         with suppress(asyncio.CancelledError):
             await asyncio.shield(self.executor.abort(job_id))
@@ -160,48 +460,31 @@ class UWSJobPool(object):
     async def set_executing(self, job_id):
         async with self.db_pool.acquire() as conn:
             async with conn.transaction():
-                return await conn.fetchrow("with cte as (select id, space_id, phase from uws_jobs "
-                                           "where id=$1 and space_id=$4 for update)"
-                                           "update uws_jobs set phase=$2 "
-                                           "from cte where cte.phase=$3 and "
-                                           "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
-                                           "returning cte.id",
-                                           job_id, UWSPhase.Executing,
-                                           UWSPhase.Pending, self.space_id)
+                self._written(job_id)
+                return await statements.fetchrow(conn, 'transition_uws_job',
+                                                 job_id, UWSPhase.Executing,
+                                                 UWSPhase.Pending, self.space_id)
 
     async def set_completed(self, job_id):
         async with self.db_pool.acquire() as conn:
             async with conn.transaction():
-                return await conn.fetchrow("with cte as (select id, space_id, phase from uws_jobs "
-                                           "where id=$1 and space_id=$4 for update)"
-                                           "update uws_jobs set phase=$2 "
-                                           "from cte where cte.phase=$3 and "
-                                           "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
-                                           "returning cte.id",
-                                           job_id, UWSPhase.Completed,
-                                           UWSPhase.Executing, self.space_id)
+                self._written(job_id)
+                return await statements.fetchrow(conn, 'transition_uws_job',
+                                                 job_id, UWSPhase.Completed,
+                                                 UWSPhase.Executing, self.space_id)
 
     async def set_error(self, job_id, error):
         async with self.db_pool.acquire() as conn:
             async with conn.transaction():
-                return await conn.fetchrow("with cte as (select id, space_id, phase from uws_jobs "
-                                           "where id=$1 and space_id=$5 for update)"
-                                           "update uws_jobs set phase=$3, error=$2 "
-                                           "from cte where cte.phase!=$4 and "
-                                           "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
-                                           "returning cte.id",
-                                           job_id, error, UWSPhase.Error,
-                                           UWSPhase.Aborted, self.space_id)
+                self._written(job_id)
+                return await statements.fetchrow(conn, 'set_uws_job_error',
+                                                 job_id, error, UWSPhase.Error,
+                                                 UWSPhase.Aborted, self.space_id)
 
     async def set_aborted(self, job_id, conn):
-        return await conn.fetchrow("with cte as (select id, space_id, phase from uws_jobs "
-                                   "where id=$1 and space_id=$4 for update)"
-                                   "update uws_jobs set phase=$2 "
-                                   "from cte where cte.phase=any($3::integer[]) and "
-                                   "uws_jobs.id=cte.id and uws_jobs.space_id=cte.space_id "
-                                   "returning cte.id",
-                                   job_id, UWSPhase.Aborted,
-                                   [UWSPhase.Queued, UWSPhase.Pending, UWSPhase.Executing], self.space_id)
+        return await statements.fetchrow(conn, 'set_uws_job_aborted',
+                                         job_id, UWSPhase.Aborted,
+                                         [UWSPhase.Queued, UWSPhase.Pending, UWSPhase.Executing], self.space_id)
 
 
 class NodeProxy:
@@ -234,7 +517,7 @@ class NodeProxy:
 
         root = self._proxied
         node_db = self._tr._job._storage_pool.node_db
-        await node_db.update(root, self._tr._conn, root.owner, check_identity=False)
+        await node_db.update(root, self._tr._conn, root.owner, check_identity=False, data_modified=True)
         if isinstance(root, ContainerNode):
             nodes = [node for node in Node.walk(root)]
             nodes.pop(0)
@@ -281,7 +564,7 @@ class StorageUWSJob(UWSJob):
 
         async def _start(self):
             if self._conn is None:
-                self._conn = await self._job._storage_pool.db_pool.acquire()
+                self._conn = await self._job._storage_pool.transaction_pool.acquire()
                 self._tr = self._conn.transaction()
                 await self._tr.start()
 
@@ -291,17 +574,9 @@ class StorageUWSJob(UWSJob):
                 if job_result['phase'] != UWSPhase.Executing:
                     raise InvalidJobStateError('Invalid Job State')
 
-                query = f"""with node_cte as 
-                            (select * from nodes where path <@ $1 and space_id=$2 
-                            order by nlevel(path) asc for {'update' if self._exclusive else 'share'} of nodes)
-                            select node_cte.*, nlevel(node_cte.path), 
-                            storage.name as space_name, 
-                            storage.host, storage.port, storage.parameters, 
-                            storage.https, storage.enabled from node_cte 
-                            left join storage on node_cte.storage_id=storage.id 
-                            order by nlevel(node_cte.path) asc"""
-
-                node_results = await self._conn.fetch(query, job_result['node_path'], self._job._storage_pool.space_id)
+                node_results = await statements.fetch(self._conn,
+                                                      'lock_tree_update' if self._exclusive else 'lock_tree_share',
+                                                      job_result['node_path'], self._job._storage_pool.space_id)
                 if not node_results:
                     raise NodeDoesNotExistError("target node does not exist.")
 
@@ -313,8 +588,7 @@ class StorageUWSJob(UWSJob):
                 if node_results[0]['path_modified'] != job_result['node_path_modified']:
                     raise NodeDoesNotExistError('target has been modified.')
 
-                node_properties = await self._conn.fetch("select * from properties "
-                                                         "where node_path=any($1::ltree[]) and space_id=$2",
+                node_properties = await statements.fetch(self._conn, 'tree_properties',
                                                          [node['path'] for node in node_results],
                                                          self._job._storage_pool.space_id)
 
@@ -326,7 +600,7 @@ class StorageUWSJob(UWSJob):
                 try:
                     await self._tr.rollback()
                 finally:
-                    await self._job._storage_pool.db_pool.release(self._conn)
+                    await self._job._storage_pool.transaction_pool.release(self._conn)
                     self._conn = None
 
         async def _commit(self):
@@ -334,7 +608,7 @@ class StorageUWSJob(UWSJob):
                 try:
                     await self._tr.commit()
                 finally:
-                    await self._job._storage_pool.db_pool.release(self._conn)
+                    await self._job._storage_pool.transaction_pool.release(self._conn)
                     self._conn = None
 
         async def __aenter__(self):
@@ -355,8 +629,10 @@ class StorageUWSJob(UWSJob):
 
 
 class StorageUWSJobPool(UWSJobPool):
-    def __init__(self, space_id, storage, db_pool, dsn, permission):
+    def __init__(self, space_id, storage, db_pool, dsn, permission, transaction_pool=None):
         super().__init__(space_id, db_pool, permission)
+        # pool the connections of StorageUWSJobTransaction are held from
+        self.transaction_pool = transaction_pool or db_pool
         self.storage = storage
         self.listener = None
         self.dsn = dsn
@@ -384,8 +660,8 @@ class StorageUWSJobPool(UWSJobPool):
             asyncio.run_coroutine_threadsafe(self.executor.abort(job_id), loop)
 
     def _resultset_to_storage_job(self, result):
-        job_info = Transfer.fromstring(result['job_info'])
-        transfer = Transfer.fromstring(result['transfer'])
+        job_info = resultset_to_transfer(result, 'job_info')
+        transfer = resultset_to_transfer(result, 'transfer')
         job = StorageUWSJob(self, result['id'], result['phase'], result['destruction'], job_info, transfer)
         job.node_path_modified = result['node_path_modified']
         job.owner = result['owner']
@@ -410,16 +686,8 @@ class StorageUWSJobPool(UWSJobPool):
                     raise PermissionDenied('runJob denied.')
 
                 try:
-                    query = """with node_cte as 
-                               (select * from nodes where path <@ $1 and space_id=$2 
-                                order by nlevel(path) asc for update of nodes nowait)
-                               select node_cte.*, nlevel(node_cte.path), storage.name as space_name, 
-                               storage.host, storage.port, storage.parameters, 
-                               storage.https, storage.enabled from node_cte 
-                               left join storage on node_cte.storage_id=storage.id 
-                               order by nlevel(node_cte.path) asc"""
-
-                    node_results = await conn.fetch(query, job_result['node_path'], self.space_id)
+                    node_results = await statements.fetch(conn, 'lock_tree_update_nowait',
+                                                          job_result['node_path'], self.space_id)
 
                 except asyncpg.exceptions.LockNotAvailableError:
                     raise NodeBusyError(f"Path: {NodeDatabase.ltree_to_path(job_result['node_path'])}")
@@ -437,9 +705,8 @@ class StorageUWSJobPool(UWSJobPool):
                 if node_results[0]['path_modified'] != job_result['node_path_modified']:
                     raise NodeDoesNotExistError('target has been modified.')
 
-                node_properties = await conn.fetch("select * from properties "
-                                                   "where node_path=any($1::ltree[]) and space_id=$2",
-                                                   [node['path'] for node in node_results], self.space_id)
+                node_properties = await statements.fetch(conn, 'tree_properties',
+                                                         [node['path'] for node in node_results], self.space_id)
 
                 root_node = NodeDatabase.resultset_to_node_tree(node_results, node_properties)
                 job.transfer.target = root_node
@@ -501,3 +768,84 @@ class UWSJobExecutor(object):
         if len(self.job_tasks) > 0:
             raise InvalidJobStateError('There are still job tasks')
 
+
+class UWSJobReaper(object):
+    """
+    Deletes the jobs of a space that are past their destruction time and have finished.
+
+    Jobs are deleted in batches of at most batch_size rows, each batch in its own transaction.
+    Rows locked by another transaction are skipped, so reapers of several servers of the same
+    space can run together.
+
+    :param space_id: id of the space.
+    :param db_pool: pool the jobs are deleted through.
+    :param interval: seconds between runs.
+    :param batch_size: maximum jobs deleted by one statement.
+    """
+    phases = [UWSPhase.Completed, UWSPhase.Error, UWSPhase.Aborted, UWSPhase.Archived]
+
+    def __init__(self, space_id, db_pool, interval=60, batch_size=1000):
+        self.space_id = space_id
+        self.db_pool = db_pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.runs = 0
+        self.deleted = 0
+        self.errors = 0
+        self.last_run = None
+        self.last_deleted = 0
+        self.last_error = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        task = self._task
+        self._task = None
+        if task:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+
+    async def reap(self):
+        """
+        Delete every expired job, one batch at a time.
+
+        :return: number of jobs deleted.
+        """
+        total = 0
+        while True:
+            async with self.db_pool.acquire() as conn:
+                count = await statements.fetchval(conn, 'reap_uws_jobs',
+                                                  self.space_id, self.phases, self.batch_size)
+            total += count
+            self.deleted += count
+            if count < self.batch_size:
+                break
+            # let requests waiting on the pool in between batches
+            await asyncio.sleep(0)
+        self.runs += 1
+        self.last_run = datetime.datetime.utcnow().isoformat()
+        self.last_deleted = total
+        return total
+
+    def metrics(self):
+        return {'runs': self.runs,
+                'deleted': self.deleted,
+                'errors': self.errors,
+                'last_run': self.last_run,
+                'last_deleted': self.last_deleted,
+                'last_error': self.last_error}
@@ -19,16 +19,21 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 
+import json
+
+from datetime import datetime, timezone
 from contextlib import suppress
 from aiohttp_security import authorized_userid, permits
 
 from pyvospace.core.exception import VOSpaceError, PermissionDenied, InvalidURI, \
     InvalidJobStateError, InvalidArgument
-from pyvospace.core.model import UWSPhase, UWSPhaseLookup, Node, DataNode, ContainerNode, \
-    Transfer, Protocol, View, PullFromSpace
+from pyvospace.core.model import UWSPhase, UWSPhaseLookup, UWSPhaseText, UWSJobList, Node, DataNode, \
+    ContainerNode, Transfer, Protocol, View, PullFromSpace
 
 from .transfer import perform_transfer_job
+from .uws import resultset_to_jobref
 from .database import NodeDatabase
+from .statements import statements
 
 
 async def get_properties_request(request):
@@ -43,6 +48,28 @@ async def get_properties_request(request):
     return properties
 
 
+async def get_metrics_request(request):
+    identity = await authorized_userid(request)
+    if identity is None:
+        raise PermissionDenied(f'Credentials not found.')
+    metrics = {'statements': statements.stats(),
+               'pools': {pool.name: pool.metrics() for pool in request.app['pools']}}
+    job_reaper = request.app.get('job_reaper')
+    if job_reaper:
+        metrics['job_reaper'] = job_reaper.metrics()
+    job_watcher = request.app.get('job_watcher')
+    if job_watcher is not None:
+        metrics['job_watcher'] = job_watcher.metrics()
+    return metrics
+
+
+def _set_views(request, node, detail):
+    # accepts and provides are returned for data nodes, containers included, at detail=max
+    if isinstance(node, DataNode) and detail == 'max':
+        node.accepts = request.app['abstract_space'].get_accept_views(node)
+        node.provides = request.app['abstract_space'].get_provide_views(node)
+
+
 async def get_node_request(request):
     identity = await authorized_userid(request)
     if identity is None:
@@ -53,7 +80,7 @@ async def get_node_request(request):
     if detail:
         if detail not in ['min', 'max', 'properties']:
             raise InvalidURI(f'detail invalid: {detail}')
-    limit = request.query.get('limit', None)
+    limit = request.query.get('limit', None) or None
     if limit:
         try:
             limit = int(limit)
@@ -61,31 +88,193 @@ async def get_node_request(request):
                 raise Exception()
         except:
             raise InvalidURI(f'limit invalid: {limit}')
+    # uri of the child to start the listing from, used to page through large containers.
+    start_path = request.query.get('uri', None)
+    if start_path:
+        start_path = Node.uri_to_path(start_path)
 
-    async with request.app['db_pool'].acquire() as conn:
-        async with conn.transaction():
-            node = await request.app['db'].directory(node_path.path, conn, identity)
+    # Children carry their properties only at detail=max.
+    node = await request.app['db'].get_node(node_path.path, identity, limit=limit, start_path=start_path,
+                                            child_properties=detail == 'max')
 
     if detail == 'min':
         node.remove_properties()
 
-    if isinstance(node, DataNode):
-        if detail == 'max':
-            node.accepts = request.app['abstract_space'].get_accept_views(node)
-            node.provides = request.app['abstract_space'].get_provide_views(node)
-    if isinstance(node, ContainerNode):
-        if limit:
-            node.nodes = node.nodes[:limit]
+    _set_views(request, node, detail)
     return node
 
 
+async def get_nodes_request(request):
+    identity = await authorized_userid(request)
+    if identity is None:
+        raise PermissionDenied(f'Credentials not found.')
+    detail = request.query.get('detail', 'max')
+    if detail:
+        if detail not in ['min', 'max', 'properties']:
+            raise InvalidURI(f'detail invalid: {detail}')
+    try:
+        paths = json.loads(await request.text())
+    except ValueError:
+        raise InvalidArgument('paths must be a JSON list.')
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        raise InvalidArgument('paths must be a JSON list.')
+    if len(paths) > request.app['bulk_nodes_limit']:
+        raise InvalidArgument(f'more than {request.app["bulk_nodes_limit"]} paths.')
+
+    nodes = await request.app['db'].get_nodes(paths, identity)
+
+    results = []
+    for path, node in zip(paths, nodes):
+        if isinstance(node, VOSpaceError):
+            results.append({'path': path, 'status': node.code, 'error': node.error})
+            continue
+        if detail == 'min':
+            node.remove_properties()
+        _set_views(request, node, detail)
+        results.append({'path': path, 'status': 200, 'node': node.tostring()})
+    return results
+
+
+def _timestamp_query(request, name, default):
+    value = request.query.get(name, None)
+    if not value:
+        return default
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        raise InvalidArgument(f'{name} invalid: {value}')
+
+
+def _search_query(request):
+    path = Node.uri_to_path(request.query.get('path', '/'))
+    detail = request.query.get('detail', 'max')
+    if detail:
+        if detail not in ['min', 'max', 'properties']:
+            raise InvalidURI(f'detail invalid: {detail}')
+    limit = request.query.get('limit', None) or request.app['search_limit']
+    try:
+        limit = int(limit)
+        if limit <= 0 or limit > request.app['search_limit']:
+            raise ValueError()
+    except ValueError:
+        raise InvalidArgument(f'limit invalid: {limit}')
+    after = request.query.get('cursor', None) or None
+    return path, detail, limit, after
+
+
+async def _stream_search(request, response, find, path, detail, limit, batch_size):
+    response.content_type = 'application/json'
+    async with request.app['db'].read_pool(path).acquire() as conn:
+        async with conn.transaction(readonly=True):
+            cursor = await find(conn)
+            # Results are written as they are read from the cursor, the last path
+            # of a full page is the cursor of the next page.
+            await response.prepare(request)
+            await response.write(b'{"nodes": [')
+            count = 0
+            last = None
+            nodes = await cursor.fetch(min(batch_size, limit))
+            while nodes:
+                entries = []
+                for node in nodes:
+                    if detail == 'min':
+                        node.remove_properties()
+                    entries.append(json.dumps({'path': node.path, 'node': node.tostring()}))
+                await response.write(((',' if count else '') + ','.join(entries)).encode('utf-8'))
+                count += len(nodes)
+                last = nodes[-1]
+                nodes = await cursor.fetch(min(batch_size, limit))
+            next_cursor = NodeDatabase.path_to_ltree(last.path) if count == limit else None
+            await response.write(f'], "next": {json.dumps(next_cursor)}}}'.encode('utf-8'))
+            await response.write_eof()
+            return response
+
+
+async def search_request(request, response, batch_size=1000):
+    identity = await authorized_userid(request)
+    if identity is None:
+        raise PermissionDenied(f'Credentials not found.')
+    path, detail, limit, after = _search_query(request)
+    uri = request.query.get('uri', None) or None
+    value = request.query.get('value', None)
+    mtime_range = None
+    if request.query.get('mtime_from') or request.query.get('mtime_to'):
+        # times are seconds since the epoch, as in the mtime property
+        mtime_range = (_timestamp_query(request, 'mtime_from', datetime.fromtimestamp(0, tz=timezone.utc)),
+                       _timestamp_query(request, 'mtime_to', datetime.max.replace(tzinfo=timezone.utc)))
+
+    async def find(conn):
+        return await request.app['db'].search_cursor(path, conn, identity, uri=uri, value=value,
+                                                     mtime_range=mtime_range, after=after, limit=limit)
+    return await _stream_search(request, response, find, path, detail, limit, batch_size)
+
+
+async def glob_request(request, response, batch_size=1000):
+    identity = await authorized_userid(request)
+    if identity is None:
+        raise PermissionDenied(f'Credentials not found.')
+    path, detail, limit, after = _search_query(request)
+    pattern = request.query.get('pattern', None)
+    if not pattern:
+        raise InvalidArgument('pattern is empty.')
+
+    async def find(conn):
+        return await request.app['db'].glob_cursor(path, conn, pattern, identity, after=after, limit=limit)
+    return await _stream_search(request, response, find, path, detail, limit, batch_size)
+
+
+async def stream_node_request(request, response, batch_size=1000):
+    identity = await authorized_userid(request)
+    if identity is None:
+        raise PermissionDenied(f'Credentials not found.')
+    path = request.path.replace('/vospace/nodes', '')
+    node_path = Node(path)
+    detail = request.query.get('detail', 'max')
+    if detail:
+        if detail not in ['min', 'max', 'properties']:
+            raise InvalidURI(f'detail invalid: {detail}')
+    start_path = request.query.get('uri', None)
+    if start_path:
+        start_path = Node.uri_to_path(start_path)
+
+    response.content_type = 'text/xml'
+    async with request.app['db'].read_pool(node_path.path).acquire() as conn:
+        async with conn.transaction(readonly=True):
+            node, cursor = await request.app['db'].directory_cursor(node_path.path, conn, identity,
+                                                                    start_path=start_path,
+                                                                    child_properties=detail == 'max')
+            if detail == 'min':
+                node.remove_properties()
+
+            _set_views(request, node, detail)
+
+            nodes = await cursor.fetch(batch_size) if cursor else []
+            if not nodes:
+                await response.prepare(request)
+                await response.write(node.tostring().encode('utf-8'))
+                await response.write_eof()
+                return response
+
+            # Children are written as they are read from the cursor so memory
+            # stays flat and the first byte is sent before the listing is complete.
+            head, tail = node.tostring_parts()
+            await response.prepare(request)
+            await response.write(head.encode('utf-8'))
+            while nodes:
+                await response.write(ContainerNode.nodes_tostring(nodes).encode('utf-8'))
+                nodes = await cursor.fetch(batch_size)
+            await response.write(tail.encode('utf-8'))
+            await response.write_eof()
+            return response
+
+
 async def delete_node_request(app, request):
     identity = await authorized_userid(request)
     if identity is None:
         raise PermissionDenied(f'Credentials not found.')
     path = request.path.replace('/vospace/nodes', '')
     async with app['db_pool'].acquire() as conn:
-        async with conn.transaction():
+        async with request.app['db'].transaction(conn):
             node = await request.app['db'].delete(path, conn, identity)
     with suppress(OSError):
         await app['abstract_space'].delete_storage_node(node)
@@ -102,7 +291,7 @@ async def create_node_request(request):
         raise InvalidURI("Paths do not match")
 
     async with request.app['db_pool'].acquire() as conn:
-        async with conn.transaction():
+        async with request.app['db'].transaction(conn):
             await request.app['db'].create(node, conn, identity)
             await request.app['abstract_space'].create_storage_node(node)
             node.accepts = request.app['abstract_space'].get_accept_views(node)
@@ -120,7 +309,7 @@ async def set_node_properties_request(request):
         raise InvalidURI("Paths do not match")
 
     async with request.app['db_pool'].acquire() as conn:
-        async with conn.transaction():
+        async with request.app['db'].transaction(conn):
             node = await request.app['db'].update(node, conn, identity)
     return node
 
@@ -172,17 +361,96 @@ async def sync_transfer_request(request):
     return job, endpoint
 
 
+def _wait_query(request):
+    # UWS 1.1 blocking parameters, WAIT=-1 waits as long as the server allows
+    wait = request.query.get('WAIT', None)
+    if not wait:
+        return 0, None
+    try:
+        wait = int(wait)
+        if wait < -1:
+            raise ValueError()
+    except ValueError:
+        raise InvalidArgument(f'WAIT invalid: {wait}')
+    limit = request.app['job_wait_limit']
+    wait = limit if wait == -1 else min(wait, limit)
+    phase = request.query.get('PHASE', None)
+    if phase:
+        try:
+            phase = UWSPhaseText[phase.upper()]
+        except KeyError:
+            raise InvalidArgument(f'PHASE invalid: {phase}')
+    return wait, phase or None
+
+
 async def get_job_request(request):
     identity = await authorized_userid(request)
     if identity is None:
         raise PermissionDenied(f'Credentials not found.')
     job_id = request.match_info.get('job_id', None)
+    wait, phase = _wait_query(request)
+    if wait > 0:
+        await request.app['executor'].wait_uws_job_phase(job_id, identity, wait, phase)
     job = await request.app['executor'].get(job_id)
     if identity != job.owner:
         raise PermissionDenied(f'{identity} is not the owner of the job.')
     return job
 
 
+def _jobs_query(request):
+    # UWS 1.1 job list parameters, ARCHIVED jobs are only listed when asked for
+    phases = request.query.getall('PHASE', [])
+    if phases:
+        try:
+            phases = list({UWSPhaseText[phase.upper()] for phase in phases})
+        except KeyError as e:
+            raise InvalidArgument(f'PHASE invalid: {e.args[0]}')
+    else:
+        phases = [phase for phase in UWSPhaseLookup if phase != UWSPhase.Archived]
+    after = request.query.get('AFTER', None) or None
+    if after:
+        try:
+            # creation times are utc without a time zone
+            after = datetime.fromisoformat(after[:-1] + '+00:00' if after.endswith('Z') else after)
+        except ValueError:
+            raise InvalidArgument(f'AFTER invalid: {after}')
+        if after.tzinfo is not None:
+            after = after.astimezone(timezone.utc).replace(tzinfo=None)
+    limit = request.query.get('LAST', None) or request.app['job_list_limit']
+    try:
+        limit = int(limit)
+        if limit <= 0 or limit > request.app['job_list_limit']:
+            raise ValueError()
+    except ValueError:
+        raise InvalidArgument(f'LAST invalid: {limit}')
+    cursor = request.query.get('cursor', None) or None
+    return phases, after, limit, cursor
+
+
+async def jobs_request(request, response, batch_size=1000):
+    identity = await authorized_userid(request)
+    if identity is None:
+        raise PermissionDenied(f'Credentials not found.')
+    phases, after, limit, cursor = _jobs_query(request)
+
+    executor = request.app['executor']
+    response.content_type = 'text/xml'
+    async with executor.jobs_read_pool().acquire() as conn:
+        async with conn.transaction(readonly=True):
+            jobs = await executor.jobs_cursor(conn, identity, phases, after=after, cursor=cursor, limit=limit)
+            # Jobs are written newest first as they are read, the id of the last job
+            # of a full page is the cursor of the next page.
+            await response.prepare(request)
+            await response.write(UWSJobList.HEAD.encode('utf-8'))
+            rows = await jobs.fetch(min(batch_size, limit))
+            while rows:
+                await response.write(''.join(resultset_to_jobref(row).tostring() for row in rows).encode('utf-8'))
+                rows = await jobs.fetch(min(batch_size, limit))
+            await response.write(UWSJobList.TAIL.encode('utf-8'))
+            await response.write_eof()
+            return response
+
+
 async def get_transfer_details_request(request):
     identity = await authorized_userid(request)
     if identity is None:
@@ -203,10 +471,8 @@ async def get_job_phase_request(request):
     if identity is None:
         raise PermissionDenied(f'Credentials not found.')
     job_id = request.match_info.get('job_id', None)
-    job = await request.app['executor'].get_uws_job_phase(job_id)
-    if identity != job['owner']:
-        raise PermissionDenied(f'{identity} is not the owner of the job.')
-    return UWSPhaseLookup[job['phase']]
+    wait, phase = _wait_query(request)
+    return UWSPhaseLookup[await request.app['executor'].wait_uws_job_phase(job_id, identity, wait, phase)]
 
 
 async def modify_job_request(request):
@@ -0,0 +1,120 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+"""
+Benchmark the memory and allocations of the node model.
+
+Nodes are built as a listing from the database builds them, with a few properties and groups,
+added to a container, the container is copied and every node of the copy is changed. Each step reports the time taken, the memory
+and the number of memory blocks held after the step, and the peak memory during it.
+No database is needed.
+
+--baseline loads pyvospace/core/model.py from a git revision and runs the same steps against it,
+e.g. to compare with the model before a change:
+
+    python -m test.benchmark.bench_model --nodes 100000 --baseline HEAD~1
+"""
+
+import sys
+import copy
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import importlib.util
+
+from pyvospace.core import model
+
+
+def load_baseline(revision):
+    source = subprocess.check_output(['git', 'show', f'{revision}:pyvospace/core/model.py'])
+    with tempfile.NamedTemporaryFile(suffix='.py') as f:
+        f.write(source)
+        f.flush()
+        # loaded inside pyvospace.core so the model imports its exceptions
+        spec = importlib.util.spec_from_file_location('pyvospace.core.model_baseline', f.name)
+        baseline = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = baseline
+        spec.loader.exec_module(baseline)
+    return baseline
+
+
+def build(module, nodes):
+    result = []
+    for i in range(nodes):
+        node = module.DataNode(f'/bench/n{i}', owner='bench', group_read=['read'], group_write=['write'])
+        node.set_properties([module.Property('ivo://ivoa.net/vospace/core#title', f'title {i}'),
+                             module.Property('ivo://ivoa.net/vospace/core#description', 'benchmark'),
+                             module.Property('ivo://ivoa.net/vospace/core#length', i, persist=False)])
+        result.append(node)
+    return result
+
+
+def step(name, func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    print(f'  {name}: {elapsed:.2f}s, held {current / 2**20:.1f} MiB in {blocks} blocks, '
+          f'peak {peak / 2**20:.1f} MiB')
+    return result
+
+
+def add_nodes(container, nodes):
+    for node in nodes:
+        container.add_node(node)
+
+
+def change(module, container):
+    for node in container.nodes:
+        node.add_property(module.Property('ivo://ivoa.net/vospace/core#title', 'changed'))
+
+
+def run(label, module, nodes):
+    print(label)
+    listing = step('build', build, module, nodes)
+    container = module.ContainerNode('/bench')
+    step('add_node', add_nodes, container, listing)
+    del listing
+    container_copy = step('deepcopy', copy.deepcopy, container)
+    # the copy pays for what it changes
+    step('change copy', change, module, container_copy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--baseline', help='git revision of the model to compare against')
+    args = parser.parse_args()
+
+    run('current', model, args.nodes)
+    if args.baseline:
+        run(f'baseline {args.baseline}', load_baseline(args.baseline), args.nodes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+"""
+Benchmark the assembly of node trees from database rows by NodeDatabase.resultset_to_node_tree.
+
+Rows are generated in memory for a wide tree, a container holding every node, a deep tree,
+a chain of containers, and a tree of containers with a fixed fanout. Each tree is built with
+resultset_to_node_tree, then with the previous approach of inserting every node from the root
+with insert_node_into_tree. No database is needed.
+
+    python -m test.benchmark.bench_tree --nodes 100000 --depth 1000
+"""
+
+import time
+import uuid
+import argparse
+import tracemalloc
+
+from pyvospace.core.model import NodeType
+from pyvospace.server.database import NodeDatabase
+
+
+def row(path, node_type):
+    return {'path': NodeDatabase.path_to_ltree(path), 'type': node_type, 'id': uuid.uuid4(), 'busy': False,
+            'link': None, 'owner': 'bench', 'groupread': [], 'groupwrite': [], 'path_modified': 0,
+            'size': 0, 'storage_id': None}
+
+
+def wide_tree(nodes):
+    return [row('/bench', NodeType.ContainerNode)] + \
+           [row(f'/bench/n{i}', NodeType.Node) for i in range(nodes - 1)]
+
+
+def deep_tree(depth):
+    rows = []
+    path = '/bench'
+    for i in range(depth):
+        rows.append(row(path, NodeType.ContainerNode))
+        path = f'{path}/c{i}'
+    return rows
+
+
+def fanout_tree(nodes, fanout):
+    rows = [row('/bench', NodeType.ContainerNode)]
+    containers = ['/bench']
+    while len(rows) < nodes:
+        parent = containers.pop(0)
+        for i in range(min(fanout, nodes - len(rows))):
+            path = f'{parent}/c{i}'
+            rows.append(row(path, NodeType.ContainerNode))
+            containers.append(path)
+    return rows
+
+
+def legacy(rows):
+    root = NodeDatabase._create_node(rows[0])
+    for result in rows[1:]:
+        node = NodeDatabase._create_node(result)
+        node.set_properties([])
+        root.insert_node_into_tree(node)
+    return root
+
+
+def timed(build, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    build(list(rows))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, default=100000)
+    parser.add_argument('--depth', type=int, default=1000)
+    parser.add_argument('--fanout', type=int, default=10)
+    args = parser.parse_args()
+
+    trees = (('wide', wide_tree(args.nodes)),
+             ('deep', deep_tree(args.depth)),
+             ('fanout', fanout_tree(args.nodes, args.fanout)))
+    for name, rows in trees:
+        for build_name, build in (('one pass', NodeDatabase.resultset_to_node_tree), ('legacy', legacy)):
+            elapsed, peak = timed(build, rows)
+            print(f'{name} {len(rows)} nodes {build_name}: {elapsed:.2f}s, '
+                  f'python peak memory {peak / 2**20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+"""
+Benchmark serialising and parsing node and transfer documents.
+
+A container with 1, 1000 and 100000 children, each with a few properties, and a push transfer are
+written with tostring and read back with fromstring. No database is needed.
+
+--baseline loads pyvospace/core/model.py from a git revision, runs the same round trips against it
+and checks the documents it writes are identical, e.g.:
+
+    python -m test.benchmark.bench_xml --baseline HEAD~1
+"""
+
+import time
+import argparse
+
+from pyvospace.core import model
+
+from .bench_model import load_baseline
+
+
+def container(module, children):
+    root = module.ContainerNode('/bench', properties=[module.Property('ivo://ivoa.net/vospace/core#title', 'bench')])
+    # older models only have add_node
+    add_node = getattr(root, 'attach_node', root.add_node)
+    for i in range(children):
+        node = module.DataNode(f'/bench/n{i}')
+        node.set_properties([module.Property('ivo://ivoa.net/vospace/core#title', f'title {i} & more'),
+                             module.Property('ivo://ivoa.net/vospace/core#length', str(i))])
+        add_node(node)
+    return root
+
+
+def transfer(module):
+    return module.PushToSpace(module.Node('/bench/data'),
+                              protocols=[module.HTTPPut(module.Endpoint('http://localhost/vospace/data'))],
+                              params=[module.Parameter('ivo://ivoa.net/vospace/core#length', '1024')])
+
+
+def timed(func, *args, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def run(label, module, sizes, repeat):
+    print(label)
+    documents = {}
+    for children in sizes:
+        node = container(module, children)
+        times = max(1, repeat // max(1, children))
+        xml, write = timed(node.tostring, repeat=times)
+        _, read = timed(module.Node.fromstring, xml, repeat=times)
+        print(f'  {children} children: tostring {write * 1000:.3f}ms, fromstring {read * 1000:.3f}ms, '
+              f'{len(xml)} characters')
+        documents[children] = xml
+    xml, write = timed(transfer(module).tostring, repeat=repeat)
+    _, read = timed(module.Transfer.fromstring, xml, repeat=repeat)
+    print(f'  transfer: tostring {write * 1000:.3f}ms, fromstring {read * 1000:.3f}ms')
+    documents['transfer'] = xml
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--repeat', type=int, default=1000, help='round trips of the smaller documents')
+    parser.add_argument('--baseline', help='git revision of the model to compare against')
+    args = parser.parse_args()
+
+    documents = run('current', model, args.sizes, args.repeat)
+    if args.baseline:
+        baseline = run(f'baseline {args.baseline}', load_baseline(args.baseline), args.sizes, args.repeat)
+        for name, xml in documents.items():
+            if xml != baseline[name]:
+                print(f'{name} differs from the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -81,6 +81,8 @@ class TestCopyMove(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            self.assertEqual(node.remove_property('ivo://icrar.org/vospace/core#treecount').value, '2')
 
             orig_node = ContainerNode('/root1/test2',
                                       properties=properties,
@@ -99,6 +101,8 @@ class TestCopyMove(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            self.assertEqual(node.remove_property('ivo://icrar.org/vospace/core#treecount').value, '0')
             orig_node = ContainerNode('/root2')
             self.assertEqual(node, orig_node)
 
@@ -121,6 +125,8 @@ class TestCopyMove(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            self.assertEqual(node.remove_property('ivo://icrar.org/vospace/core#treecount').value, '2')
             moved_node = ContainerNode('/root2/test2',
                                        properties=properties,
                                        nodes=[ContainerNode('/root2/test2/test3'),
@@ -138,6 +144,8 @@ class TestCopyMove(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            self.assertEqual(node.remove_property('ivo://icrar.org/vospace/core#treecount').value, '0')
             orig_node = ContainerNode('/root1')
             self.assertEqual(node, orig_node)
 
@@ -303,6 +311,8 @@ class TestCopyMove(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            node.remove_property('ivo://icrar.org/vospace/core#treecount')
             self.assertEqual(node, copy_node)
 
             # check original node is still there
@@ -316,6 +326,8 @@ class TestCopyMove(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            node.remove_property('ivo://icrar.org/vospace/core#treecount')
             self.assertEqual(node, orig_node)
 
         self.loop.run_until_complete(run())
@@ -19,6 +19,8 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 #    MA 02111-1307  USA
 
+import json
+import asyncio
 import unittest
 import xml.etree.ElementTree as ET
 
@@ -60,6 +62,13 @@ class TestCreate(TestBase):
         nodes = [n for n in Node.walk(root1)]
         self.assertEqual(len(nodes), 2)
 
+        # streamed serialisation is the same document
+        root = ContainerNode('/test', nodes=[Node('/test/test1'), DataNode('/test/test2')],
+                             properties=[Property('ivo://ivoa.net/vospace/core#title', "Hello1")])
+        head, tail = root.tostring_parts()
+        xml = head + ContainerNode.nodes_tostring(root.nodes[:1]) + ContainerNode.nodes_tostring(root.nodes[1:]) + tail
+        self.assertEqual(xml, root.tostring())
+
 
     def test_create_delete(self):
         async def run():
@@ -98,6 +107,186 @@ class TestCreate(TestBase):
 
         self.loop.run_until_complete(run())
 
+    def test_get_metrics(self):
+        async def run():
+            await self.create_node(ContainerNode('/test1'))
+            status, response = await self.get('http://localhost:8080/vospace/metrics', params=None)
+            self.assertEqual(200, status, msg=response)
+            metrics = json.loads(response)
+            self.assertGreater(metrics['statements']['insert_node']['calls'], 0)
+            self.assertGreater(metrics['pools']['interactive']['acquired'], 0)
+            self.assertIn('bulk', metrics['pools'])
+
+        self.loop.run_until_complete(run())
+
+    def test_get_nodes(self):
+        async def run():
+            await self.create_node(ContainerNode('/test1'))
+            await self.create_node(Node('/test1/data'))
+
+            paths = ['/test1/data', '/test1/missing', '/test1', '/']
+            status, response = await self.post('http://localhost:8080/vospace/getnodes',
+                                               data=json.dumps(paths), params={'detail': 'min'})
+            self.assertEqual(200, status, msg=response)
+            results = json.loads(response)
+            self.assertEqual([result['path'] for result in results], paths)
+            self.assertEqual([result['status'] for result in results], [200, 404, 200, 200])
+            self.assertEqual(Node.fromstring(results[0]['node']), Node('/test1/data'))
+            # nodes are returned without their children
+            self.assertEqual(Node.fromstring(results[2]['node']), ContainerNode('/test1'))
+
+            status, response = await self.post('http://localhost:8080/vospace/getnodes', data='/test1')
+            self.assertEqual(400, status, msg=response)
+
+        self.loop.run_until_complete(run())
+
+    def test_search(self):
+        async def run():
+            title = 'ivo://ivoa.net/vospace/core#title'
+            await self.create_node(ContainerNode('/test1', properties=[Property(title, 'match', False)]))
+            await self.create_node(ContainerNode('/test1/a'))
+            await self.create_node(Node('/test1/a/b', properties=[Property(title, 'match', False)]))
+            await self.create_node(Node('/test1/c', properties=[Property(title, 'other', False)]))
+            await self.create_node(Node('/test1/d', properties=[Property(title, 'match', False)]))
+
+            async def search(params, expected_status=200):
+                status, response = await self.get('http://localhost:8080/vospace/search', params=params)
+                self.assertEqual(expected_status, status, msg=response)
+                return json.loads(response) if status == 200 else None
+
+            # the container searched is not a result
+            results = await search({'path': '/test1', 'uri': title, 'value': 'match'})
+            self.assertEqual([n['path'] for n in results['nodes']], ['/test1/a/b', '/test1/d'])
+            self.assertIsNone(results['next'])
+            node = Node.fromstring(results['nodes'][0]['node'])
+            self.assertEqual(node.properties[title].value, 'match')
+
+            results = await search({'path': '/test1', 'uri': title})
+            self.assertEqual([n['path'] for n in results['nodes']], ['/test1/a/b', '/test1/c', '/test1/d'])
+
+            # page through every node below the container
+            paths = []
+            params = {'path': '/test1', 'limit': 2, 'detail': 'min'}
+            while True:
+                results = await search(params)
+                paths.extend(n['path'] for n in results['nodes'])
+                if not results['next']:
+                    break
+                params['cursor'] = results['next']
+            self.assertEqual(paths, ['/test1/a', '/test1/a/b', '/test1/c', '/test1/d'])
+
+            results = await search({'path': '/test1', 'mtime_from': 0, 'mtime_to': 1})
+            self.assertEqual(results['nodes'], [])
+
+            await search({'path': '/test1', 'value': 'match'}, expected_status=400)
+            await search({'path': '/test1', 'cursor': 'not a cursor'}, expected_status=400)
+            await search({'path': '/test1/c'}, expected_status=400)
+            await search({'path': '/test2'}, expected_status=404)
+
+        self.loop.run_until_complete(run())
+
+    def test_glob(self):
+        async def run():
+            await self.create_node(ContainerNode('/test1'))
+            await self.create_node(ContainerNode('/test1/obs_2018a'))
+            await self.create_node(Node('/test1/obs_2018a/image.fits'))
+            await self.create_node(Node('/test1/obs_2018a/image.txt'))
+            await self.create_node(Node('/test1/obs_2019'))
+            await self.create_node(Node('/test1/top.fits'))
+
+            async def glob(params, expected_status=200):
+                status, response = await self.get('http://localhost:8080/vospace/glob', params=params)
+                self.assertEqual(expected_status, status, msg=response)
+                return json.loads(response) if status == 200 else None
+
+            results = await glob({'path': '/test1', 'pattern': '**/*.fits'})
+            self.assertEqual([n['path'] for n in results['nodes']],
+                             ['/test1/obs_2018a/image.fits', '/test1/top.fits'])
+
+            results = await glob({'path': '/test1', 'pattern': 'obs_2018*'})
+            self.assertEqual([n['path'] for n in results['nodes']], ['/test1/obs_2018a'])
+
+            results = await glob({'path': '/test1', 'pattern': '*/*', 'limit': 1, 'detail': 'min'})
+            self.assertEqual([n['path'] for n in results['nodes']], ['/test1/obs_2018a/image.fits'])
+            results = await glob({'path': '/test1', 'pattern': '*/*', 'cursor': results['next']})
+            self.assertEqual([n['path'] for n in results['nodes']], ['/test1/obs_2018a/image.txt'])
+            self.assertIsNone(results['next'])
+
+            await glob({'path': '/test1', 'pattern': '*.d/a'}, expected_status=400)
+            await glob({'path': '/test1'}, expected_status=400)
+
+        self.loop.run_until_complete(run())
+
+    def test_list_jobs(self):
+        async def run():
+            await self.create_node(ContainerNode('/test1'))
+            await self.create_node(ContainerNode('/test1/a'))
+            job_ids = []
+            for i in range(3):
+                job = await self.transfer_node(Copy(ContainerNode('/test1/a'), ContainerNode(f'/test1/b{i}')))
+                job_ids.insert(0, job.job_id)
+
+            async def list_jobs(params, expected_status=200):
+                status, response = await self.get('http://localhost:8080/vospace/transfers', params=params)
+                self.assertEqual(expected_status, status, msg=response)
+                return UWSJobList.fromstring(response) if status == 200 else None
+
+            # newest first
+            jobs = await list_jobs({'PHASE': 'PENDING', 'LAST': 3})
+            self.assertEqual([job.job_id for job in jobs], job_ids)
+            self.assertEqual(jobs[0].phase, UWSPhase.Pending)
+            self.assertEqual(jobs[0].owner, 'test')
+
+            # page through the jobs
+            jobs = await list_jobs({'PHASE': 'PENDING', 'LAST': 2})
+            self.assertEqual([job.job_id for job in jobs], job_ids[:2])
+            jobs = await list_jobs({'PHASE': 'PENDING', 'LAST': 2, 'cursor': jobs[-1].job_id})
+            self.assertEqual(jobs[0].job_id, job_ids[2])
+
+            jobs = await list_jobs({'AFTER': jobs[0].creation_time})
+            self.assertEqual([job.job_id for job in jobs], job_ids[:2])
+
+            jobs = await list_jobs({'PHASE': 'ARCHIVED'})
+            self.assertNotIn(job_ids[0], [job.job_id for job in jobs])
+
+            await list_jobs({'PHASE': 'DONE'}, expected_status=400)
+            await list_jobs({'LAST': 0}, expected_status=400)
+            await list_jobs({'AFTER': 'yesterday'}, expected_status=400)
+            await list_jobs({'cursor': 'not a cursor'}, expected_status=400)
+
+        self.loop.run_until_complete(run())
+
+    def test_wait_job(self):
+        async def run():
+            await self.create_node(ContainerNode('/test1'))
+            await self.create_node(ContainerNode('/test1/a'))
+            job = await self.transfer_node(Copy(ContainerNode('/test1/a'), ContainerNode('/test1/b')))
+            url = f'http://localhost:8080/vospace/transfers/{job.job_id}/phase'
+
+            # a job outside PHASE is returned at once
+            status, response = await self.get(url, params={'WAIT': 30, 'PHASE': 'EXECUTING'})
+            self.assertEqual(200, status, msg=response)
+            self.assertEqual('PENDING', response)
+
+            # the request is held until the job leaves PENDING
+            wait = asyncio.ensure_future(self.get(url, params={'WAIT': 30}))
+            await asyncio.sleep(0.5)
+            self.assertFalse(wait.done())
+            await self.change_job_state(job.job_id, 'PHASE=ABORT')
+            status, response = await asyncio.wait_for(wait, 5)
+            self.assertEqual(200, status, msg=response)
+            self.assertEqual('ABORTED', response)
+
+            status, response = await self.get(f'http://localhost:8080/vospace/transfers/{job.job_id}',
+                                              params={'WAIT': 30})
+            self.assertEqual(200, status, msg=response)
+            self.assertEqual(UWSJob.fromstring(response).phase, 'ABORTED')
+
+            status, response = await self.get(url, params={'WAIT': 'soon'})
+            self.assertEqual(400, status, msg=response)
+
+        self.loop.run_until_complete(run())
+
     def test_get_properties(self):
         async def run():
             properties = [Property('ivo://ivoa.net/vospace/core#title', "Hello1", False),
@@ -135,6 +324,8 @@ class TestCreate(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            node.remove_property('ivo://icrar.org/vospace/core#treecount')
             prop = [Property('ivo://ivoa.net/vospace/core#title', "NewTitle", False)]
             orig_node = ContainerNode('/test1', properties=prop)
             self.assertEqual(node, orig_node)
@@ -239,12 +430,27 @@ class TestCreate(TestBase):
             node.remove_property('ivo://ivoa.net/vospace/core#ctime')
             node.remove_property('ivo://ivoa.net/vospace/core#mtime')
             node.remove_property('ivo://icrar.org/vospace/core#statfs')
+            node.remove_property('ivo://icrar.org/vospace/core#treelength')
+            node.remove_property('ivo://icrar.org/vospace/core#treecount')
             cmp_node = ContainerNode('/test1',
                                      properties=properties,
                                      nodes=[Node('/test1/data')])
 
             self.assertEqual(node, cmp_node)
 
+            # page through the container starting from a child uri
+            params = {'detail': 'min', 'limit': 1, 'uri': ContainerNode('/test1/test2').to_uri()}
+            node = await self.get_node('test1', params)
+            self.assertEqual(node.nodes, [ContainerNode('/test1/test2')])
+
+            params = {'detail': 'min', 'uri': Node('/test1/data').to_uri()}
+            node = await self.get_node('test1', params)
+            self.assertEqual(node.nodes, [Node('/test1/data'), ContainerNode('/test1/test2')])
+
+            # uri must be a child of the container
+            params = {'uri': Node('/datanode').to_uri()}
+            await self.get_node('test1', params, expected_status=400)
+
             params = {'detail': 'min'}
             node = await self.get_node('test1', params)
 
@@ -261,6 +467,16 @@ class TestCreate(TestBase):
 
             self.assertEqual(node, cmp_node)
 
+            # children carry their properties at detail=max
+            node4 = Node('/test1/test2/props', properties=properties)
+            await self.create_node(node4)
+
+            node = await self.get_node('/test1/test2', params={'detail': 'max'})
+            self.assertEqual(node.nodes[0], node4)
+
+            node = await self.get_node('/test1/test2', params={'detail': 'min'})
+            self.assertEqual(node.nodes[0], Node('/test1/test2/props'))
+
         self.loop.run_until_complete(run())
 
 if __name__ == '__main__':
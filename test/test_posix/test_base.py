@@ -67,7 +67,8 @@ class TestBase(unittest.TestCase):
                                'parameters': '{}',
                                'secret_key': 'ZlmNyXdQgRhhrC2Wwy-gLZj7Wv6ZtoKH',
                                'domain': '',
-                               'use_ssl': 0
+                               'use_ssl': 0,
+                               'node_cache_size': 1000
                                }
 
             config['Storage'] = {'name': 'posix',
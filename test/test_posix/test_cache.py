@@ -0,0 +1,242 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import json
+import asyncio
+import unittest
+
+from pyvospace.server.cache import NodeCache, UserCache
+from pyvospace.server.database import NodeDatabase
+from pyvospace.server.spaces.posix.utils import StatvfsCache
+
+
+class TestNodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = NodeCache(1, 3)
+        # stands in for the listener connection
+        self.cache.listener = object()
+
+    def put(self, path, *args):
+        self.cache.put(self.cache.generation, [path], path, *args)
+
+    def test_lru(self):
+        self.put('A')
+        self.put('B')
+        self.put('C')
+        self.assertIsNotNone(self.cache.get('A'))
+        self.put('D')
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get('B'))
+        self.assertIsNotNone(self.cache.get('A'))
+
+    def test_stale_put(self):
+        generation = self.cache.generation
+        self.cache.invalidate(['A'])
+        self.cache.put(generation, ['A'], 'A')
+        self.assertIsNone(self.cache.get('A'))
+
+    def test_invalidate(self):
+        self.put('')
+        self.put('A')
+        self.put('A.B')
+        self.put('A.B', 10, 'A.B.C')
+        self.cache.invalidate(['A.B.C'])
+        self.assertIsNone(self.cache.get('A.B'))
+        self.assertIsNone(self.cache.get('A.B', 10, 'A.B.C'))
+        self.assertIsNotNone(self.cache.get('A'))
+
+        # top level nodes invalidate the root listing
+        self.cache.invalidate(['A'])
+        self.assertIsNone(self.cache.get('A'))
+        self.assertIsNone(self.cache.get(''))
+
+    def test_invalidate_ancestors(self):
+        self.put('')
+        self.put('A')
+        self.put('A.B', 10, 'A.B.C')
+        self.put('A.B.C.D')
+        self.cache.invalidate_ancestors(['A.B.C'])
+        self.assertIsNone(self.cache.get(''))
+        self.assertIsNone(self.cache.get('A'))
+        self.assertIsNone(self.cache.get('A.B', 10, 'A.B.C'))
+        self.assertIsNotNone(self.cache.get('A.B.C.D'))
+
+    def test_notification(self):
+        self.put('A')
+        self.put('AB')
+        self.put('A.B')
+        self.cache._node_cache_callback(None, 0, 'node_cache',
+                                        json.dumps({'table': 'nodes', 'space_id': 2, 'paths': ['A.B']}))
+        self.assertIsNotNone(self.cache.get('A.B'))
+
+        self.cache._node_cache_callback(None, 0, 'node_cache',
+                                        json.dumps({'table': 'nodes', 'space_id': 1, 'subtree': 'A'}))
+        self.assertIsNone(self.cache.get('A'))
+        self.assertIsNone(self.cache.get('A.B'))
+        self.assertIsNotNone(self.cache.get('AB'))
+
+        self.cache._node_cache_callback(None, 0, 'node_cache',
+                                        json.dumps({'table': 'nodes', 'space_id': 1, 'subtree': None}))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_disabled(self):
+        self.cache._terminated_callback(None)
+        self.put('A')
+        self.assertIsNone(self.cache.get('A'))
+
+    def test_invalidate_after_commit(self):
+        db = NodeDatabase(1, None, None, self.cache)
+        conn = TransactionConnection()
+
+        async def write(fail):
+            async with db.transaction(conn):
+                db.invalidate(['A.B'], conn)
+                # a read before the commit caches the rows the transaction replaces
+                self.put('A')
+                if fail:
+                    raise ValueError()
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(write(False))
+            self.assertIsNone(self.cache.get('A'))
+            with self.assertRaises(ValueError):
+                loop.run_until_complete(write(True))
+            self.assertIsNotNone(self.cache.get('A'))
+        finally:
+            loop.close()
+        self.assertEqual(conn.commits, 1)
+
+
+class TransactionConnection(object):
+    """
+    Connection whose transactions commit unless an exception is raised.
+    """
+    def __init__(self):
+        self.commits = 0
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, *args):
+        if exc_type is None:
+            self.commits += 1
+
+
+class UsersPool(object):
+    """
+    Pool whose connections read users from a dict, counting the reads.
+    """
+    def __init__(self, users):
+        self.users = users
+        self.reads = 0
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def fetchrow(self, sql, username, space_name):
+        self.reads += 1
+        return self.users.get(username)
+
+
+class TestUserCache(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = UsersPool({'test': {'username': 'test', 'groupread': ['a', 'b'],
+                                        'groupwrite': None, 'admin': False}})
+        self.cache = UserCache('space', self.pool, 2)
+        # stands in for the listener connection
+        self.cache.listener = object()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def get(self, username):
+        return self.loop.run_until_complete(self.cache.get(username))
+
+    def test_get(self):
+        user = self.get('test')
+        self.assertEqual(user.groupread, frozenset(['a', 'b']))
+        self.assertEqual(user.groupwrite, frozenset())
+        self.assertIs(self.get('test'), user)
+        self.assertIsNone(self.get('unknown'))
+        self.assertIsNone(self.get('unknown'))
+        self.assertEqual(self.pool.reads, 2)
+
+    def test_notification(self):
+        self.get('test')
+        self.cache._users_cache_callback(None, 0, 'users_cache',
+                                         json.dumps({'space_name': 'other', 'username': 'test'}))
+        self.get('test')
+        self.assertEqual(self.pool.reads, 1)
+        self.cache._users_cache_callback(None, 0, 'users_cache',
+                                         json.dumps({'space_name': 'space', 'username': 'test'}))
+        self.get('test')
+        self.assertEqual(self.pool.reads, 2)
+
+    def test_expired(self):
+        self.cache.ttl = 0
+        self.get('test')
+        self.get('test')
+        self.assertEqual(self.pool.reads, 2)
+
+    def test_disabled(self):
+        self.cache._terminated_callback(None)
+        self.get('test')
+        self.get('test')
+        self.assertEqual(self.pool.reads, 2)
+
+
+class TestStatvfsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_get(self):
+        async def run():
+            cache = StatvfsCache(60)
+            statfs = await cache.get('/')
+            self.assertIn('f_bsize', json.loads(statfs))
+            self.assertIs(await cache.get('/'), statfs)
+
+            cache = StatvfsCache(0)
+            statfs = await cache.get('/')
+            self.assertIsNot(await cache.get('/'), statfs)
+
+        self.loop.run_until_complete(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import re
+import unittest
+
+from pyvospace.core.exception import InvalidArgument
+from pyvospace.server.database import NodeDatabase
+
+
+class TestGlob(unittest.TestCase):
+
+    def label(self, name):
+        return NodeDatabase.path_to_ltree(name)
+
+    def test_lquery(self):
+        self.assertEqual(NodeDatabase.glob_to_lquery('', 'a/*'), (f'{self.label("a")}.*{{1}}', None))
+        self.assertEqual(NodeDatabase.glob_to_lquery('AB', '**/**/obs_2018*'),
+                         (f'AB.*.{self.label("obs_2018")}*', None))
+        # names are encoded with their dots escaped
+        self.assertEqual(NodeDatabase.glob_to_lquery('', 'a.b'), (self.label('a.b'), None))
+
+    def test_lquery_descendants(self):
+        # a final ** matches what is below the container, not the container itself
+        self.assertEqual(NodeDatabase.glob_to_lquery('AB', '**'), ('AB.*{1,}', None))
+        self.assertEqual(NodeDatabase.glob_to_lquery('AB', '**/**/'), ('AB.*{1,}', None))
+        self.assertEqual(NodeDatabase.glob_to_lquery('', 'a/**/'), (f'{self.label("a")}.*{{1,}}', None))
+
+    def test_name_regex(self):
+        lquery, regex = NodeDatabase.glob_to_lquery('AB', '**/*.fits')
+        self.assertEqual(lquery, 'AB.*.*{1}')
+        self.assertTrue(re.match(regex, 'obs.fits'))
+        self.assertFalse(re.match(regex, 'obs.fits.gz'))
+        self.assertFalse(re.match(regex, 'obsxfits'))
+
+        regex = NodeDatabase.glob_to_regex('obs_[!0-9]?.tar')
+        self.assertTrue(re.match(regex, 'obs_ab.tar'))
+        self.assertFalse(re.match(regex, 'obs_1b.tar'))
+
+    def test_invalid(self):
+        with self.assertRaises(InvalidArgument):
+            NodeDatabase.glob_to_lquery('', '/')
+        with self.assertRaises(InvalidArgument):
+            NodeDatabase.glob_to_lquery('', '../a')
+        with self.assertRaises(InvalidArgument):
+            NodeDatabase.glob_to_lquery('', '*.d/a')
+
+
+class TestDirectoryPaths(unittest.TestCase):
+
+    def test_root(self):
+        a = NodeDatabase.path_to_ltree('/a')
+        for root in ('/', '//', '///'):
+            self.assertEqual(NodeDatabase._directory_paths(root, '/a'), ('/', '', a))
+            self.assertEqual(NodeDatabase._directory_paths(root, '//a'), ('/', '', a))
+        self.assertEqual(NodeDatabase._directory_paths('//a/', '/a/b'),
+                         ('/a', a, NodeDatabase.path_to_ltree('/a/b')))
+
+
+if __name__ == '__main__':
+    unittest.main()
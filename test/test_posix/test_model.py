@@ -0,0 +1,133 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import copy
+import unittest
+import lxml.etree as ET
+
+from pyvospace.core.model import ContainerNode, DataNode, DeleteProperty, Node, Property, Transfer, \
+    PushToSpace, Copy, HTTPPut, Endpoint, Parameter, View, UWSJobRef, UWSJobList, UWSPhase
+
+TITLE = 'ivo://ivoa.net/vospace/core#title'
+
+
+class TestModel(unittest.TestCase):
+
+    def test_add_node_copy(self):
+        root = ContainerNode('/root')
+        node = DataNode('/root/data', properties=[Property(TITLE, 'title')], group_read=['read'])
+        root.add_node(node)
+        node.add_property(Property(TITLE, 'changed'))
+        node.group_read = [*node.group_read, 'write']
+        self.assertEqual(root.nodes[0].properties[TITLE].value, 'title')
+        self.assertEqual(root.nodes[0].group_read, ('read',))
+
+    def test_copy_on_write(self):
+        root = ContainerNode('/root', nodes=[ContainerNode('/root/container')])
+        root_copy = copy.deepcopy(root)
+        self.assertEqual(root, root_copy)
+
+        root_copy.insert_node_into_tree(DataNode('/root/container/data', properties=[Property(TITLE, 'title')]))
+        self.assertEqual(len(root.nodes[0].nodes), 0)
+        self.assertEqual(len(root_copy.nodes[0].nodes), 1)
+
+        copy_copy = copy.deepcopy(root_copy)
+        copy_copy.insert_node_into_tree(DataNode('/root/container/data', properties=[Property(TITLE, 'changed')]),
+                                        overwrite=True)
+        self.assertEqual(root_copy.nodes[0].nodes[0].properties[TITLE].value, 'title')
+        self.assertEqual(copy_copy.nodes[0].nodes[0].properties[TITLE].value, 'changed')
+
+    def test_read_only_views(self):
+        node = DataNode('/root/data', properties=[Property(TITLE, 'title')], group_read=['read'],
+                        accepts=[View('ivo://ivoa.net/vospace/core#anyview')])
+        node_copy = copy.copy(node)
+        # reading a copy does not copy what it shares with the node
+        self.assertIs(node_copy.properties[TITLE], node.properties[TITLE])
+        self.assertEqual(node_copy.group_read, ('read',))
+        with self.assertRaises(TypeError):
+            node_copy.properties[TITLE] = Property(TITLE, 'changed')
+        with self.assertRaises(AttributeError):
+            node_copy.accepts.append(View('ivo://ivoa.net/vospace/core#defaultview'))
+
+        node_copy.add_property(Property(TITLE, 'changed'))
+        self.assertEqual(node.properties[TITLE].value, 'title')
+
+    def test_lazy_id(self):
+        node = DataNode('/root/data')
+        self.assertEqual(node.id, node.id)
+        self.assertEqual(DataNode('/root/data', id='id').id, 'id')
+
+    def test_copy_id(self):
+        node = DataNode('/root/data')
+        self.assertEqual(copy.deepcopy(node).id, node.id)
+        self.assertEqual(copy.copy(node).id, node.id)
+        root = ContainerNode('/root', nodes=[node])
+        self.assertEqual(copy.deepcopy(root).nodes[0].id, root.nodes[0].id)
+
+    def test_tostring(self):
+        # written without lxml, byte identical to the lxml serialisation
+        node = Node('/root/a & b', properties=[Property(TITLE, 'a & <b>\r\n\t\xe9\U0001F600', False),
+                                               DeleteProperty('ivo://ivoa.net/vospace/core#description')])
+        self.assertEqual(node.tostring(), ET.tostring(node.toxml()).decode())
+        transfer = Transfer('/root/a"b', ContainerNode('/root/c'))
+        self.assertEqual(transfer.tostring(), ET.tostring(transfer.toxml()).decode())
+
+        with self.assertRaises(ValueError):
+            Node('/root', properties=[Property(TITLE, '\x00')]).tostring()
+
+        root = ContainerNode('/root', properties=[Property(TITLE, 'a & <b>')],
+                             nodes=[DataNode('/root/data', properties=[Property(TITLE, 'data')]),
+                                    ContainerNode('/root/empty')])
+        self.assertEqual(root.tostring(),
+                         f'<vos:node{Node.XMLNS} xsi:type="vos:ContainerNode" uri="vos://icrar.org!vospace//root">'
+                         '<vos:properties><vos:property uri="ivo://ivoa.net/vospace/core#title" readOnly="true">'
+                         'a &amp; &lt;b&gt;</vos:property></vos:properties><vos:nodes>'
+                         '<vos:node uri="vos://icrar.org!vospace//root/data" xsi:type="vos:DataNode"><vos:properties>'
+                         '<vos:property uri="ivo://ivoa.net/vospace/core#title" readOnly="true">data</vos:property>'
+                         '</vos:properties></vos:node>'
+                         '<vos:node uri="vos://icrar.org!vospace//root/empty" xsi:type="vos:ContainerNode"/>'
+                         '</vos:nodes></vos:node>')
+        head, tail = root.tostring_parts()
+        self.assertEqual(head + ContainerNode.nodes_tostring(root.nodes) + tail, root.tostring())
+        self.assertEqual(Node.fromstring(root.tostring()), root)
+
+    def test_transfer_dict(self):
+        push = PushToSpace(ContainerNode('/root'), protocols=[HTTPPut(Endpoint('http://host/push'))],
+                           view=View('ivo://ivoa.net/vospace/core#tar'),
+                           params=[Parameter('ivo://ivoa.net/vospace/core#length', '10')])
+        for transfer in (push, Copy(Node('/root/a'), ContainerNode('/root/b'))):
+            from_dict = Transfer.fromdict(transfer.todict())
+            self.assertIsInstance(from_dict, type(transfer))
+            self.assertEqual(from_dict.tostring(), Transfer.fromstring(transfer.tostring()).tostring())
+
+
+    def test_job_list(self):
+        jobrefs = [UWSJobRef('1', UWSPhase.Executing, 'a&b', '2018-01-01T00:00:00.500000Z'),
+                   UWSJobRef('2', UWSPhase.Completed)]
+        xml = UWSJobList.tostring(jobrefs)
+        self.assertEqual(UWSJobList.fromstring(xml), jobrefs)
+        root = ET.fromstring(xml)
+        self.assertEqual(root.get('version'), '1.1')
+        self.assertEqual(root[0].get('{http://www.w3.org/1999/xlink}href'), '/vospace/transfers/1')
+        self.assertEqual(UWSJobList.fromstring(UWSJobList.tostring([])), [])
+
+if __name__ == '__main__':
+    unittest.main()
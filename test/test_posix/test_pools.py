@@ -0,0 +1,129 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+import asyncio
+import unittest
+
+from pyvospace.server.pools import MeteredPool
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+        self.resets = 0
+
+    def is_closed(self):
+        return self.closed
+
+    async def reset(self, *, timeout=None):
+        self.resets += 1
+
+
+class FixedPool(object):
+    """
+    Hands out a fixed number of connections, waiting when they are all in use.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.connections = asyncio.Queue()
+        for i in range(size):
+            self.connections.put_nowait(FakeConnection())
+
+    async def acquire(self, *, timeout=None):
+        return await asyncio.wait_for(self.connections.get(), timeout)
+
+    async def release(self, conn, *, timeout=None):
+        self.connections.put_nowait(conn)
+
+    async def close(self):
+        pass
+
+    def get_size(self):
+        return self.size
+
+    def get_max_size(self):
+        return self.size
+
+
+class TestMeteredPool(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_metrics(self):
+        async def run():
+            pool = MeteredPool('interactive', FixedPool(1))
+            async with pool.acquire():
+                self.assertEqual(pool.metrics()['in_use'], 1)
+                # the second acquire waits for the first connection
+                waiter = asyncio.ensure_future(pool.acquire())
+                await asyncio.sleep(0.02)
+                self.assertEqual(pool.metrics()['waiting'], 1)
+
+            conn = await waiter
+            await pool.release(conn)
+
+            with self.assertRaises(asyncio.TimeoutError):
+                async with pool.acquire():
+                    await pool.acquire(timeout=0.01)
+
+            metrics = pool.metrics()
+            self.assertEqual(metrics['in_use'], 0)
+            self.assertEqual(metrics['max_in_use'], 1)
+            self.assertEqual(metrics['acquired'], 3)
+            self.assertEqual(metrics['timeouts'], 1)
+            self.assertEqual(sum(metrics['wait_histogram'].values()), 3)
+            self.assertGreaterEqual(metrics['wait_ms'], 20)
+
+        self.loop.run_until_complete(run())
+
+    def test_keep_connections(self):
+        async def run():
+            fixed = FixedPool(1)
+            pool = MeteredPool('interactive', fixed)
+            async with pool.acquire() as conn:
+                pass
+            # the connection is reset and kept out of the asyncpg pool
+            self.assertEqual(conn.resets, 1)
+            self.assertTrue(fixed.connections.empty())
+
+            async with pool.acquire() as same:
+                self.assertIs(same, conn)
+                conn.closed = True
+            # a closed connection goes back to the asyncpg pool to be replaced
+            self.assertEqual(conn.resets, 1)
+            self.assertEqual(fixed.connections.qsize(), 1)
+
+            async with pool.acquire():
+                pass
+            await pool.close()
+            self.assertEqual(fixed.connections.qsize(), 1)
+            self.assertEqual(pool.metrics()['in_use'], 0)
+
+        self.loop.run_until_complete(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import asyncio
+import unittest
+
+from pyvospace.core.model import UWSPhase
+from pyvospace.server.uws import UWSJobReaper
+
+
+class JobsPool(object):
+    """
+    Pool whose connections delete expired jobs from a list of (job_id, phase) tuples.
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.batches = []
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def fetchval(self, sql, space_id, phases, limit):
+        expired = [job for job in self.jobs if job[1] in phases][:limit]
+        for job in expired:
+            self.jobs.remove(job)
+        self.batches.append(len(expired))
+        return len(expired)
+
+
+class TestUWSJobReaper(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_reap(self):
+        jobs = [(i, UWSPhase.Completed) for i in range(25)]
+        jobs.append((25, UWSPhase.Executing))
+        jobs.append((26, UWSPhase.Error))
+        pool = JobsPool(jobs)
+        reaper = UWSJobReaper(1, pool, batch_size=10)
+
+        self.assertEqual(self.loop.run_until_complete(reaper.reap()), 26)
+        self.assertEqual(pool.batches, [10, 10, 6])
+        self.assertEqual(pool.jobs, [(25, UWSPhase.Executing)])
+
+        self.assertEqual(self.loop.run_until_complete(reaper.reap()), 0)
+        metrics = reaper.metrics()
+        self.assertEqual(metrics['runs'], 2)
+        self.assertEqual(metrics['deleted'], 26)
+        self.assertEqual(metrics['last_deleted'], 0)
+        self.assertEqual(metrics['errors'], 0)
+
+    def test_run(self):
+        async def run():
+            pool = JobsPool([(0, UWSPhase.Aborted)])
+            reaper = UWSJobReaper(1, pool, interval=0.01)
+            reaper.start()
+            await asyncio.sleep(0.1)
+            await reaper.close()
+            self.assertEqual(pool.jobs, [])
+            self.assertGreater(reaper.metrics()['runs'], 1)
+
+        self.loop.run_until_complete(run())
+
+    def test_errors(self):
+        class BrokenPool(JobsPool):
+            async def fetchval(self, *args):
+                raise ConnectionError('down')
+
+        async def run():
+            reaper = UWSJobReaper(1, BrokenPool([]), interval=0.01)
+            reaper.start()
+            await asyncio.sleep(0.05)
+            await reaper.close()
+            metrics = reaper.metrics()
+            self.assertGreater(metrics['errors'], 0)
+            self.assertEqual(metrics['last_error'], 'down')
+
+        self.loop.run_until_complete(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
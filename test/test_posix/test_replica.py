@@ -0,0 +1,86 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+
+import time
+import unittest
+
+from pyvospace.server.replica import ReplicaRouter
+
+
+class TestReplicaRouter(unittest.TestCase):
+
+    def setUp(self):
+        # pools only need to be told apart
+        self.primary = object()
+        self.replicas = [object(), object()]
+        self.router = ReplicaRouter(self.primary, self.replicas, max_lag=60)
+
+    def test_round_robin(self):
+        self.assertIs(self.router.node_pool('A'), self.replicas[0])
+        self.assertIs(self.router.node_pool('A'), self.replicas[1])
+        self.assertIs(self.router.job_pool('1'), self.replicas[0])
+
+    def test_no_replicas(self):
+        router = ReplicaRouter(self.primary, [])
+        self.assertIs(router.node_pool('A'), self.primary)
+        self.assertIs(router.job_pool('1'), self.primary)
+        self.assertIs(router.jobs_pool(), self.primary)
+
+    def test_read_your_writes(self):
+        self.router.written(['A.B'])
+        self.assertIs(self.router.node_pool('A.B'), self.primary)
+        # ancestor listings show the change as well
+        self.assertIs(self.router.node_pool('A'), self.primary)
+        self.assertIs(self.router.node_pool(''), self.primary)
+        self.assertIn(self.router.node_pool('A.C'), self.replicas)
+        self.assertIn(self.router.node_pool(None), self.replicas)
+
+        self.router.written_tree('X')
+        self.assertIs(self.router.node_pool('X.Y.Z'), self.primary)
+        self.assertIn(self.router.node_pool('XY'), self.replicas)
+
+        self.assertIn(self.router.jobs_pool(), self.replicas)
+        self.router.written_job('1')
+        self.assertIs(self.router.job_pool('1'), self.primary)
+        self.assertIn(self.router.job_pool('2'), self.replicas)
+        # a listing may hold any job
+        self.assertIs(self.router.jobs_pool(), self.primary)
+
+    def test_nodes_pool(self):
+        self.router.written(['A.B'])
+        self.assertIn(self.router.nodes_pool(['A.C', 'X']), self.replicas)
+        self.assertIs(self.router.nodes_pool(['X', 'A.B']), self.primary)
+
+    def test_expiry(self):
+        router = ReplicaRouter(self.primary, self.replicas, max_lag=0.01)
+        router.written(['A'])
+        router.written_job('1')
+        time.sleep(0.02)
+        self.assertIn(router.node_pool('A'), self.replicas)
+        self.assertIn(router.job_pool('1'), self.replicas)
+        self.assertIn(router.jobs_pool(), self.replicas)
+        router.written(['B'])
+        self.assertEqual(list(router._paths), ['', 'B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
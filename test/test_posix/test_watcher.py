@@ -0,0 +1,148 @@
+#
+#    ICRAR - International Centre for Radio Astronomy Research
+#    (c) UWA - The University of Western Australia, 2018
+#    Copyright by UWA (in the framework of the ICRAR)
+#    All rights reserved
+#
+#    This library is free software; you can redistribute it and/or
+#    modify it under the terms of the GNU Lesser General Public
+#    License as published by the Free Software Foundation; either
+#    version 2.1 of the License, or (at your option) any later version.
+#
+#    This library is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#    Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU Lesser General Public
+#    License along with this library; if not, write to the Free Software
+#    Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+#    MA 02111-1307  USA
+
+import json
+import asyncio
+import unittest
+
+from pyvospace.core.model import UWSPhase
+from pyvospace.core.exception import PermissionDenied
+from pyvospace.server.uws import UWSJobPool, UWSJobWatcher
+
+
+class JobPhasePool(object):
+    """
+    Pool whose connections read the phase and owner of jobs from a dict, counting the reads.
+    """
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.reads = 0
+
+    def acquire(self):
+        return self
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def fetchrow(self, sql, job_id, space_id):
+        self.reads += 1
+        return self.jobs.get(job_id)
+
+
+class TestUWSJobWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.pool = JobPhasePool({'1': {'phase': UWSPhase.Executing, 'owner': 'test'}})
+        self.watcher = UWSJobWatcher(1)
+        # stands in for the listener connection
+        self.watcher.listener = object()
+        self.jobs = UWSJobPool(1, self.pool, None, watcher=self.watcher)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def notify(self, job_id, phase, action='UPDATE', space_id=1):
+        self.pool.jobs[job_id]['phase'] = phase
+        payload = {'action': action, 'table': 'uws_jobs', 'row': {'id': job_id, 'space_id': space_id, 'phase': phase}}
+        self.watcher._jobs_callback(None, 0, 'uws_jobs', json.dumps(payload))
+
+    def wait(self, *args, **kwargs):
+        return self.loop.create_task(self.jobs.wait_uws_job_phase(*args, **kwargs))
+
+    def test_wait(self):
+        async def run():
+            task = self.wait('1', 'test', wait=10)
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(self.watcher), 1)
+            # other spaces and the phase that was read do not wake the request
+            self.notify('1', UWSPhase.Executing)
+            self.notify('1', UWSPhase.Completed, space_id=2)
+            await asyncio.sleep(0.01)
+            self.assertFalse(task.done())
+
+            self.notify('1', UWSPhase.Completed)
+            self.assertEqual(await task, UWSPhase.Completed)
+            self.assertEqual(self.pool.reads, 1)
+            self.assertEqual(len(self.watcher), 0)
+
+        self.loop.run_until_complete(run())
+
+    def test_no_wait(self):
+        async def run():
+            self.assertEqual(await self.jobs.wait_uws_job_phase('1', 'test'), UWSPhase.Executing)
+            # jobs outside PHASE and finished jobs are returned at once
+            self.assertEqual(await self.wait('1', 'test', wait=10, phase=UWSPhase.Queued), UWSPhase.Executing)
+            self.pool.jobs['1']['phase'] = UWSPhase.Completed
+            self.assertEqual(await self.wait('1', 'test', wait=10), UWSPhase.Completed)
+            with self.assertRaises(PermissionDenied):
+                await self.wait('1', 'other', wait=10)
+            self.assertEqual(len(self.watcher), 0)
+
+        self.loop.run_until_complete(run())
+
+    def test_timeout(self):
+        async def run():
+            self.assertEqual(await self.wait('1', 'test', wait=0.05), UWSPhase.Executing)
+
+        self.loop.run_until_complete(run())
+
+    def test_stale_replica(self):
+        class Router(object):
+            def job_pool(self, job_id):
+                return replica
+
+        async def run():
+            # the primary has moved on, a replica still holds the phase before
+            self.pool.jobs['1']['phase'] = UWSPhase.Completed
+            self.jobs.router = Router()
+            self.assertEqual(await self.wait('1', 'test', wait=10), UWSPhase.Completed)
+            self.assertEqual(replica.reads, 0)
+            self.assertEqual(await self.jobs.wait_uws_job_phase('1', 'test'), UWSPhase.Executing)
+
+        replica = JobPhasePool({'1': {'phase': UWSPhase.Executing, 'owner': 'test'}})
+        self.loop.run_until_complete(run())
+
+    def test_listener_lost(self):
+        async def run():
+            task = self.wait('1', 'test', wait=10)
+            await asyncio.sleep(0.01)
+            self.pool.jobs['1']['phase'] = UWSPhase.Aborted
+            self.watcher._terminated_callback(None)
+            # the job is read again
+            self.assertEqual(await task, UWSPhase.Aborted)
+            self.assertEqual(self.pool.reads, 2)
+            self.assertFalse(self.watcher.enabled)
+            self.pool.jobs['1']['phase'] = UWSPhase.Executing
+            self.assertEqual(await self.wait('1', 'test', wait=10), UWSPhase.Executing)
+
+        self.loop.run_until_complete(run())
+
+
+if __name__ == '__main__':
+    unittest.main()